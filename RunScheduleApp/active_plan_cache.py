@@ -0,0 +1,44 @@
+"""Cache of users' active workout plans.
+
+Calendar views need only id, name, date range and number of recurrence
+rules of the active plan, these are cached per user, so the calendar
+does not look the plan up on every request. An empty tuple is cached
+for users without an active plan. The user's version is bumped
+whenever the active plan may change: when an active plan is switched,
+a plan is saved, shifted or deleted or the number of its rules changes.
+"""
+
+from RunScheduleApp import caching
+
+PLAN_TIMEOUT = 60 * 60 * 24
+NAMESPACE = 'active_plan'
+
+
+def get_plan(user_id, fields, load):
+    """Get active plan of a user from the cache, loading it when missing.
+
+    Names of the fields are a part of the key, so values cached with
+    other fields are never read.
+
+    :param user_id: user id
+    :type user_id: int
+    :param fields: names of cached fields of the plan
+    :type fields: tuple[str]
+    :param load: function returning values of the fields of the active
+        plan or empty tuple if the user has no active plan
+    :type load: collections.Callable
+    :return: values of the fields of the active plan or empty tuple
+    :rtype: tuple
+    """
+    key = caching.make_key(NAMESPACE, user_id, 'plan:' + ','.join(fields))
+    return caching.get_or_set(key, load, PLAN_TIMEOUT)
+
+
+def plan_changed(user_id):
+    """Invalidate cached active plan of a user.
+
+    :param user_id: user id
+    :type user_id: int
+    :return: None
+    """
+    return caching.owner_changed(NAMESPACE, user_id)
@@ -0,0 +1,174 @@
+"""Training load analytics calculated from the training diary.
+
+A user's diary is loaded as columns (dates, distances and times) and
+turned into a daily load matrix with one row per load measure. All
+metrics are then calculated for every day and both measures at once
+with array operations:
+
+* rolling 7 and 28 day volume,
+* acute:chronic workload ratio - average daily load of the last 7 days
+  divided by average daily load of the last 28 days,
+* monotony - average daily load of the last 7 days divided by its
+  standard deviation,
+* strain - volume of the last 7 days multiplied by monotony.
+
+Results are cached under a per-user version number, which is bumped
+whenever a diary entry of the user is saved or deleted (see caching
+module).
+"""
+
+from datetime import timedelta
+
+import numpy as np
+
+from RunScheduleApp import caching
+
+RESULT_TIMEOUT = 60 * 60 * 24
+NAMESPACE = 'training_load'
+MEASURES = ('distance', 'time')
+ACUTE_DAYS = 7
+CHRONIC_DAYS = 28
+
+
+def get_version(user_id):
+    """Get current version of user's training load.
+
+    :param user_id: user id
+    :type user_id: int
+    :return: version number
+    :rtype: int
+    """
+    return caching.get_version(NAMESPACE, user_id)
+
+
+def bump_version(user_id):
+    """Invalidate cached training load of a user.
+
+    :param user_id: user id
+    :type user_id: int
+    :return: None
+    """
+    return caching.bump_version(NAMESPACE, user_id)
+
+
+def diary_changed(user_id):
+    """Record that training diary of a user was changed.
+
+    :param user_id: user id
+    :type user_id: int
+    :return: None
+    """
+    return caching.owner_changed(NAMESPACE, user_id)
+
+
+def rolling_sum(values, window):
+    """Sum values of each day and preceding days in a window.
+
+    Days before the first diary entry count as rest days.
+
+    :param values: daily values, one row per measure
+    :type values: numpy.ndarray
+    :param window: number of days in the window
+    :type window: int
+    :return: rolling sums of the same shape as values
+    :rtype: numpy.ndarray
+    """
+    padded = np.zeros((values.shape[0], values.shape[1] + window))
+    padded[:, window:] = values
+    totals = np.cumsum(padded, axis=1)
+    return totals[:, window:] - totals[:, :-window]
+
+
+def calculate_load(dates, distances, times, today):
+    """Calculate daily training load metrics.
+
+    :param dates: dates of diary entries
+    :type dates: collections.Sequence
+    :param distances: distances of diary entries
+    :type distances: collections.Sequence
+    :param times: times of diary entries
+    :type times: collections.Sequence
+    :param today: today's date, the last day of returned metrics
+    :type today: date
+    :return: first day and metrics of each measure, lists of floats
+        with None where a metric is undefined
+    :rtype: dict
+    """
+    if not len(dates):
+        return {'start': None, 'days': 0,
+                'metrics': {measure: {} for measure in MEASURES}}
+    start = min(dates)
+    end = max(max(dates), today)
+    days = (end - start).days + 1
+    offsets = np.array([(day - start).days for day in dates], dtype=np.intp)
+    entries = np.array([distances, times], dtype=float)
+    load = np.zeros((len(MEASURES), days))
+    # Several entries on one day add up.
+    np.add.at(load, (slice(None), offsets), entries)
+
+    acute = rolling_sum(load, ACUTE_DAYS)
+    chronic = rolling_sum(load, CHRONIC_DAYS)
+    acute_squares = rolling_sum(load ** 2, ACUTE_DAYS)
+    acute_mean = acute / ACUTE_DAYS
+    variance = np.maximum(acute_squares / ACUTE_DAYS - acute_mean ** 2, 0)
+    deviation = np.sqrt(variance)
+    chronic_mean = chronic / CHRONIC_DAYS
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(chronic_mean > 0, acute_mean / chronic_mean, np.nan)
+        # Identical loads every day (including no training at all) have
+        # no meaningful monotony.
+        monotony = np.where(deviation > 1e-9, acute_mean / deviation, np.nan)
+    strain = acute * monotony
+
+    metrics = {}
+    for row, measure in enumerate(MEASURES):
+        metrics[measure] = {
+            'load': _to_list(load[row]),
+            'volume_7': _to_list(acute[row]),
+            'volume_28': _to_list(chronic[row]),
+            'acwr': _to_list(ratio[row]),
+            'monotony': _to_list(monotony[row]),
+            'strain': _to_list(strain[row]),
+        }
+    return {'start': start, 'days': days, 'metrics': metrics}
+
+
+def get_training_load(user, today):
+    """Get training load metrics of a user, from the cache if possible.
+
+    :param user: user whose diary is analysed
+    :type user: User
+    :param today: today's date
+    :type today: date
+    :return: training load metrics (see calculate_load)
+    :rtype: dict
+    """
+    def calculate():
+        rows = user.trainingdiary_set.filter(date__lte=today).values_list(
+            'date', 'training_distance', 'training_time')
+        columns = tuple(zip(*rows)) or ((), (), ())
+        return calculate_load(*columns, today=today)
+
+    key = caching.make_key(NAMESPACE, user.pk, today.isoformat())
+    return caching.get_or_set(key, calculate, RESULT_TIMEOUT)
+
+
+def get_dates(result):
+    """Get dates of days described by training load metrics.
+
+    :param result: training load metrics
+    :type result: dict
+    :return: dates in ISO format
+    :rtype: list
+    """
+    if result['start'] is None:
+        return []
+    return [(result['start'] + timedelta(days=day)).isoformat()
+            for day in range(result['days'])]
+
+
+def _to_list(values):
+    """Convert an array to a list of rounded floats and None for NaN."""
+    rounded = np.round(values, 2)
+    return [None if np.isnan(value) else value
+            for value in rounded.tolist()]
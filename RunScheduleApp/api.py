@@ -0,0 +1,410 @@
+"""JSON API of workout plans, trainings and the training diary.
+
+Every list endpoint returns one page of the logged user's objects:
+
+    {"results": [...], "next": "<cursor>" or null}
+
+Query parameters:
+
+* ``cursor`` - cursor of the next page returned with the previous one,
+* ``limit`` - number of objects on a page (1 - 200, default 50),
+* ``fields`` - comma separated names of returned fields, all fields
+  when omitted.
+
+Pages are selected with keyset filters on the ordering of a list
+instead of offsets, the ordering values are compared as a row value, so
+every page is an index range scan, no matter how far it is. Responses
+carry an ETag built from the version of the whole collection, which is
+read without loading the page, so unchanged collections cost 304.
+
+Trainings of a plan are created, updated and deleted in batches posted
+to the batch endpoint (see batch module). Changes of all user's objects
+are downloaded from the sync endpoint (see sync module).
+
+Recurrence rules of a plan are listed by their own endpoint. Days of
+rules are not trainings: they are not listed with trainings, counted in
+plan totals or synchronized, clients expand rules of plans whose
+rule_count is not zero.
+"""
+
+import base64
+import hashlib
+import json
+from decimal import Decimal
+
+from django.contrib.auth.mixins import PermissionRequiredMixin
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Max
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views import View
+from psycopg2.extras import DateRange
+
+from RunScheduleApp import batch, sync
+from RunScheduleApp.models import RecurrenceRule, Training, TrainingDiary
+from RunScheduleApp.models import WorkoutPlan
+from RunScheduleApp.models import keyset_filter
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+PLAN_FIELDS = ('id', 'name', 'description', 'date_range', 'is_active',
+               'total_distance', 'total_time', 'training_count',
+               'accomplished_count', 'rule_count', 'updated_at')
+TRAINING_FIELDS = ('id', 'day', 'training_main', 'distance_main',
+                   'time_main', 'training_additional', 'distance_additional',
+                   'time_additional', 'accomplished')
+RULE_FIELDS = ('id', 'weekdays', 'interval', 'start_date', 'end_date',
+               'training_main', 'distance_main', 'time_main',
+               'training_additional', 'distance_additional',
+               'time_additional')
+DIARY_FIELDS = ('id', 'date', 'training_info', 'training_distance',
+                'training_time', 'comments', 'training_id')
+SYNC_FIELDS = {
+    'plans': PLAN_FIELDS,
+    'trainings': TRAINING_FIELDS + ('workout_plan_id', 'updated_at'),
+    'diary': DIARY_FIELDS + ('updated_at',),
+}
+
+
+class ApiError(Exception):
+    """Raised when query parameters of a request are invalid."""
+
+
+def encode_cursor(values):
+    """Create a page cursor from ordering values of the last object.
+
+    :param values: values of ordering fields
+    :type values: collections.Sequence
+    :return: cursor
+    :rtype: str
+    """
+    data = json.dumps(list(values), cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, ordering):
+    """Read ordering values of the last object from a page cursor.
+
+    :param cursor: cursor from the request
+    :type cursor: str
+    :param model: model of listed objects
+    :type model: type
+    :param ordering: names of ordering fields
+    :type ordering: tuple
+    :raises ApiError: if the cursor is invalid
+    :return: values of ordering fields
+    :rtype: list
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data.decode())
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise ValueError
+        return [model._meta.get_field(field).to_python(value)
+                for field, value in zip(ordering, values)]
+    except (ValueError, TypeError, ValidationError):
+        raise ApiError('Invalid cursor')
+
+
+def to_json(value):
+    """Convert a field value to a value serializable to JSON."""
+    if isinstance(value, DateRange):
+        return {'lower': to_json(value.lower), 'upper': to_json(value.upper),
+                'bounds': value._bounds}
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+class ApiListView(PermissionRequiredMixin, View):
+    """Base class of JSON list endpoints.
+
+    Subclasses set the listed model, the field pointing to the owner of
+    listed objects, selectable fields and a unique ordering.
+    """
+
+    raise_exception = True
+    model = None
+    owner_field = 'owner'
+    fields = ()
+    ordering = ('id',)
+
+    def get(self, request, **kwargs):
+        """Return one page of objects.
+
+        :param request: request object
+        :return: page of objects, 304 response or 400 response with
+            error message
+        :rtype: JsonResponse or HttpResponseNotModified
+        """
+        try:
+            fields = self.get_fields(request.GET.get('fields'))
+            limit = self.get_limit(request.GET.get('limit'))
+            cursor = request.GET.get('cursor')
+            if cursor:
+                cursor = decode_cursor(cursor, self.model, self.ordering)
+        except ApiError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        queryset = self.get_queryset(request, **kwargs)
+        query = request.GET.urlencode()
+        etag = quote_etag(hashlib.md5(
+            f'{self.get_version(queryset)}?{query}'.encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = JsonResponse(
+                self.get_page(queryset, fields, limit, cursor),
+                encoder=DjangoJSONEncoder)
+        response['ETag'] = etag
+        return response
+
+    def get_queryset(self, request, **kwargs):
+        """Get objects of the logged user listed by the endpoint.
+
+        :param request: request object
+        :return: listed objects
+        :rtype: QuerySet
+        """
+        return self.model.objects.filter(**{self.owner_field: request.user})
+
+    def get_version(self, queryset):
+        """Get a value which changes whenever the listed collection does.
+
+        The version is read from the database with one aggregate query,
+        deletions change the number of objects.
+
+        :param queryset: listed objects
+        :type queryset: QuerySet
+        :return: version of the collection
+        :rtype: str
+        """
+        objects = queryset.aggregate(updated_at=Max('updated_at'),
+                                     count=Count('id'))
+        updated_at = objects['updated_at']
+        return f'{objects["count"]}-{updated_at and updated_at.timestamp()}'
+
+    def get_fields(self, fields):
+        """Get names of returned fields.
+
+        :param fields: value of fields parameter
+        :type fields: str or None
+        :raises ApiError: if some of the fields cannot be selected
+        :return: names of fields
+        :rtype: list
+        """
+        if not fields:
+            return list(self.fields)
+        selected = [field.strip() for field in fields.split(',')
+                    if field.strip()]
+        unknown = [field for field in selected if field not in self.fields]
+        if unknown:
+            raise ApiError(f'Unknown fields: {", ".join(unknown)}')
+        return selected
+
+    @staticmethod
+    def get_limit(limit):
+        """Get number of objects on a page.
+
+        :param limit: value of limit parameter
+        :type limit: str or None
+        :raises ApiError: if the limit is not a number in allowed range
+        :return: number of objects
+        :rtype: int
+        """
+        if not limit:
+            return DEFAULT_LIMIT
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ApiError('Limit must be a number')
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ApiError(f'Limit must be between 1 and {MAX_LIMIT}')
+        return limit
+
+    def get_page(self, queryset, fields, limit, cursor):
+        """Load one page of objects with a single query.
+
+        :param queryset: listed objects
+        :type queryset: QuerySet
+        :param fields: names of returned fields
+        :type fields: list
+        :param limit: number of objects on a page
+        :type limit: int
+        :param cursor: ordering values of the last object on the
+            previous page or None for the first page
+        :type cursor: list or None
+        :return: objects of the page and cursor of the next page
+        :rtype: dict
+        """
+        if cursor:
+            queryset = keyset_filter(queryset, self.ordering, cursor)
+        rows = list(queryset.order_by(*self.ordering).values(
+            *set(fields).union(self.ordering))[:limit + 1])
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(
+                [rows[-1][field] for field in self.ordering])
+        return {'results': [{field: to_json(row[field]) for field in fields}
+                            for row in rows],
+                'next': next_cursor}
+
+
+class WorkoutPlanListApiView(ApiListView):
+    """List workout plans of the logged user."""
+
+    permission_required = 'RunScheduleApp.view_workoutplan'
+    model = WorkoutPlan
+    fields = PLAN_FIELDS
+
+
+class TrainingListApiView(ApiListView):
+    """List trainings of a workout plan of the logged user."""
+
+    permission_required = 'RunScheduleApp.view_training'
+    model = Training
+    fields = TRAINING_FIELDS
+    ordering = ('day',)
+
+    def get_queryset(self, request, plan_id):
+        # Plans of other users are not found, the plan is kept for the
+        # version.
+        self.workout_plan = get_object_or_404(
+            WorkoutPlan.objects.only('id', 'updated_at'),
+            pk=plan_id, owner=request.user)
+        return self.workout_plan.training_set.all()
+
+    def get_version(self, queryset):
+        # Every change of plan's trainings updates the plan.
+        updated_at = self.workout_plan.updated_at
+        return f'{self.workout_plan.id}-{updated_at.timestamp()}'
+
+
+class RecurrenceRuleListApiView(TrainingListApiView):
+    """List recurrence rules of a workout plan of the logged user."""
+
+    model = RecurrenceRule
+    fields = RULE_FIELDS
+    ordering = ('id',)
+
+    def get_queryset(self, request, plan_id):
+        super().get_queryset(request, plan_id)
+        return self.workout_plan.recurrencerule_set.all()
+
+
+class TrainingDiaryListApiView(ApiListView):
+    """List entries of the logged user's training diary."""
+
+    permission_required = 'RunScheduleApp.view_trainingdiary'
+    model = TrainingDiary
+    owner_field = 'user'
+    fields = DIARY_FIELDS
+    ordering = ('date', 'id')
+
+
+class WorkoutPlanApiView(PermissionRequiredMixin, View):
+    """Return a single workout plan of the logged user."""
+
+    raise_exception = True
+    permission_required = 'RunScheduleApp.view_workoutplan'
+
+    def get(self, request, plan_id):
+        """Return fields of a workout plan.
+
+        :param request: request object
+        :param plan_id: workout plan id
+        :type plan_id: int
+        :return: workout plan or 304 response
+        :rtype: JsonResponse or HttpResponseNotModified
+        """
+        workout_plan = get_object_or_404(
+            WorkoutPlan.objects.values(*PLAN_FIELDS),
+            pk=plan_id, owner=request.user)
+        etag = quote_etag(
+            f'{plan_id}-{workout_plan["updated_at"].timestamp()}')
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = JsonResponse(
+                {field: to_json(value)
+                 for field, value in workout_plan.items()},
+                encoder=DjangoJSONEncoder)
+        response['ETag'] = etag
+        return response
+
+
+class TrainingBatchApiView(PermissionRequiredMixin, View):
+    """Apply a batch of operations on trainings of a workout plan."""
+
+    raise_exception = True
+    permission_required = ('RunScheduleApp.add_training',
+                           'RunScheduleApp.change_training',
+                           'RunScheduleApp.delete_training')
+
+    def post(self, request, plan_id):
+        """Validate and apply operations from the request body.
+
+        The body is a JSON object with operations list. Either all
+        operations are applied or none of them.
+
+        :param request: request object
+        :param plan_id: workout plan id
+        :type plan_id: int
+        :return: results of operations, 400 response with results and
+            errors of invalid operations or 409 response if trainings
+            were changed by another request
+        :rtype: JsonResponse
+        """
+        workout_plan = get_object_or_404(WorkoutPlan, pk=plan_id,
+                                         owner=request.user)
+        try:
+            operations = json.loads(request.body.decode()).get('operations')
+        except (ValueError, AttributeError):
+            return JsonResponse({'error': 'Body must be a JSON object'},
+                                status=400)
+        with transaction.atomic():
+            try:
+                changes, errors = batch.validate_operations(workout_plan,
+                                                            operations)
+            except batch.BatchError as error:
+                return JsonResponse({'error': str(error)}, status=400)
+            if errors:
+                return JsonResponse({'results': batch.get_results(
+                    operations, changes, errors)}, status=400)
+            try:
+                batch.apply_operations(workout_plan, changes)
+            except batch.BatchError as error:
+                return JsonResponse({'error': str(error)}, status=409)
+        return JsonResponse(
+            {'results': batch.get_results(operations, changes, errors)})
+
+
+class SyncApiView(PermissionRequiredMixin, View):
+    """Return changes of the logged user's objects since the last sync."""
+
+    raise_exception = True
+    permission_required = ('RunScheduleApp.view_workoutplan',
+                           'RunScheduleApp.view_training',
+                           'RunScheduleApp.view_trainingdiary')
+
+    def get(self, request):
+        """Return objects changed and deleted after the since token.
+
+        :param request: request object
+        :return: changes with the token of the next sync or 400
+            response with error message
+        :rtype: JsonResponse
+        """
+        since = request.GET.get('since')
+        try:
+            since = sync.read_token(since) if since else None
+        except sync.SyncError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        changes = sync.get_changes(request.user, since, SYNC_FIELDS)
+        for name in SYNC_FIELDS:
+            changes[name] = [{field: to_json(value)
+                              for field, value in row.items()}
+                             for row in changes[name]]
+        return JsonResponse(changes, encoder=DjangoJSONEncoder)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class RunscheduleappConfig(AppConfig):
     name = 'RunScheduleApp'
+
+    def ready(self):
+        import RunScheduleApp.signals  # noqa: F401
@@ -0,0 +1,191 @@
+"""Batches of create, update and delete operations on trainings.
+
+A batch is a list of operations on trainings of one workout plan:
+
+    [{"op": "create", "data": {"day": "2019-03-04", ...}},
+     {"op": "update", "id": 12, "data": {"time_main": 50}},
+     {"op": "delete", "id": 13}]
+
+Data uses TrainingForm field names, updates change only the given
+fields. All operations are validated before any of them is applied,
+including one training per day rule checked against the plan after the
+whole batch. Changed trainings are locked from validation until the
+batch is applied, so concurrent changes are not overwritten. Valid
+batches are applied in one transaction with a single DELETE, a single
+bulk update and a single bulk insert. Deleted trainings are recorded as
+tombstones for synchronizing clients.
+"""
+
+from django.db import IntegrityError, transaction
+from django.forms.models import model_to_dict
+from django.utils import timezone
+
+from RunScheduleApp.forms import TrainingForm
+from RunScheduleApp.imports import DAY_TAKEN_ERROR
+from RunScheduleApp.models import Training, WorkoutPlan
+
+OPERATIONS = ('create', 'update', 'delete')
+MAX_OPERATIONS = 500
+FORM_FIELDS = tuple(TrainingForm.base_fields)
+
+
+class BatchError(Exception):
+    """Raised when a batch cannot be read or applied."""
+
+
+def is_id(value):
+    """Check if a value from a batch is a valid object id.
+
+    :param value: value of id field of an operation
+    :return: True if the value is an integer
+    :rtype: bool
+    """
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def validate_operations(workout_plan, operations):
+    """Validate operations of a batch.
+
+    Must be called in the transaction applying the batch, updated and
+    deleted trainings stay locked until it ends.
+
+    :param workout_plan: workout plan whose trainings are changed
+    :type workout_plan: WorkoutPlan
+    :param operations: operations of the batch
+    :type operations: list
+    :raises BatchError: if the batch is not a list of operations
+    :return: trainings to be created, updated and deleted, listed as
+        (index of operation, training) pairs, and errors of invalid
+        operations as a dictionary of field errors by operation index
+    :rtype: tuple[dict, dict]
+    """
+    if not isinstance(operations, list):
+        raise BatchError('Operations must be a list')
+    if len(operations) > MAX_OPERATIONS:
+        raise BatchError(f'Batch cannot have more than {MAX_OPERATIONS}'
+                         f' operations')
+    if not all(isinstance(operation, dict) for operation in operations):
+        raise BatchError('Every operation must be an object')
+    ids = [operation.get('id') for operation in operations
+           if operation.get('op') != 'create']
+    # Trainings are locked, so they cannot change before the batch is
+    # applied.
+    trainings = workout_plan.training_set.select_for_update().in_bulk(
+        [training_id for training_id in ids if is_id(training_id)])
+    days = dict(workout_plan.training_set.values_list('day', 'id'))
+
+    changes = {op: [] for op in OPERATIONS}
+    errors = {}
+    changed_ids = set()
+    for index, operation in enumerate(operations):
+        op = operation.get('op')
+        if op not in OPERATIONS:
+            errors[index] = {'op': [f'Operation must be one of:'
+                                    f' {", ".join(OPERATIONS)}']}
+            continue
+        training = None
+        if op != 'create':
+            if not is_id(operation.get('id')):
+                errors[index] = {'id': ['Id must be a number']}
+                continue
+            training = trainings.get(operation.get('id'))
+            if training is None:
+                errors[index] = {'id': ['No training with this id in the'
+                                        ' workout plan']}
+                continue
+            if training.id in changed_ids:
+                errors[index] = {'id': ['Training is already changed by'
+                                        ' another operation']}
+                continue
+            changed_ids.add(training.id)
+            del days[training.day]
+        if op == 'delete':
+            changes[op].append((index, training))
+            continue
+        data = operation.get('data')
+        if not isinstance(data, dict):
+            errors[index] = {'data': ['Data must be an object']}
+            continue
+        if training is not None:
+            data = dict(model_to_dict(training, FORM_FIELDS), **data)
+        form = TrainingForm(data, instance=training, workout_plan=workout_plan)
+        if form.is_valid():
+            changes[op].append((index, form.save(commit=False)))
+        else:
+            errors[index] = dict(form.errors)
+
+    # Days are checked after removing days of all updated and deleted
+    # trainings, so trainings may swap days within one batch.
+    for index, training in changes['update'] + changes['create']:
+        if training.day in days:
+            errors[index] = {'day': [DAY_TAKEN_ERROR]}
+        days[training.day] = training.id
+    return changes, errors
+
+
+def apply_operations(workout_plan, changes):
+    """Apply validated operations of a batch in one transaction.
+
+    :param workout_plan: workout plan whose trainings are changed
+    :type workout_plan: WorkoutPlan
+    :param changes: trainings to be created, updated and deleted, as
+        returned by validate_operations
+    :type changes: dict
+    :raises BatchError: if trainings of the plan were changed by
+        another request in the meantime
+    :return: None
+    """
+    deleted = [training for index, training in changes['delete']]
+    updated = [training for index, training in changes['update']]
+    created = [training for index, training in changes['create']]
+    totals = [0, 0, 0, 0]
+    for training in deleted + updated:
+        totals = [total - value for total, value
+                  in zip(totals, training._saved_totals[1:])]
+    for training in updated + created:
+        totals = [total + value for total, value
+                  in zip(totals, training.get_totals()[1:])]
+    try:
+        with transaction.atomic(), Training.day_constraint_deferred():
+            workout_plan.delete_trainings(
+                training.id for training in deleted)
+            if updated:
+                now = timezone.now()
+                for training in updated:
+                    training.updated_at = now
+                Training.objects.bulk_update(
+                    updated, FORM_FIELDS + ('updated_at',))
+            if created:
+                Training.objects.bulk_create(created)
+            WorkoutPlan.mark_trainings_changed(workout_plan.id, totals)
+    except IntegrityError as error:
+        if not Training.is_day_taken_error(error):
+            raise
+        raise BatchError('Trainings were changed during the batch, please'
+                         ' try again')
+    for training in updated + created:
+        training._saved_totals = training.get_totals()
+    return None
+
+
+def get_results(operations, changes, errors):
+    """Describe the outcome of every operation of a batch.
+
+    :param operations: operations of the batch
+    :type operations: list
+    :param changes: trainings of valid operations
+    :type changes: dict
+    :param errors: errors of invalid operations
+    :type errors: dict
+    :return: results in the order of operations
+    :rtype: list
+    """
+    results = [{'op': operation.get('op')} for operation in operations]
+    for op, status in (('create', 'created'), ('update', 'updated'),
+                       ('delete', 'deleted')):
+        for index, training in changes[op]:
+            results[index].update(id=training.id,
+                                  status='valid' if errors else status)
+    for index, field_errors in errors.items():
+        results[index].update(status='error', errors=field_errors)
+    return results
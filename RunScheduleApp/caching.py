@@ -0,0 +1,130 @@
+"""Cache-aside helpers for values derived from models.
+
+Values are stored under keys containing a version number of their
+owner, a user or a workout plan:
+
+    {namespace}:{owner_id}:{version}:{name}
+
+Bumping the version invalidates all values of the owner at once, old
+values are never read again and simply expire. Versions start from
+a timestamp, so a version key evicted from the cache never comes back
+with a number used by older values.
+
+A value missing from the cache is computed by one worker at a time: the
+first worker takes a lock with an atomic add, the others wait for its
+result (at most LOCK_WAIT seconds) instead of computing the same value
+at once.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = '{namespace}:version:{owner_id}'
+VALUE_KEY = '{namespace}:{owner_id}:{version}:{name}'
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+POLL_INTERVAL = 0.05
+
+
+def get_version(namespace, owner_id):
+    """Get current version of owner's values.
+
+    :param namespace: kind of cached values
+    :type namespace: str
+    :param owner_id: id of the owner of values
+    :type owner_id: int
+    :return: version number
+    :rtype: int
+    """
+    key = VERSION_KEY.format(namespace=namespace, owner_id=owner_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace, owner_id):
+    """Invalidate all cached values of an owner.
+
+    :param namespace: kind of cached values
+    :type namespace: str
+    :param owner_id: id of the owner of values
+    :type owner_id: int
+    :return: None
+    """
+    try:
+        cache.incr(VERSION_KEY.format(namespace=namespace, owner_id=owner_id))
+    except ValueError:
+        get_version(namespace, owner_id)
+    return None
+
+
+def owner_changed(namespace, owner_id):
+    """Invalidate cached values of an owner changed in a transaction.
+
+    :param namespace: kind of cached values
+    :type namespace: str
+    :param owner_id: id of the owner of values
+    :type owner_id: int
+    :return: None
+    """
+    bump_version(namespace, owner_id)
+    # Values computed by other requests before the commit would be
+    # cached under the new version.
+    transaction.on_commit(lambda: bump_version(namespace, owner_id))
+    return None
+
+
+def make_key(namespace, owner_id, name):
+    """Create cache key of a value in the current version of its owner.
+
+    :param namespace: kind of cached values
+    :type namespace: str
+    :param owner_id: id of the owner of the value
+    :type owner_id: int
+    :param name: name of the value, unique for the owner
+    :type name: str
+    :return: cache key
+    :rtype: str
+    """
+    return VALUE_KEY.format(namespace=namespace, owner_id=owner_id,
+                            version=get_version(namespace, owner_id),
+                            name=name)
+
+
+def get_or_set(key, compute, timeout):
+    """Get a value from the cache, computing it when it is missing.
+
+    Only one worker computes a missing value, the others wait for it.
+    If it does not come in LOCK_WAIT seconds, they compute it
+    themselves. None cannot be cached.
+
+    :param key: cache key of the value
+    :type key: str
+    :param compute: function computing the value
+    :type compute: collections.Callable
+    :param timeout: number of seconds the value is kept
+    :type timeout: int
+    :return: value
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            value = cache.get(key)
+            if value is not None:
+                return value
+        return compute()
+    try:
+        value = compute()
+        cache.set(key, value, timeout)
+    finally:
+        cache.delete(lock_key)
+    return value
@@ -0,0 +1,132 @@
+"""Cache of rendered monthly workout calendars.
+
+Rendered months are stored under a key built from the workout plan id,
+a per-plan version number, the year and the month. Saving or deleting
+a plan or one of its trainings bumps the version (see signals module),
+so stale fragments are never read again and simply expire. Keys and
+versions are managed by the caching module.
+"""
+
+from django.core.cache import cache
+
+from RunScheduleApp import caching
+
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+NAMESPACE = 'workout_calendar'
+HITS_KEY = 'workout_calendar:hits'
+MISSES_KEY = 'workout_calendar:misses'
+
+
+def get_version(plan_id):
+    """Get current calendar version of a workout plan.
+
+    :param plan_id: workout plan id
+    :type plan_id: int
+    :return: version number
+    :rtype: int
+    """
+    return caching.get_version(NAMESPACE, plan_id)
+
+
+def bump_version(plan_id):
+    """Invalidate all cached months of a workout plan.
+
+    :param plan_id: workout plan id
+    :type plan_id: int
+    :return: None
+    """
+    return caching.bump_version(NAMESPACE, plan_id)
+
+
+def plan_changed(plan_id):
+    """Invalidate cached months of a workout plan changed in
+    a transaction.
+
+    :param plan_id: workout plan id
+    :type plan_id: int
+    :return: None
+    """
+    return caching.owner_changed(NAMESPACE, plan_id)
+
+
+def make_key(plan_id, month, year, today):
+    """Create cache key of a rendered month.
+
+    Today's date is a part of the key only for the current month, so
+    the highlighted cell moves with the date.
+
+    :param plan_id: workout plan id
+    :type plan_id: int
+    :param month: month number
+    :type month: int
+    :param year: year number
+    :type year: int
+    :param today: today's date
+    :type today: date
+    :return: cache key
+    :rtype: str
+    """
+    if (today.year, today.month) == (year, month):
+        today_part = today.day
+    else:
+        today_part = '-'
+    return caching.make_key(NAMESPACE, plan_id, f'{year}:{month}:{today_part}')
+
+
+def get_month(plan_id, month, year, today, render):
+    """Get rendered month from the cache, rendering it when missing.
+
+    :param plan_id: workout plan id
+    :type plan_id: int
+    :param month: month number
+    :type month: int
+    :param year: year number
+    :type year: int
+    :param today: today's date
+    :type today: date
+    :param render: function returning HTML code of the month
+    :type render: collections.Callable
+    :return: HTML code of the month
+    :rtype: str
+    """
+    rendered = []
+
+    def render_month():
+        rendered.append(True)
+        return render()
+
+    html = caching.get_or_set(make_key(plan_id, month, year, today),
+                              render_month, FRAGMENT_TIMEOUT)
+    _count(MISSES_KEY if rendered else HITS_KEY)
+    return html
+
+
+def get_stats():
+    """Get cache hit and miss counters.
+
+    :return: number of hits, misses and hit ratio
+    :rtype: dict
+    """
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    lookups = hits + misses
+    return {'hits': hits, 'misses': misses,
+            'hit_ratio': hits / lookups if lookups else None}
+
+
+def reset_stats():
+    """Reset cache hit and miss counters.
+
+    :return: None
+    """
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+    return None
+
+
+def _count(key):
+    """Increment a counter kept in the cache."""
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
@@ -0,0 +1,189 @@
+"""Export of the training diary to CSV and XLSX files.
+
+Entries are read with a server-side cursor in chunks and written one
+row at a time, so the size of a user's diary does not change memory use.
+XLSX files are built with the standard library: the worksheet is
+written into a zip archive which is sent while it is being created.
+"""
+
+import csv
+import zipfile
+from datetime import date
+from xml.sax.saxutils import escape
+
+CHUNK_SIZE = 2000
+COLUMNS = (('date', 'Date'), ('training_info', 'Training'),
+           ('training_distance', 'Distance [km]'),
+           ('training_time', 'Time [min]'), ('comments', 'Comments'))
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.'
+            'spreadsheetml.sheet',
+}
+# Day 0 of Excel dates, including the nonexistent 29 February 1900.
+EXCEL_EPOCH = date(1899, 12, 30)
+
+
+class StreamBuffer:
+    """File-like object keeping written data until it is taken."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        """Get written data and clear the buffer.
+
+        :return: data written since the last call
+        :rtype: bytes
+        """
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+class Echo:
+    """File-like object returning written data instead of keeping it."""
+
+    def write(self, value):
+        return value
+
+
+def get_rows(diary_entries):
+    """Read values of diary entries in chunks.
+
+    :param diary_entries: diary entries to export
+    :type diary_entries: QuerySet
+    :return: generator of tuples with values of exported columns
+    :rtype: generator
+    """
+    fields = [field for field, label in COLUMNS]
+    return diary_entries.values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+
+
+def export_csv(diary_entries):
+    """Generate a CSV file with diary entries.
+
+    :param diary_entries: diary entries to export
+    :type diary_entries: QuerySet
+    :return: generator of CSV lines
+    :rtype: generator
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow([label for field, label in COLUMNS])
+    for row in get_rows(diary_entries):
+        yield writer.writerow(row)
+
+
+def export_xlsx(diary_entries):
+    """Generate an XLSX file with diary entries.
+
+    :param diary_entries: diary entries to export
+    :type diary_entries: QuerySet
+    :return: generator of parts of the file
+    :rtype: generator
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open('xl/worksheets/sheet1.xml', 'w',
+                          force_zip64=True) as sheet:
+            sheet.write(SHEET_START.encode())
+            sheet.write(xlsx_row([label for field, label in COLUMNS]))
+            for number, row in enumerate(get_rows(diary_entries), 1):
+                sheet.write(xlsx_row(row))
+                if number % CHUNK_SIZE == 0:
+                    yield buffer.take()
+            sheet.write(SHEET_END.encode())
+    yield buffer.take()
+
+
+def xlsx_row(values):
+    """Create XML of a worksheet row.
+
+    :param values: cell values
+    :type values: collections.Iterable
+    :return: XML of the row
+    :rtype: bytes
+    """
+    cells = []
+    for value in values:
+        if value is None:
+            cells.append('<c/>')
+        elif isinstance(value, date):
+            cells.append(f'<c s="1"><v>{(value - EXCEL_EPOCH).days}</v></c>')
+        elif isinstance(value, str):
+            cells.append(f'<c t="inlineStr"><is><t>{escape(value)}</t></is>'
+                         f'</c>')
+        else:
+            cells.append(f'<c><v>{value}</v></c>')
+    return f'<row>{"".join(cells)}</row>'.encode()
+
+
+SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/'
+    '2006/main"><sheetData>')
+SHEET_END = '</sheetData></worksheet>'
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/'
+        'content-types">'
+        '<Default Extension="rels" ContentType="application/'
+        'vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType='
+        '"application/vnd.openxmlformats-officedocument.spreadsheetml.'
+        'worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/'
+        '2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/'
+        '2006/main" xmlns:r="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships">'
+        '<sheets><sheet name="Training diary" sheetId="1" r:id="rId1"/>'
+        '</sheets></workbook>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/'
+        '2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'),
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/'
+        'spreadsheetml/2006/main">'
+        '<fonts count="1"><font/></fonts>'
+        '<fills count="1"><fill/></fills>'
+        '<borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf/></cellStyleXfs>'
+        '<cellXfs count="2"><xf/>'
+        '<xf numFmtId="14" applyNumberFormat="1"/></cellXfs>'
+        '</styleSheet>'),
+}
+
+EXPORTERS = {'csv': export_csv, 'xlsx': export_xlsx}
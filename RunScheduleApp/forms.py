@@ -6,8 +6,11 @@ from django.contrib.postgres.forms import RangeWidget
 from django import forms
 from django.forms import ModelForm, DateInput
 from django.core.exceptions import ValidationError
+from django.core.validators import FileExtensionValidator
+from django.db import IntegrityError, transaction
 
-from RunScheduleApp.models import WorkoutPlan, Training, TrainingDiary
+from RunScheduleApp.models import RecurrenceRule, WorkoutPlan, Training
+from RunScheduleApp.models import TrainingDiary
 
 
 class DatePicker(DateInput):
@@ -32,11 +35,83 @@ class WorkoutPlanEditForm(ModelForm):
         }
 
 
-class TrainingForm(ModelForm):
-    plan_id = forms.IntegerField(widget=forms.HiddenInput)
-    initial_training_date = forms.DateField(widget=forms.HiddenInput,
-                                            required=False)
+class WorkoutPlanCloneForm(forms.Form):
+    name = forms.CharField(max_length=64, label='Name of the new plan')
+    start_date = forms.DateField(label='Start date of the new plan',
+                                 widget=DatePicker())
+
+
+class WorkoutPlanShiftForm(forms.Form):
+    days = forms.IntegerField(label='Number of days',
+                              help_text='Negative to move trainings back')
+    from_date = forms.DateField(label='Move trainings from', required=False,
+                                help_text='Leave empty to move all trainings',
+                                widget=DatePicker())
+    delete_from = forms.DateField(label='Delete trainings from',
+                                  required=False, widget=DatePicker())
+    delete_to = forms.DateField(label='Delete trainings to', required=False,
+                                widget=DatePicker())
+
+    def __init__(self, *args, workout_plan, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.workout_plan = workout_plan
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('days') == 0:
+            self.add_error('days', 'Number of days cannot be 0')
+
+        delete_from = cleaned_data.get('delete_from')
+        delete_to = cleaned_data.get('delete_to')
+        if (delete_from is None) != (delete_to is None):
+            self.add_error(None, 'Give both dates of deleted trainings'
+                                 ' or none of them')
+        elif delete_from is not None and delete_from > delete_to:
+            self.add_error('delete_to', 'The last day cannot be earlier'
+                                        ' than the first day')
+        return cleaned_data
+
+    def save(self):
+        """Move trainings of the workout plan, one training per day is
+        checked by the database.
+
+        :return: number of moved trainings or None if a training would
+            be moved to a day already taken
+        :rtype: int or None
+        """
+        delete_range = None
+        if self.cleaned_data['delete_from'] is not None:
+            delete_range = (self.cleaned_data['delete_from'],
+                            self.cleaned_data['delete_to'])
+        try:
+            return self.workout_plan.shift(self.cleaned_data['days'],
+                                           self.cleaned_data['from_date'],
+                                           delete_range)
+        except IntegrityError as error:
+            if not Training.is_day_taken_error(error):
+                raise
+            self.add_error(None, 'Trainings cannot be moved to days with'
+                                 ' other trainings')
+            return None
+
+
+def check_positive_values(form, cleaned_data):
+    """Add errors for distances and time of a training not above 0."""
+    distance_main = cleaned_data.get('distance_main')
+    if distance_main is not None and distance_main <= 0:
+        form.add_error('distance_main', 'Distance must be greater than 0')
+
+    distance_additional = cleaned_data.get('distance_additional')
+    if distance_additional is not None and distance_additional <= 0:
+        form.add_error('distance_additional',
+                       'Distance must be greater than 0')
+
+    time_additional = cleaned_data.get('time_additional')
+    if time_additional is not None and time_additional <= 0:
+        form.add_error('time_additional', 'Time must be greater than 0')
 
+
+class TrainingForm(ModelForm):
     class Meta:
         model = Training
         exclude = ['accomplished', 'workout_plan']
@@ -44,42 +119,94 @@ class TrainingForm(ModelForm):
             'day': DatePicker(),
         }
 
+    def __init__(self, *args, workout_plan, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.workout_plan = workout_plan
+        self.instance.workout_plan = workout_plan
+
     def clean(self):
         cleaned_data = super().clean()
-        workout_plan = WorkoutPlan.objects.get(id=cleaned_data.get('plan_id'))
         # date given by user in the form
         training_date = cleaned_data.get('day')
-        # initial date in case of editing an existing training,
-        # value equals to None when creating new Training object
-        initial_training_date = cleaned_data.get('initial_training_date')
-
-        if training_date != initial_training_date:
-            if workout_plan.training_set.filter(day=training_date):
-                self.add_error('day', 'You have already scheduled training'
-                                      ' for this day')
-
-        plan_date_range = workout_plan.date_range
-        if training_date < plan_date_range.lower:
-            self.add_error('day', 'The date of the training cannot be earlier'
-                                  ' than the workout plan start date')
-        if training_date > plan_date_range.upper:
-            self.add_error('day', 'The date of the training cannot be later'
-                                  ' than the workout plan end date')
-
-        distance_main = cleaned_data.get('distance_main')
-        if distance_main is not None and distance_main <= 0:
-            self.add_error('distance_main', 'Distance must be greater than 0')
-
-        distance_additional = cleaned_data.get('distance_additional')
-        if distance_additional is not None and distance_additional <= 0:
-            self.add_error('distance_additional',
-                           'Distance must be greater than 0')
-
-        time_additional = cleaned_data.get('time_additional')
-        if time_additional is not None and time_additional <= 0:
-            self.add_error('time_additional', 'Time must be greater than 0')
+
+        plan_date_range = self.workout_plan.date_range
+        if training_date is not None:
+            if training_date < plan_date_range.lower:
+                self.add_error('day', 'The date of the training cannot be'
+                                      ' earlier than the workout plan start'
+                                      ' date')
+            if training_date > plan_date_range.upper:
+                self.add_error('day', 'The date of the training cannot be'
+                                      ' later than the workout plan end date')
+
+        check_positive_values(self, cleaned_data)
         return cleaned_data
 
+    def save(self, commit=True):
+        """Save the training, one training per day is checked by the
+        database.
+
+        :return: saved training or None if there already is a training
+            on that day
+        :rtype: Training or None
+        """
+        if not commit:
+            return super().save(commit=False)
+        try:
+            with transaction.atomic():
+                return super().save()
+        except IntegrityError as error:
+            if not Training.is_day_taken_error(error):
+                raise
+            self.add_error('day', 'You have already scheduled training'
+                                  ' for this day')
+            return None
+
+
+class RecurrenceRuleForm(ModelForm):
+    weekdays = forms.TypedMultipleChoiceField(
+        choices=RecurrenceRule.WEEKDAYS, coerce=int,
+        widget=forms.CheckboxSelectMultiple, label='Weekdays')
+
+    class Meta:
+        model = RecurrenceRule
+        exclude = ['workout_plan']
+        widgets = {
+            'start_date': DatePicker(),
+            'end_date': DatePicker(),
+        }
+
+    def __init__(self, *args, workout_plan, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.workout_plan = workout_plan
+        self.instance.workout_plan = workout_plan
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date = cleaned_data.get('start_date')
+        end_date = cleaned_data.get('end_date')
+        plan_date_range = self.workout_plan.date_range
+        if start_date is not None and start_date < plan_date_range.lower:
+            self.add_error('start_date', 'The first day cannot be earlier'
+                                         ' than the workout plan start date')
+        if end_date is not None and end_date > plan_date_range.upper:
+            self.add_error('end_date', 'The last day cannot be later than'
+                                       ' the workout plan end date')
+        if start_date and end_date and start_date > end_date:
+            self.add_error('end_date', 'The last day cannot be earlier than'
+                                       ' the first day')
+        interval = cleaned_data.get('interval')
+        if interval is not None and interval < 1:
+            self.add_error('interval', 'Interval must be at least 1 week')
+        check_positive_values(self, cleaned_data)
+        return cleaned_data
+
+
+class TrainingImportForm(forms.Form):
+    file = forms.FileField(
+        label='CSV or JSON file',
+        validators=[FileExtensionValidator(['csv', 'json'])])
+
 
 class LoginForm(forms.Form):
     user = forms.CharField(label='Username')
@@ -156,7 +283,7 @@ class SelectActivePlanFrom(forms.Form):
 class DiaryEntryForm(ModelForm):
     class Meta:
         model = TrainingDiary
-        exclude = ['user']
+        exclude = ['user', 'training']
         labels = {
             'date': 'Date of training',
         }
@@ -171,3 +298,34 @@ class DiaryEntryForm(ModelForm):
             self.add_error('date', 'You can not add an entry for training'
                                    ' that has not yet taken place')
         return training_date
+
+
+class DiaryFilterForm(forms.Form):
+    date_from = forms.DateField(label='From', required=False,
+                                widget=DatePicker())
+    date_to = forms.DateField(label='To', required=False, widget=DatePicker())
+    after = forms.CharField(required=False, widget=forms.HiddenInput)
+
+    def clean_after(self):
+        """Parse the page cursor, date and id of the last entry shown.
+
+        :return: date and id of the last entry on previous page or None
+        :rtype: tuple[date, int] or None
+        """
+        after = self.cleaned_data['after']
+        if not after:
+            return None
+        try:
+            entry_date, entry_id = after.split('_')
+            return date.fromisoformat(entry_date), int(entry_id)
+        except ValueError:
+            raise ValidationError('Invalid page cursor')
+
+
+class DiaryExportForm(forms.Form):
+    date_from = forms.DateField(label='From', required=False,
+                                widget=DatePicker())
+    date_to = forms.DateField(label='To', required=False, widget=DatePicker())
+    file_format = forms.ChoiceField(
+        label='Format', choices=[('csv', 'CSV'), ('xlsx', 'XLSX')],
+        initial='csv')
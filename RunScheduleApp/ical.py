@@ -0,0 +1,122 @@
+"""Helpers building iCalendar (RFC 5545) feeds of workout plans."""
+
+import heapq
+from datetime import timedelta, timezone
+
+PRODUCT_ID = '-//RunSchedules//Workout plan feed//EN'
+MAX_LINE_LENGTH = 75
+
+
+def escape_text(value):
+    """Escape a text value.
+
+    :param value: text
+    :type value: str
+    :return: text with special characters escaped
+    :rtype: str
+    """
+    return (value.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def content_line(name, value):
+    """Create a content line folded to the maximum line length.
+
+    :param name: property name with parameters
+    :type name: str
+    :param value: property value
+    :type value: str
+    :return: content line ending with CRLF
+    :rtype: str
+    """
+    line = f'{name}:{value}'
+    parts = []
+    while len(line.encode()) > MAX_LINE_LENGTH:
+        cut = MAX_LINE_LENGTH
+        while len(line[:cut].encode()) > MAX_LINE_LENGTH:
+            cut -= 1
+        parts.append(line[:cut])
+        line = ' ' + line[cut:]
+    parts.append(line)
+    return '\r\n'.join(parts) + '\r\n'
+
+
+def format_date(value):
+    """Format a date as iCalendar DATE value."""
+    return value.strftime('%Y%m%d')
+
+
+def format_datetime(value):
+    """Format an aware datetime as iCalendar UTC DATE-TIME value."""
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def event_lines(uid, day, summary, timestamp, accomplished=False):
+    """Generate content lines of a whole day event.
+
+    :param uid: unique identifier of the event
+    :type uid: str
+    :param day: date of the event
+    :type day: date
+    :param summary: summary of the event
+    :type summary: str
+    :param timestamp: formatted time of the event's last change
+    :type timestamp: str
+    :param accomplished: whether the training was done, optional
+        (default = False)
+    :type accomplished: bool
+    :return: generator of event content lines
+    :rtype: collections.Iterator[str]
+    """
+    yield content_line('BEGIN', 'VEVENT')
+    yield content_line('UID', uid)
+    yield content_line('DTSTAMP', timestamp)
+    yield content_line('DTSTART;VALUE=DATE', format_date(day))
+    yield content_line('DTEND;VALUE=DATE',
+                       format_date(day + timedelta(days=1)))
+    yield content_line('SUMMARY', escape_text(summary))
+    if accomplished:
+        yield content_line('STATUS', 'CONFIRMED')
+    yield content_line('END', 'VEVENT')
+
+
+def plan_feed(workout_plan, trainings, host, rule_days=()):
+    """Generate iCalendar feed of a workout plan.
+
+    Days of recurrence rules are merged with trainings in order of
+    days, a training replaces the rule on its day.
+
+    :param workout_plan: workout plan
+    :type workout_plan: WorkoutPlan
+    :param trainings: trainings of the plan ordered by day
+    :type trainings: collections.Iterable[Training]
+    :param host: host name used in unique event identifiers
+    :type host: str
+    :param rule_days: days of recurrence rules of the plan as (date,
+        rule) pairs ordered by date, optional (default = ())
+    :type rule_days: collections.Iterable[tuple[date, RecurrenceRule]]
+    :return: generator of feed content lines
+    :rtype: collections.Iterator[str]
+    """
+    timestamp = format_datetime(workout_plan.updated_at)
+    yield content_line('BEGIN', 'VCALENDAR')
+    yield content_line('VERSION', '2.0')
+    yield content_line('PRODID', PRODUCT_ID)
+    yield content_line('CALSCALE', 'GREGORIAN')
+    yield content_line('X-WR-CALNAME', escape_text(workout_plan.name))
+    # Trainings go before rules of the same day, one per day.
+    events = heapq.merge(
+        ((training.day, 0, training) for training in trainings),
+        ((day, 1, rule) for day, rule in rule_days))
+    training_day = None
+    for day, is_rule, event in events:
+        if not is_rule:
+            training_day = day
+            yield from event_lines(
+                f'training-{event.id}@{host}', day, event.training_info(),
+                timestamp, event.accomplished)
+        elif day != training_day:
+            yield from event_lines(
+                f'rule-{event.id}-{format_date(day)}@{host}', day,
+                event.training_info(), timestamp)
+    yield content_line('END', 'VCALENDAR')
@@ -0,0 +1,158 @@
+"""Import of trainings from CSV and JSON files.
+
+Files are read as a stream of rows. CSV files need a header with
+TrainingForm field names (day, training_main, distance_main, ...). JSON
+files hold an array of objects with the same keys.
+
+Every row is validated with TrainingForm. Days already taken in the
+workout plan are loaded with one query up front, so validation does
+not touch the database; valid rows are then inserted with a single
+bulk insert.
+"""
+
+import codecs
+import csv
+import json
+
+from django.db import IntegrityError, transaction
+
+from RunScheduleApp.forms import TrainingForm
+from RunScheduleApp.models import Training, WorkoutPlan
+
+FORMATS = ('csv', 'json')
+READ_SIZE = 64 * 1024
+DAY_TAKEN_ERROR = 'You have already scheduled training for this day'
+
+
+class TrainingImportError(Exception):
+    """Raised when an import file cannot be read."""
+
+
+def get_format(file_name):
+    """Guess the format of an import file from its name.
+
+    :param file_name: name of the file
+    :type file_name: str
+    :return: format name or None if it is not supported
+    :rtype: str or None
+    """
+    extension = file_name.rsplit('.', 1)[-1].lower()
+    return extension if extension in FORMATS else None
+
+
+def read_csv(file):
+    """Read rows of a CSV file.
+
+    :param file: binary file object
+    :return: generator of dictionaries
+    :rtype: generator
+    """
+    lines = codecs.iterdecode(file, 'utf-8-sig')
+    for row in csv.DictReader(lines):
+        yield {key.strip(): value.strip() for key, value in row.items()
+               if key is not None and value is not None}
+
+
+def read_json(file):
+    """Read objects of a JSON array one by one.
+
+    Only the part of the file holding the current object is kept in
+    memory.
+
+    :param file: binary file object
+    :return: generator of dictionaries
+    :rtype: generator
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    position = 0
+    started = False
+    finished = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if not started and position < len(buffer):
+            if buffer[position] != '[':
+                raise TrainingImportError('JSON file must contain an array')
+            started = True
+            position += 1
+            continue
+        if started and buffer[position:position + 1] == ']':
+            return
+        try:
+            row, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if finished:
+                raise TrainingImportError('Invalid JSON file')
+            chunk = file.read(READ_SIZE)
+            finished = not chunk
+            buffer = buffer[position:] + text.decode(chunk, final=finished)
+            position = 0
+            continue
+        if not isinstance(row, dict):
+            raise TrainingImportError(
+                'Every element of the array must be an object')
+        yield row
+        position = end
+
+
+def read_rows(file, file_format):
+    """Read rows of an import file.
+
+    :param file: binary file object
+    :param file_format: 'csv' or 'json'
+    :type file_format: str
+    :return: generator of dictionaries
+    :rtype: generator
+    """
+    if file_format == 'csv':
+        return read_csv(file)
+    return read_json(file)
+
+
+def import_trainings(workout_plan, rows, dry_run=False):
+    """Validate rows and add valid ones as trainings of a workout plan.
+
+    :param workout_plan: workout plan to which trainings are added
+    :type workout_plan: WorkoutPlan
+    :param rows: training data, TrainingForm field names as keys
+    :type rows: collections.Iterable
+    :param dry_run: only validate rows, optional (default = False)
+    :type dry_run: bool
+    :return: number of created trainings and errors of invalid rows
+        as a list of (row number, list of messages) pairs
+    :rtype: tuple
+    """
+    taken_days = set(workout_plan.training_set.values_list('day', flat=True))
+    trainings = []
+    errors = []
+    try:
+        for number, row in enumerate(rows, 1):
+            form = TrainingForm(row, workout_plan=workout_plan)
+            if form.is_valid() and form.cleaned_data['day'] in taken_days:
+                form.add_error('day', DAY_TAKEN_ERROR)
+            if not form.is_valid():
+                errors.append((number, [
+                    f'{field}: {message}' if field != '__all__' else message
+                    for field, messages in form.errors.items()
+                    for message in messages]))
+                continue
+            taken_days.add(form.cleaned_data['day'])
+            trainings.append(form.save(commit=False))
+    except (UnicodeDecodeError, csv.Error) as error:
+        raise TrainingImportError(f'Invalid file: {error}')
+    if dry_run or not trainings:
+        return len(trainings), errors
+    totals = [sum(values) for values in zip(
+        *(training.get_totals()[1:] for training in trainings))]
+    try:
+        with transaction.atomic():
+            Training.objects.bulk_create(trainings)
+            WorkoutPlan.mark_trainings_changed(workout_plan.id, totals)
+    except IntegrityError as error:
+        if not Training.is_day_taken_error(error):
+            raise
+        raise TrainingImportError('Trainings were added to the plan during'
+                                  ' the import, please try again')
+    return len(trainings), errors
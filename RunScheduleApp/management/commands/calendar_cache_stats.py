@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from RunScheduleApp import calendar_cache
+
+
+class Command(BaseCommand):
+    help = 'Show hit and miss counters of the workout calendar cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Reset the counters after showing them.')
+
+    def handle(self, *args, **options):
+        stats = calendar_cache.get_stats()
+        ratio = stats['hit_ratio']
+        self.stdout.write(
+            f"hits: {stats['hits']}, misses: {stats['misses']}, "
+            f"hit ratio: {'-' if ratio is None else f'{ratio:.2%}'}")
+        if options['reset']:
+            calendar_cache.reset_stats()
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from RunScheduleApp import imports
+from RunScheduleApp.models import WorkoutPlan
+
+
+class Command(BaseCommand):
+    help = 'Add trainings from a CSV or JSON file to a workout plan.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('plan_id', type=int, help='Id of a workout plan.')
+        parser.add_argument('path', help='Path to the file.')
+        parser.add_argument('--format', choices=imports.FORMATS,
+                            help='File format (default: file extension).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only validate the file.')
+
+    def handle(self, *args, **options):
+        try:
+            workout_plan = WorkoutPlan.objects.get(pk=options['plan_id'])
+        except WorkoutPlan.DoesNotExist:
+            raise CommandError(f'Workout plan {options["plan_id"]} does not'
+                               f' exist.')
+        file_format = options['format'] or imports.get_format(options['path'])
+        if file_format is None:
+            raise CommandError('Unknown file format, use --format.')
+        with open(options['path'], 'rb') as file:
+            try:
+                created, errors = imports.import_trainings(
+                    workout_plan, imports.read_rows(file, file_format),
+                    dry_run=options['dry_run'])
+            except imports.TrainingImportError as error:
+                raise CommandError(str(error))
+        for number, messages in errors:
+            self.stderr.write(f'Row {number}: {"; ".join(messages)}')
+        action = 'Validated' if options['dry_run'] else 'Added'
+        self.stdout.write(f'{action} {created} training(s), {len(errors)}'
+                          f' invalid row(s).')
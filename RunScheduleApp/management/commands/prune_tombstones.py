@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from RunScheduleApp.models import Tombstone
+
+
+class Command(BaseCommand):
+    help = 'Delete records of deleted objects older than synced clients need.'
+
+    def handle(self, *args, **options):
+        deleted = Tombstone.prune()
+        self.stdout.write(f'Deleted {deleted} tombstone(s).')
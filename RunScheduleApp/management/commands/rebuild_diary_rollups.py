@@ -0,0 +1,21 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from RunScheduleApp.models import MonthlyDiaryRollup, WeeklyDiaryRollup
+
+
+class Command(BaseCommand):
+    help = 'Recalculate weekly and monthly training diary totals.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int,
+                            help='Ids of users (default: all users).')
+
+    def handle(self, *args, **options):
+        users = None
+        if options['user_ids']:
+            users = User.objects.filter(pk__in=options['user_ids'])
+        for rollup in (WeeklyDiaryRollup, MonthlyDiaryRollup):
+            created = rollup.rebuild(users)
+            self.stdout.write(
+                f'Created {created} {rollup._meta.verbose_name}(s).')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from RunScheduleApp.models import WorkoutPlan
+
+
+class Command(BaseCommand):
+    help = 'Recalculate workout plan totals from their trainings.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('plan_ids', nargs='*', type=int,
+                            help='Ids of workout plans (default: all plans).')
+
+    def handle(self, *args, **options):
+        queryset = WorkoutPlan.objects.all()
+        if options['plan_ids']:
+            queryset = queryset.filter(pk__in=options['plan_ids'])
+        updated = WorkoutPlan.rebuild_aggregates(queryset)
+        self.stdout.write(f'Updated {updated} workout plan(s).')
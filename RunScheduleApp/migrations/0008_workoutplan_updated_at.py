@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 05:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RunScheduleApp', '0007_auto_20190514_1442'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workoutplan',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
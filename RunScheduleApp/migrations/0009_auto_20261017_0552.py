@@ -0,0 +1,40 @@
+# Generated by Django 2.2.28 on 2026-10-17 05:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def delete_extra_trainings_of_day(apps, schema_editor):
+    """Leave only the most recently created training of each plan day."""
+    Training = apps.get_model('RunScheduleApp', 'Training')
+    trainings = Training.objects.order_by(
+        'workout_plan_id', 'day', '-id').values_list(
+            'id', 'workout_plan_id', 'day')
+    seen_days = set()
+    extra_training_ids = []
+    for training_id, plan_id, day in trainings:
+        if (plan_id, day) in seen_days:
+            extra_training_ids.append(training_id)
+        seen_days.add((plan_id, day))
+    Training.objects.filter(id__in=extra_training_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RunScheduleApp', '0008_workoutplan_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='training',
+            name='workout_plan',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='RunScheduleApp.WorkoutPlan', verbose_name='Add training to workout plan'),
+        ),
+        migrations.RunPython(delete_extra_trainings_of_day,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='training',
+            constraint=models.UniqueConstraint(fields=('workout_plan', 'day'), name='unique_training_day'),
+        ),
+    ]
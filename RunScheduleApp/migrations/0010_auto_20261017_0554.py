@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-17 05:54
+
+from django.db import migrations, models
+
+
+def deactivate_extra_active_plans(apps, schema_editor):
+    """Leave only the most recently created active plan of each user."""
+    WorkoutPlan = apps.get_model('RunScheduleApp', 'WorkoutPlan')
+    active_plans = WorkoutPlan.objects.filter(is_active=True).order_by(
+        'owner_id', '-id').values_list('id', 'owner_id')
+    seen_owners = set()
+    extra_plan_ids = []
+    for plan_id, owner_id in active_plans:
+        if owner_id in seen_owners:
+            extra_plan_ids.append(plan_id)
+        seen_owners.add(owner_id)
+    WorkoutPlan.objects.filter(id__in=extra_plan_ids).update(is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RunScheduleApp', '0009_auto_20261017_0552'),
+    ]
+
+    operations = [
+        migrations.RunPython(deactivate_extra_active_plans,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='workoutplan',
+            constraint=models.UniqueConstraint(condition=models.Q(is_active=True), fields=('owner',), name='unique_active_plan'),
+        ),
+    ]
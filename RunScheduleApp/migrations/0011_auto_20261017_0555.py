@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 05:55
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RunScheduleApp', '0010_auto_20261017_0554'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='workoutplan',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['date_range'], name='workout_plan_range_idx'),
+        ),
+    ]
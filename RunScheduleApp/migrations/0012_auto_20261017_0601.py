@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RunScheduleApp', '0011_auto_20261017_0555'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='trainingdiary',
+            index=models.Index(fields=['user', 'date', 'id'], name='diary_user_date_idx'),
+        ),
+    ]
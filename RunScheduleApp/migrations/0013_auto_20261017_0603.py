@@ -0,0 +1,56 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:03
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def calculate_aggregates(apps, schema_editor):
+    WorkoutPlan = apps.get_model('RunScheduleApp', 'WorkoutPlan')
+    Training = apps.get_model('RunScheduleApp', 'Training')
+    trainings = Training.objects.filter(
+        workout_plan=OuterRef('pk')).order_by().values('workout_plan')
+    distance = Coalesce('distance_main', 0) + Coalesce(
+        'distance_additional', 0)
+    time = Coalesce('time_main', 0) + Coalesce('time_additional', 0)
+    aggregates = {
+        'total_distance': Sum(distance, output_field=models.DecimalField()),
+        'total_time': Sum(time),
+        'training_count': Count('id'),
+        'accomplished_count': Count('id', filter=Q(accomplished=True)),
+    }
+    WorkoutPlan.objects.update(**{
+        field: Coalesce(Subquery(trainings.annotate(
+            value=aggregate).values('value')), 0)
+        for field, aggregate in aggregates.items()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RunScheduleApp', '0012_auto_20261017_0601'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workoutplan',
+            name='accomplished_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Accomplished trainings'),
+        ),
+        migrations.AddField(
+            model_name='workoutplan',
+            name='total_distance',
+            field=models.DecimalField(decimal_places=1, default=0, editable=False, max_digits=8, verbose_name='Total distance [km]'),
+        ),
+        migrations.AddField(
+            model_name='workoutplan',
+            name='total_time',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Total time [min]'),
+        ),
+        migrations.AddField(
+            model_name='workoutplan',
+            name='training_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Number of trainings'),
+        ),
+        migrations.RunPython(calculate_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:04
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Trunc
+import django.db.models.deletion
+
+
+def calculate_rollups(apps, schema_editor):
+    TrainingDiary = apps.get_model('RunScheduleApp', 'TrainingDiary')
+    for model_name, period in (('WeeklyDiaryRollup', 'week'),
+                               ('MonthlyDiaryRollup', 'month')):
+        rollup = apps.get_model('RunScheduleApp', model_name)
+        periods = TrainingDiary.objects.annotate(
+            period=Trunc('date', period)).order_by().values(
+            'user', 'period').annotate(
+            distance=Sum('training_distance'), time=Sum('training_time'),
+            sessions=Count('id'))
+        rollup.objects.bulk_create(
+            rollup(user_id=row['user'], period_start=row['period'],
+                   total_distance=row['distance'], total_time=row['time'],
+                   session_count=row['sessions'])
+            for row in periods.iterator())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('RunScheduleApp', '0013_auto_20261017_0603'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeeklyDiaryRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField(verbose_name='First day of the period')),
+                ('total_distance', models.DecimalField(decimal_places=1, default=0, max_digits=8, verbose_name='Total distance')),
+                ('total_time', models.PositiveIntegerField(default=0, verbose_name='Total time')),
+                ('session_count', models.PositiveIntegerField(default=0, verbose_name='Number of sessions')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MonthlyDiaryRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField(verbose_name='First day of the period')),
+                ('total_distance', models.DecimalField(decimal_places=1, default=0, max_digits=8, verbose_name='Total distance')),
+                ('total_time', models.PositiveIntegerField(default=0, verbose_name='Total time')),
+                ('session_count', models.PositiveIntegerField(default=0, verbose_name='Number of sessions')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='weeklydiaryrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'period_start'), name='unique_weekly_diary_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='monthlydiaryrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'period_start'), name='unique_monthly_diary_rollup'),
+        ),
+        migrations.RunPython(calculate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:09
+
+from django.db import migrations, models
+from django.db.models import Min, OuterRef, Subquery
+import django.db.models.deletion
+
+
+def link_trainings(apps, schema_editor):
+    """Link diary entries to trainings of their owner on the same day.
+
+    When a user has several entries on one day, only the first of them
+    is linked. Trainings of the active plan are preferred.
+    """
+    TrainingDiary = apps.get_model('RunScheduleApp', 'TrainingDiary')
+    Training = apps.get_model('RunScheduleApp', 'Training')
+    first_entries = TrainingDiary.objects.order_by().values(
+        'user', 'date').annotate(first_id=Min('id')).values('first_id')
+    trainings = Training.objects.filter(
+        workout_plan__owner=OuterRef('user'), day=OuterRef('date')).order_by(
+        '-workout_plan__is_active', '-accomplished', 'id').values('id')
+    TrainingDiary.objects.filter(
+        training__isnull=True, pk__in=first_entries).update(
+        training=Subquery(trainings[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RunScheduleApp', '0014_auto_20261017_0604'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingdiary',
+            name='training',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='diary_entry', to='RunScheduleApp.Training', verbose_name='Planned training'),
+        ),
+        migrations.RunPython(link_trainings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:13
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RunScheduleApp', '0015_trainingdiary_training'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurrenceRule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekdays', django.contrib.postgres.fields.ArrayField(base_field=models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')]), size=None, verbose_name='Weekdays')),
+                ('interval', models.PositiveSmallIntegerField(default=1, verbose_name='Repeat every [weeks]')),
+                ('start_date', models.DateField(verbose_name='First day')),
+                ('end_date', models.DateField(verbose_name='Last day')),
+                ('training_main', models.CharField(max_length=32, verbose_name='Main training')),
+                ('distance_main', models.DecimalField(blank=True, decimal_places=1, max_digits=3, null=True, verbose_name='Distance [km]')),
+                ('time_main', models.SmallIntegerField(blank=True, null=True, verbose_name='Time [min]')),
+                ('training_additional', models.CharField(blank=True, max_length=32, null=True, verbose_name='Additional training (optional)')),
+                ('distance_additional', models.DecimalField(blank=True, decimal_places=1, max_digits=3, null=True, verbose_name='Distance [km]')),
+                ('time_additional', models.SmallIntegerField(blank=True, null=True, verbose_name='Time [min]')),
+                ('workout_plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='RunScheduleApp.WorkoutPlan')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:18
+
+from django.db import migrations
+
+# Django 2.2 cannot declare deferrable constraints, the constraint keeps
+# its name and columns, so the migration state does not change.
+DEFERRABLE = '''
+    ALTER TABLE "RunScheduleApp_training"
+        DROP CONSTRAINT "unique_training_day",
+        ADD CONSTRAINT "unique_training_day" UNIQUE ("workout_plan_id", "day")
+            DEFERRABLE INITIALLY IMMEDIATE
+'''
+NOT_DEFERRABLE = '''
+    ALTER TABLE "RunScheduleApp_training"
+        DROP CONSTRAINT "unique_training_day",
+        ADD CONSTRAINT "unique_training_day" UNIQUE ("workout_plan_id", "day")
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RunScheduleApp', '0016_recurrencerule'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DEFERRABLE, NOT_DEFERRABLE),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('RunScheduleApp', '0017_deferrable_unique_training_day'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('workoutplan', 'Workout plan'), ('training', 'Training'), ('trainingdiary', 'Training diary')], max_length=16)),
+                ('object_id', models.IntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='training',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='trainingdiary',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='training',
+            index=models.Index(fields=['updated_at'], name='training_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trainingdiary',
+            index=models.Index(fields=['user', 'updated_at'], name='diary_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workoutplan',
+            index=models.Index(fields=['owner', 'updated_at'], name='plan_owner_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['owner', 'deleted_at'], name='tombstone_owner_deleted_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:58
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_rules(apps, schema_editor):
+    WorkoutPlan = apps.get_model('RunScheduleApp', 'WorkoutPlan')
+    RecurrenceRule = apps.get_model('RunScheduleApp', 'RecurrenceRule')
+    rules = RecurrenceRule.objects.filter(
+        workout_plan=OuterRef('pk')).order_by().values('workout_plan')
+    WorkoutPlan.objects.update(rule_count=Coalesce(Subquery(
+        rules.annotate(value=Count('id')).values('value')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('RunScheduleApp', '0018_change_tracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workoutplan',
+            name='rule_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Number of recurrence rules'),
+        ),
+        migrations.RunPython(count_rules, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,85 @@
-from django.core.exceptions import PermissionDenied
-from django.db import models
+import calendar
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.core import signing
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Trunc, TruncWeek
+from django.contrib.postgres.fields import ArrayField
 from django.contrib.postgres.fields.ranges import DateRangeField
+from django.contrib.postgres.indexes import GistIndex
 from django.contrib.auth.models import User
-from django.shortcuts import get_object_or_404
+from django.http import Http404
+from django.utils import timezone
+from psycopg2.extras import DateRange
+
+from RunScheduleApp import active_plan_cache, analytics, calendar_cache
+
+
+# Clients which did not synchronize for longer need a full download.
+TOMBSTONE_RETENTION = timedelta(days=90)
+
+
+def keyset_filter(queryset, ordering, values):
+    """Select objects following the given values of ascending ordering
+    fields.
+
+    Fields are compared as a row value, so the database seeks the
+    first following object in an index on the ordering fields instead
+    of filtering all preceding objects.
+
+    :param queryset: objects to filter
+    :type queryset: QuerySet
+    :param ordering: names of ordering fields
+    :type ordering: collections.Sequence
+    :param values: values of ordering fields of the last object
+    :type values: collections.Sequence
+    :return: objects following the last object
+    :rtype: QuerySet
+    """
+    opts = queryset.model._meta
+    quote = connection.ops.quote_name
+    columns = ', '.join(
+        f'{quote(opts.db_table)}.{quote(opts.get_field(field).column)}'
+        for field in ordering)
+    placeholders = ', '.join(['%s'] * len(ordering))
+    return queryset.extra(where=[f'({columns}) > ({placeholders})'],
+                          params=list(values))
+
+
+class WorkoutPlanQuerySet(models.QuerySet):
+    """Queries selecting workout plans by their date range.
+
+    The plan's end date is stored as the exclusive upper bound of the
+    range, but the application treats it as the last day of the plan.
+    Searched ranges are therefore moved one day back, so lookups stay
+    range operators served by the GiST index.
+    """
+
+    def covering(self, day):
+        """Select plans lasting on a given day.
+
+        :param day: date
+        :type day: date
+        :return: workout plans lasting on that day
+        :rtype: WorkoutPlanQuerySet
+        """
+        return self.overlapping(day, day)
+
+    def overlapping(self, start_date, end_date):
+        """Select plans lasting on any day of a date range.
+
+        :param start_date: first day of the range
+        :type start_date: date
+        :param end_date: last day of the range
+        :type end_date: date
+        :return: workout plans overlapping the range
+        :rtype: WorkoutPlanQuerySet
+        """
+        return self.filter(date_range__overlap=DateRange(
+            start_date - timedelta(days=1), end_date, '[]'))
 
 
 class WorkoutPlan(models.Model):
@@ -15,6 +92,58 @@ class WorkoutPlan(models.Model):
     is_active = models.BooleanField(default=False,
                                     verbose_name='Set as current')
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+    total_distance = models.DecimalField(
+        max_digits=8, decimal_places=1, default=0, editable=False,
+        verbose_name='Total distance [km]')
+    total_time = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Total time [min]')
+    training_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Number of trainings')
+    accomplished_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Accomplished trainings')
+    rule_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Number of recurrence rules')
+
+    objects = WorkoutPlanQuerySet.as_manager()
+
+    # Maintained by trainings with relative updates, in the same order as
+    # values returned by Training.get_totals.
+    aggregate_fields = ('total_distance', 'total_time', 'training_count',
+                        'accomplished_count')
+
+    feed_signer = signing.Signer(salt='RunScheduleApp.WorkoutPlan.feed')
+
+    # Fields of the active plan kept in the cache.
+    active_plan_fields = ('id', 'name', 'date_range', 'rule_count')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner'],
+                                    condition=models.Q(is_active=True),
+                                    name='unique_active_plan'),
+        ]
+        indexes = [
+            GistIndex(fields=['date_range'], name='workout_plan_range_idx'),
+            models.Index(fields=['owner', 'updated_at'],
+                         name='plan_owner_updated_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """Save the workout plan without overwriting its aggregates.
+
+        Aggregates loaded with the plan may be outdated by the time it
+        is saved, they are changed only by trainings, as the number of
+        rules is changed only by recurrence rules.
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.aggregate_fields
+                and field.name != 'rule_count']
+        super().save(*args, **kwargs)
 
     def check_owner(self, user):
         """Check if the user is the owner of the training plan.
@@ -24,23 +153,80 @@ class WorkoutPlan(models.Model):
         :return: None
         :rtype: None
         """
-        if self.owner != user:
+        if self.owner_id != user.pk:
             raise PermissionDenied
 
     @classmethod
     def get_active(cls, user):
         """Get user's active workout plan.
 
+        Only id, name, date range and number of recurrence rules of the
+        plan are loaded, they are taken from the cache when possible.
+        Other fields are loaded with an additional query when they are
+        accessed, so views of the active plan use only these fields and
+        take versions of cached calendars from calendar_cache instead
+        of updated_at, which changes with every training.
+
         :param user: username
         :type user: User
         :return: active workout plan for the user or None if it does
             not exist
         :rtype: WorkoutPlan or None
         """
-        workout_plan = cls.objects.filter(owner=user).filter(is_active=True)
-        if workout_plan.exists():
-            return workout_plan[0]
-        return None
+        def load():
+            workout_plan = cls.objects.filter(
+                owner=user, is_active=True).values_list(
+                    *cls.active_plan_fields).first()
+            return workout_plan or ()
+
+        values = active_plan_cache.get_plan(user.pk, cls.active_plan_fields,
+                                            load)
+        if not values:
+            return None
+        values = dict(zip(cls.active_plan_fields, values), is_active=True,
+                      owner_id=user.pk)
+        # Values have to follow the order of model fields.
+        return cls.from_db('default', tuple(values), [
+            values[field.attname] for field in cls._meta.concrete_fields
+            if field.attname in values])
+
+    def get_rules(self):
+        """Get recurrence rules of the workout plan.
+
+        Plans without rules are recognized by their number of rules,
+        so their rules are not looked up in the database.
+
+        :return: recurrence rules ordered by id
+        :rtype: list[RecurrenceRule]
+        """
+        if not self.rule_count:
+            return []
+        return list(self.recurrencerule_set.order_by('id'))
+
+    def get_feed_token(self):
+        """Get token that gives access to the plan's calendar feed.
+
+        :return: signature of the workout plan id
+        :rtype: str
+        """
+        return self.feed_signer.sign(str(self.id)).rsplit(':', 1)[1]
+
+    @classmethod
+    def check_feed_token(cls, plan_id, token):
+        """Check if token gives access to the plan's calendar feed.
+
+        :param plan_id: workout plan id
+        :type plan_id: int
+        :param token: token from the feed url
+        :type token: str
+        :return: True if the token is valid
+        :rtype: bool
+        """
+        try:
+            cls.feed_signer.unsign(f'{plan_id}:{token}')
+        except signing.BadSignature:
+            return False
+        return True
 
     def get_start_and_end_date(self):
         """Get workout plan start date and end date.
@@ -50,23 +236,343 @@ class WorkoutPlan(models.Model):
         """
         return self.date_range.lower, self.date_range.upper
 
+    def clone(self, start_date, name=None):
+        """Copy the workout plan and its trainings to a new start date.
+
+        Trainings and recurrence rules are moved by the same number of
+        days as the plan and inserted with one query each. Rules which
+        cannot be moved by that number of days (see RecurrenceRule.move)
+        are copied as trainings. The copy is inactive and none of its
+        trainings is accomplished.
+
+        :param start_date: start date of the copy
+        :type start_date: date
+        :param name: name of the copy, optional (default = None - name
+            of the workout plan)
+        :type name: str or None
+        :return: new workout plan
+        :rtype: WorkoutPlan
+        """
+        shift = start_date - self.date_range.lower
+        trainings = list(self.training_set.all())
+        rules = list(self.recurrencerule_set.all())
+        # Rules which cannot be moved by the shift are copied as
+        # trainings on days they fill in the calendar.
+        moved_rules = [rule for rule in rules if rule.can_move(shift.days)]
+        taken_days = {training.day for training in trainings}
+        trainings += [
+            rule.create_training(day) for day, rule in sorted(
+                RecurrenceRule.expand(rules, date.min, date.max).items())
+            if rule not in moved_rules and day not in taken_days]
+        for training in trainings:
+            training.pk = None
+            training.day += shift
+            training.accomplished = False
+        for rule in moved_rules:
+            rule.pk = None
+            rule.move(shift.days)
+        totals = [sum(values) for values in zip(
+            *(training.get_totals()[1:] for training in trainings))]
+        copy = WorkoutPlan(
+            name=name or self.name, description=self.description,
+            date_range=DateRange(self.date_range.lower + shift,
+                                 self.date_range.upper + shift,
+                                 self.date_range._bounds),
+            owner_id=self.owner_id, rule_count=len(moved_rules),
+            **dict(zip(self.aggregate_fields, totals)))
+        with transaction.atomic():
+            copy.save()
+            for training in trainings:
+                training.workout_plan = copy
+            Training.objects.bulk_create(trainings)
+            if moved_rules:
+                for rule in moved_rules:
+                    rule.workout_plan = copy
+                RecurrenceRule.objects.bulk_create(moved_rules)
+        return copy
+
+    def shift(self, days, from_date=None, delete_range=None):
+        """Move trainings of the workout plan by a number of days.
+
+        Trainings are moved with one update. The one training per day
+        constraint is deferred until all of them are moved, so trainings
+        may move onto days freed in the same update. The plan's date
+        range and recurrence rules are moved with the trainings, a rule
+        lasting on from_date is split and only its part from that day
+        is moved. Days of rules which cannot be moved by the number of
+        days (see RecurrenceRule.move) are first stored as trainings,
+        which are moved with the others.
+
+        :param days: number of days, negative to move trainings back
+        :type days: int
+        :param from_date: first day of moved trainings, optional
+            (default = None - all trainings are moved)
+        :type from_date: date or None
+        :param delete_range: first and last day of trainings deleted
+            before the move, optional (default = None)
+        :type delete_range: tuple[date, date] or None
+        :raises IntegrityError: if a moved training would share a day
+            with another training of the plan
+        :return: number of moved trainings
+        :rtype: int
+        """
+        shift = timedelta(days=days)
+        start_date, end_date = self.get_start_and_end_date()
+        trainings = self.training_set.all()
+        if from_date is not None:
+            trainings = trainings.filter(day__gte=from_date)
+        if from_date is None or from_date <= start_date:
+            start_date += shift
+            end_date += shift
+        elif from_date <= end_date:
+            # Days before from_date stay in the plan.
+            start_date = min(start_date, from_date + shift)
+            end_date = max(end_date + shift, from_date)
+        with transaction.atomic():
+            WorkoutPlan.objects.select_for_update().filter(pk=self.pk).exists()
+            if delete_range is not None:
+                self.delete_trainings(self.training_set.filter(
+                    day__range=delete_range).values_list('id', flat=True))
+            created = self.shift_rules(days, from_date)
+            with Training.day_constraint_deferred():
+                moved = trainings.update(day=F('day') + shift,
+                                         updated_at=timezone.now())
+            self.date_range = DateRange(start_date, end_date,
+                                        self.date_range._bounds)
+            WorkoutPlan.objects.filter(pk=self.pk).update(
+                date_range=self.date_range)
+            active_plan_cache.plan_changed(self.owner_id)
+            if delete_range is not None:
+                WorkoutPlan.rebuild_aggregates(
+                    WorkoutPlan.objects.filter(pk=self.pk))
+                created = None
+            WorkoutPlan.mark_trainings_changed(self.pk, created)
+        return moved
+
+    def shift_rules(self, days, from_date=None):
+        """Move recurrence rules of the workout plan by a number of days.
+
+        Rules are moved, split and deleted with one query each, the
+        plan's number of rules is updated when it changes. Days
+        of rules which cannot be moved are stored as trainings on the
+        same days, to be moved with other trainings. Must be used in
+        a transaction.
+
+        :param days: number of days, negative to move rules back
+        :type days: int
+        :param from_date: first day of moved rules, optional
+            (default = None - whole rules are moved)
+        :type from_date: date or None
+        :return: totals of created trainings, as changes of plan
+            aggregates
+        :rtype: list
+        """
+        rules = list(self.recurrencerule_set.all())
+        rule_days = RecurrenceRule.expand(rules, from_date or date.min,
+                                          date.max)
+        taken_days = set(self.training_set.filter(
+            day__gte=from_date or date.min).values_list('day', flat=True))
+        moved, split, materialized = [], [], []
+        for rule in rules:
+            if from_date is not None and rule.end_date < from_date:
+                continue
+            if from_date is not None and rule.start_date < from_date:
+                # The part before from_date stays as a new rule.
+                if rule.interval == 1:
+                    split.append(RecurrenceRule(
+                        workout_plan_id=self.pk, weekdays=rule.weekdays,
+                        interval=rule.interval, start_date=rule.start_date,
+                        end_date=from_date - timedelta(days=1),
+                        **rule.get_template()))
+                    rule.start_date = from_date
+                else:
+                    materialized.append(rule)
+                    continue
+            elif not rule.can_move(days):
+                materialized.append(rule)
+                continue
+            rule.move(days)
+            moved.append(rule)
+
+        trainings = [rule.create_training(day)
+                     for day, rule in sorted(rule_days.items())
+                     if rule in materialized and day not in taken_days]
+        Training.objects.bulk_create(trainings)
+        # Rules lasting on from_date keep days before it.
+        kept = [rule for rule in materialized if from_date is not None
+                and rule.start_date < from_date]
+        for rule in kept:
+            rule.end_date = from_date - timedelta(days=1)
+        if moved or kept:
+            RecurrenceRule.objects.bulk_update(
+                moved + kept, ['weekdays', 'start_date', 'end_date'])
+        if split:
+            RecurrenceRule.objects.bulk_create(split)
+        deleted = [rule.id for rule in materialized if rule not in kept]
+        if deleted:
+            RecurrenceRule.objects.filter(id__in=deleted).delete()
+        if len(split) != len(deleted):
+            WorkoutPlan.mark_rules_changed(self.pk, len(split) - len(deleted))
+        return [sum(values) for values in zip(
+            *(training.get_totals()[1:] for training in trainings))]
+
+    def delete(self, *args, **kwargs):
+        """Delete the workout plan and record its deletion.
+
+        Trainings are deleted with the plan, they are not recorded
+        separately.
+        """
+        with transaction.atomic():
+            TrainingDiary.objects.filter(training__workout_plan=self).update(
+                training=None, updated_at=timezone.now())
+            Tombstone.record(self.owner_id, Tombstone.WORKOUT_PLAN, [self.id])
+            return super().delete(*args, **kwargs)
+
+    def delete_trainings(self, training_ids):
+        """Delete trainings of the workout plan and record their deletion.
+
+        Aggregates of the plan are not updated.
+
+        :param training_ids: ids of trainings to delete
+        :type training_ids: collections.Iterable
+        :return: ids of deleted trainings
+        :rtype: list
+        """
+        training_ids = list(training_ids)
+        if training_ids:
+            TrainingDiary.objects.filter(training_id__in=training_ids).update(
+                training=None, updated_at=timezone.now())
+            self.training_set.filter(id__in=training_ids).delete()
+            Tombstone.record(self.owner_id, Tombstone.TRAINING, training_ids)
+        return training_ids
+
     @classmethod
     def set_active(cls, plan_id, user):
         """Set workout plan as active.
 
+        Flags are switched in one transaction while the user's row is
+        locked, so concurrent switches of the same user run one after
+        another and never leave two active plans.
+
         :param plan_id: id of a workout plan to be set as active
         :type plan_id: int
         :param user: user for whom new active plan is to be set
         :type user: User
+        :raises Http404: if the user does not own such a workout plan
         :return: None
         """
-        cls.objects.filter(owner=user).filter(is_active=True).update(
-            is_active=False)
-        new_active_plan = get_object_or_404(cls, pk=plan_id)
-        new_active_plan.is_active = True
-        new_active_plan.save()
+        with transaction.atomic():
+            User.objects.select_for_update().filter(pk=user.pk).exists()
+            now = timezone.now()
+            cls.objects.filter(owner=user, is_active=True).exclude(
+                pk=plan_id).update(is_active=False, updated_at=now)
+            if not cls.objects.filter(owner=user, pk=plan_id).update(
+                    is_active=True, updated_at=now):
+                raise Http404('No WorkoutPlan matches the given query.')
+            active_plan_cache.plan_changed(user.pk)
         return None
 
+    @classmethod
+    def mark_trainings_changed(cls, plan_id, totals_change=None):
+        """Record that trainings of a workout plan were changed.
+
+        Updates the plan's modification time and aggregates with
+        a single query and invalidates its cached calendar.
+
+        :param plan_id: workout plan id
+        :type plan_id: int
+        :param totals_change: changes of total distance, total time,
+            number of trainings and number of accomplished trainings,
+            optional (default = None)
+        :type totals_change: collections.Sequence or None
+        :return: None
+        """
+        changes = {'updated_at': timezone.now()}
+        for field, change in zip(cls.aggregate_fields, totals_change or ()):
+            if change:
+                changes[field] = F(field) + change
+        cls.objects.filter(pk=plan_id).update(**changes)
+        calendar_cache.plan_changed(plan_id)
+        return None
+
+    @classmethod
+    def mark_rules_changed(cls, plan_id, count_change=0):
+        """Record that recurrence rules of a workout plan were changed.
+
+        Updates the plan's modification time and number of rules with
+        a single query and invalidates its cached calendar. The owner's
+        cached active plan keeps the number of rules, so it is
+        invalidated when the number changes.
+
+        :param plan_id: workout plan id
+        :type plan_id: int
+        :param count_change: change of the number of rules, optional
+            (default = 0)
+        :type count_change: int
+        :return: None
+        """
+        changes = {'updated_at': timezone.now()}
+        if count_change:
+            changes['rule_count'] = F('rule_count') + count_change
+        cls.objects.filter(pk=plan_id).update(**changes)
+        calendar_cache.plan_changed(plan_id)
+        if count_change:
+            active_plan_cache.plan_changed(cls.objects.filter(
+                pk=plan_id).values_list('owner_id', flat=True).first())
+        return None
+
+    def get_weekly_adherence(self):
+        """Compare planned and actually run distance and time per week.
+
+        Trainings of the plan are joined with diary entries linked to
+        them, so the report is built with a single query.
+
+        :return: weekly numbers of planned and completed trainings and
+            planned and actual distance and time, ordered by week
+        :rtype: QuerySet
+        """
+        distance = Coalesce('distance_main', 0) + Coalesce(
+            'distance_additional', 0)
+        time = Coalesce('time_main', 0) + Coalesce('time_additional', 0)
+        return self.training_set.annotate(week=TruncWeek('day')).order_by(
+            'week').values('week').annotate(
+            planned_count=Count('id'),
+            completed_count=Count('diary_entry'),
+            planned_distance=Sum(distance, output_field=models.DecimalField()),
+            planned_time=Sum(time),
+            actual_distance=Coalesce(Sum('diary_entry__training_distance'), 0),
+            actual_time=Coalesce(Sum('diary_entry__training_time'), 0))
+
+    @classmethod
+    def rebuild_aggregates(cls, queryset=None):
+        """Recalculate aggregates of workout plans from their trainings.
+
+        :param queryset: workout plans to recalculate, optional
+            (default = None - all workout plans)
+        :type queryset: WorkoutPlanQuerySet or None
+        :return: number of updated workout plans
+        :rtype: int
+        """
+        if queryset is None:
+            queryset = cls.objects.all()
+        trainings = Training.objects.filter(
+            workout_plan=OuterRef('pk')).order_by().values('workout_plan')
+        distance = Coalesce('distance_main', 0) + Coalesce(
+            'distance_additional', 0)
+        time = Coalesce('time_main', 0) + Coalesce('time_additional', 0)
+        aggregates = {
+            'total_distance': Sum(distance,
+                                  output_field=models.DecimalField()),
+            'total_time': Sum(time),
+            'training_count': Count('id'),
+            'accomplished_count': Count('id', filter=models.Q(
+                accomplished=True)),
+        }
+        return queryset.update(**{
+            field: Coalesce(Subquery(trainings.annotate(
+                value=aggregate).values('value')), 0)
+            for field, aggregate in aggregates.items()})
+
 
 class Training(models.Model):
     """Stores a single training entry."""
@@ -88,9 +594,119 @@ class Training(models.Model):
     time_additional = models.SmallIntegerField(
         verbose_name='Time [min]', null=True, blank=True)
     workout_plan = models.ForeignKey(
-        WorkoutPlan, on_delete=models.CASCADE, unique_for_date=day,
+        WorkoutPlan, on_delete=models.CASCADE,
         verbose_name='Add training to workout plan')
     accomplished = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['workout_plan', 'day'],
+                                    name='unique_training_day'),
+        ]
+        indexes = [
+            models.Index(fields=['updated_at'], name='training_updated_idx'),
+        ]
+
+    # Values added to workout plan aggregates when the training was
+    # loaded or last saved.
+    _saved_totals = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Load the training and remember its part of plan aggregates."""
+        instance = super().from_db(db, field_names, values)
+        if not instance.get_deferred_fields():
+            instance._saved_totals = instance.get_totals()
+        return instance
+
+    def get_totals(self):
+        """Get values the training adds to its workout plan aggregates.
+
+        :return: workout plan id, followed by distance, time, number of
+            trainings and number of accomplished trainings
+        :rtype: tuple
+        """
+        return (self.workout_plan_id, self.calculate_distance() or 0,
+                self.calculate_time() or 0, 1, int(self.accomplished))
+
+    @staticmethod
+    def update_plan_totals(old_totals, new_totals):
+        """Apply the difference between training's totals to its plans.
+
+        :param old_totals: totals before the change or None for a new
+            training
+        :type old_totals: tuple or None
+        :param new_totals: totals after the change or None for a deleted
+            training
+        :type new_totals: tuple or None
+        :return: None
+        """
+        if old_totals and new_totals and old_totals[0] == new_totals[0]:
+            WorkoutPlan.mark_trainings_changed(new_totals[0], [
+                new - old for new, old in zip(new_totals[1:], old_totals[1:])])
+            return None
+        if old_totals:
+            WorkoutPlan.mark_trainings_changed(
+                old_totals[0], [-value for value in old_totals[1:]])
+        if new_totals:
+            WorkoutPlan.mark_trainings_changed(new_totals[0], new_totals[1:])
+        return None
+
+    def lock_saved_totals(self):
+        """Lock the stored training and get its part of plan aggregates.
+
+        Totals are read from the locked row, so concurrent changes of
+        the training are applied to aggregates one after another. Must
+        be used in a transaction.
+
+        :return: totals of the stored training or None if it is not
+            stored
+        :rtype: tuple or None
+        """
+        if self._state.adding:
+            return None
+        stored = Training.objects.select_for_update().filter(
+            pk=self.pk).first()
+        return stored and stored._saved_totals
+
+    def save(self, *args, **kwargs):
+        """Save the training and update its workout plan in one
+        transaction."""
+        totals = self.get_totals()
+        with transaction.atomic():
+            saved_totals = self.lock_saved_totals()
+            super().save(*args, **kwargs)
+            self.update_plan_totals(saved_totals, totals)
+        self._saved_totals = totals
+
+    @staticmethod
+    @contextmanager
+    def day_constraint_deferred():
+        """Check one training per day rule once, after all statements
+        run in the block.
+
+        Trainings may then move onto days freed in the same block.
+        Conflicts raise IntegrityError at the end of the block instead
+        of at commit. Must be used in a transaction.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS "unique_training_day" DEFERRED')
+            yield
+            cursor.execute('SET CONSTRAINTS "unique_training_day" IMMEDIATE')
+
+    @staticmethod
+    def is_day_taken_error(error):
+        """Check if the error was raised by one training per day rule.
+
+        :param error: error raised by the database
+        :type error: IntegrityError
+        :return: True if the error was raised by unique_training_day
+            constraint
+        :rtype: bool
+        """
+        diag = getattr(error.__cause__, 'diag', None)
+        return getattr(diag, 'constraint_name', None) == 'unique_training_day'
 
     def calculate_distance(self):
         """Calculate training distance
@@ -143,11 +759,216 @@ class Training(models.Model):
             info.append(f'{self.time_additional}min')
         return ' '.join(info)
 
+    def delete(self, *args, **kwargs):
+        """Delete the training and update its workout plan in one
+        transaction."""
+        with transaction.atomic():
+            totals = self.lock_saved_totals()
+            TrainingDiary.objects.filter(training=self).update(
+                training=None, updated_at=timezone.now())
+            Tombstone.record(self.workout_plan.owner_id, Tombstone.TRAINING,
+                             [self.id])
+            result = super().delete(*args, **kwargs)
+            # Not subtracted again if deleted by a concurrent request.
+            self.update_plan_totals(totals, None)
+        self._saved_totals = None
+        return result
+
     def __str__(self):
         """Return a string representation of the model."""
         return self.training_info()
 
 
+class RecurrenceRule(models.Model):
+    """Stores a training repeated on chosen weekdays of a workout plan.
+
+    Trainings of a rule are not stored, they are expanded for the days
+    being displayed. A training saved on one of those days replaces the
+    rule on that day.
+    """
+
+    WEEKDAYS = list(enumerate(calendar.day_name))
+
+    # Fields copied to trainings created from the rule.
+    template_fields = ('training_main', 'distance_main', 'time_main',
+                       'training_additional', 'distance_additional',
+                       'time_additional')
+
+    workout_plan = models.ForeignKey(WorkoutPlan, on_delete=models.CASCADE)
+    weekdays = ArrayField(models.PositiveSmallIntegerField(choices=WEEKDAYS),
+                          verbose_name='Weekdays')
+    interval = models.PositiveSmallIntegerField(
+        default=1, verbose_name='Repeat every [weeks]')
+    start_date = models.DateField(verbose_name='First day')
+    end_date = models.DateField(verbose_name='Last day')
+    training_main = models.CharField(
+        max_length=32, verbose_name='Main training')
+    distance_main = models.DecimalField(
+        max_digits=3, decimal_places=1, verbose_name='Distance [km]',
+        null=True, blank=True)
+    time_main = models.SmallIntegerField(
+        verbose_name='Time [min]', null=True, blank=True)
+    training_additional = models.CharField(
+        null=True, max_length=32, blank=True,
+        verbose_name='Additional training (optional)')
+    distance_additional = models.DecimalField(
+        max_digits=3, decimal_places=1, verbose_name='Distance [km]',
+        null=True, blank=True)
+    time_additional = models.SmallIntegerField(
+        verbose_name='Time [min]', null=True, blank=True)
+
+    def __str__(self):
+        weekdays = ', '.join(calendar.day_abbr[day]
+                             for day in sorted(self.weekdays))
+        return f'{self.training_info()} ({weekdays})'
+
+    def save(self, *args, **kwargs):
+        """Save the rule, count it in its plan and invalidate cached
+        calendars of the plan."""
+        count_change = int(self._state.adding)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            WorkoutPlan.mark_rules_changed(self.workout_plan_id, count_change)
+        # The plan loaded with the rule counts it as well.
+        if self._meta.get_field('workout_plan').is_cached(self):
+            self.workout_plan.rule_count += count_change
+
+    def delete(self, *args, **kwargs):
+        """Delete the rule, uncount it in its plan and invalidate cached
+        calendars of the plan."""
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            WorkoutPlan.mark_rules_changed(self.workout_plan_id, -result[0])
+        return result
+
+    def create_training(self, day):
+        """Create unsaved training of the rule on a given day.
+
+        :param day: date of the training
+        :type day: date
+        :return: training
+        :rtype: Training
+        """
+        return Training(day=day, workout_plan_id=self.workout_plan_id,
+                        **self.get_template())
+
+    def get_template(self):
+        """Get values of training fields set by the rule.
+
+        :return: field names and values
+        :rtype: dict
+        """
+        return {field: getattr(self, field) for field in self.template_fields}
+
+    def training_info(self):
+        """Prepare information about the rule's training.
+
+        :return: training info
+        :rtype: str
+        """
+        return self.create_training(self.start_date).training_info()
+
+    def get_days(self, start, end):
+        """Get days of the rule between two dates.
+
+        Weeks are counted from the week of the rule's first day.
+
+        :param start: first day of the period
+        :type start: date
+        :param end: last day of the period
+        :type end: date
+        :return: generator of dates
+        :rtype: generator
+        """
+        first_monday = self.start_date - timedelta(
+            days=self.start_date.weekday())
+        day = max(start, self.start_date)
+        last_day = min(end, self.end_date)
+        while day <= last_day:
+            weeks = (day - first_monday).days // 7
+            if day.weekday() in self.weekdays and weeks % self.interval == 0:
+                yield day
+            day += timedelta(days=1)
+
+    def can_move(self, days):
+        """Check if the rule can be moved by a number of days.
+
+        Weeks of the rule are counted from the monday of its first day,
+        so rules repeated every few weeks keep their days only when
+        moved by whole weeks.
+
+        :param days: number of days
+        :type days: int
+        :return: True if the moved rule falls on moved days
+        :rtype: bool
+        """
+        return self.interval == 1 or days % 7 == 0
+
+    def move(self, days):
+        """Move the rule by a number of days, without saving it.
+
+        Weekdays are moved with the dates, so every day of the rule
+        moves by the number of days, if the rule can be moved (see
+        can_move).
+
+        :param days: number of days, negative to move the rule back
+        :type days: int
+        :return: None
+        """
+        shift = timedelta(days=days)
+        self.start_date += shift
+        self.end_date += shift
+        self.weekdays = sorted((weekday + days) % 7
+                               for weekday in self.weekdays)
+        return None
+
+    @staticmethod
+    def expand(rules, start, end):
+        """Get days of rules between two dates.
+
+        When rules share a day, the rule saved first is used.
+
+        :param rules: recurrence rules
+        :type rules: collections.Iterable
+        :param start: first day of the period
+        :type start: date
+        :param end: last day of the period
+        :type end: date
+        :return: date as key and rule as value
+        :rtype: dict[date, RecurrenceRule]
+        """
+        days = {}
+        for rule in sorted(rules, key=lambda rule: rule.id):
+            for day in rule.get_days(start, end):
+                days.setdefault(day, rule)
+        return days
+
+    def materialize(self):
+        """Replace the rule with trainings stored in the database.
+
+        Trainings are inserted with one query on days without
+        a training, then the rule is deleted.
+
+        :return: number of created trainings
+        :rtype: int
+        """
+        with transaction.atomic():
+            taken_days = set(Training.objects.filter(
+                workout_plan_id=self.workout_plan_id,
+                day__range=(self.start_date, self.end_date)).values_list(
+                'day', flat=True))
+            trainings = [self.create_training(day) for day in
+                         self.get_days(self.start_date, self.end_date)
+                         if day not in taken_days]
+            Training.objects.bulk_create(trainings)
+            totals = [sum(values) for values in zip(
+                *(training.get_totals()[1:] for training in trainings))]
+            deleted, _ = super().delete()
+            WorkoutPlan.mark_trainings_changed(self.workout_plan_id, totals)
+            WorkoutPlan.mark_rules_changed(self.workout_plan_id, -deleted)
+        return len(trainings)
+
+
 class TrainingDiary(models.Model):
     """Stores a single entry in a training diary."""
 
@@ -159,3 +980,467 @@ class TrainingDiary(models.Model):
     comments = models.CharField(
         max_length=256, verbose_name='Comments', null=True, blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    training = models.OneToOneField(
+        Training, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='diary_entry', verbose_name='Planned training')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date', 'id'],
+                         name='diary_user_date_idx'),
+            models.Index(fields=['user', 'updated_at'],
+                         name='diary_user_updated_idx'),
+        ]
+
+    # Values added to diary rollups when the entry was loaded or last
+    # saved.
+    _saved_totals = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Load the entry and remember its part of diary rollups."""
+        instance = super().from_db(db, field_names, values)
+        if not instance.get_deferred_fields():
+            instance._saved_totals = instance.get_totals()
+        return instance
+
+    def get_totals(self):
+        """Get values the entry adds to diary rollups.
+
+        :return: user id, date, distance, time and number of sessions
+        :rtype: tuple
+        """
+        fields = self._meta
+        return (self.user_id,
+                fields.get_field('date').to_python(self.date),
+                fields.get_field('training_distance').to_python(
+                    self.training_distance),
+                self.training_time, 1)
+
+    def lock_saved_totals(self):
+        """Lock the stored entry and get its part of diary rollups.
+
+        Totals are read from the locked row, so concurrent changes of
+        the entry are applied to rollups one after another. Must be
+        used in a transaction.
+
+        :return: totals of the stored entry or None if it is not stored
+        :rtype: tuple or None
+        """
+        if self._state.adding:
+            return None
+        stored = TrainingDiary.objects.select_for_update().filter(
+            pk=self.pk).first()
+        return stored and stored._saved_totals
+
+    def save(self, *args, **kwargs):
+        """Save the entry and update diary rollups in one transaction."""
+        totals = self.get_totals()
+        with transaction.atomic():
+            saved_totals = self.lock_saved_totals()
+            super().save(*args, **kwargs)
+            if saved_totals:
+                DiaryRollup.record(*saved_totals, sign=-1)
+                if saved_totals[0] != self.user_id:
+                    analytics.diary_changed(saved_totals[0])
+            DiaryRollup.record(*totals)
+            analytics.diary_changed(self.user_id)
+        self._saved_totals = totals
+
+    def delete(self, *args, **kwargs):
+        """Delete the entry and update diary rollups in one
+        transaction."""
+        with transaction.atomic():
+            totals = self.lock_saved_totals()
+            Tombstone.record(self.user_id, Tombstone.TRAINING_DIARY,
+                             [self.id])
+            result = super().delete(*args, **kwargs)
+            # Not subtracted again if deleted by a concurrent request.
+            if totals:
+                DiaryRollup.record(*totals, sign=-1)
+            analytics.diary_changed(self.user_id)
+        self._saved_totals = None
+        return result
+
+    @classmethod
+    def plan_entry(cls, user, training):
+        """Create unsaved diary entry of a training as it was planned.
+
+        :param user: owner of the diary
+        :type user: User
+        :param training: planned training
+        :type training: Training
+        :return: diary entry or None if total distance or time of the
+            training exceeds limits of diary fields
+        :rtype: TrainingDiary or None
+        """
+        entry = cls(user=user, training=training, date=training.day,
+                    training_info=training.training_info(),
+                    training_distance=training.calculate_distance() or 0,
+                    training_time=training.calculate_time() or 0)
+        try:
+            entry.clean_fields(exclude=('user', 'training', 'comments'))
+        except ValidationError:
+            return None
+        return entry
+
+    @classmethod
+    def log_trainings(cls, user, trainings):
+        """Add trainings to user's diary as they were planned.
+
+        Trainings which already are in the diary are skipped, as are
+        trainings too long for diary fields (see plan_entry), which
+        have to be added one by one. Entries are inserted with one
+        query and trainings are marked as accomplished with one update,
+        in a single transaction.
+
+        :param user: owner of the diary
+        :type user: User
+        :param trainings: trainings to add
+        :type trainings: QuerySet
+        :return: created diary entries
+        :rtype: list[TrainingDiary]
+        """
+        with transaction.atomic():
+            entries = []
+            for training in trainings.filter(
+                    diary_entry__isnull=True).select_for_update(of=('self',)):
+                entry = cls.plan_entry(user, training)
+                if entry is not None:
+                    entries.append(entry)
+            if not entries:
+                return []
+            trainings = [entry.training for entry in entries]
+            cls.objects.bulk_create(entries)
+            # Number of newly accomplished trainings in each plan.
+            plans = {}
+            for training in trainings:
+                plans[training.workout_plan_id] = plans.get(
+                    training.workout_plan_id, 0) + (not training.accomplished)
+            Training.objects.filter(
+                pk__in=[training.pk for training in trainings],
+                accomplished=False).update(accomplished=True,
+                                           updated_at=timezone.now())
+            for plan_id, accomplished in plans.items():
+                WorkoutPlan.mark_trainings_changed(
+                    plan_id, (0, 0, 0, accomplished))
+            DiaryRollup.record_entries(entries)
+            analytics.diary_changed(user.pk)
+        return entries
+
+    @classmethod
+    def get_statistics(cls, user):
+        """Get training diary statistics of a user.
+
+        Statistics are calculated by the database with a single query:
+        entries are grouped by month and aggregate window functions add
+        month-over-month changes and totals of the whole diary to each
+        month. Pace is given in minutes per kilometer.
+
+        :param user: owner of the diary
+        :type user: User
+        :return: statistics of the whole diary (None if the diary is
+            empty) and list of monthly statistics
+        :rtype: dict
+        """
+        query = STATISTICS_QUERY.format(table=cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(query, [user.pk])
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        summary = None
+        if rows:
+            summary = {column[len('all_'):]: rows[0][column]
+                       for column in columns if column.startswith('all_')}
+        months = [{column: row[column] for column in columns
+                   if not column.startswith('all_')} for row in rows]
+        return {'summary': summary, 'months': months}
+
+
+STATISTICS_QUERY = """
+    WITH months AS (
+        SELECT date_trunc('month', date)::date AS month,
+               count(*) AS sessions,
+               sum(training_distance) AS distance,
+               sum(training_time) AS time,
+               max(training_distance) AS longest_run,
+               min(training_time / nullif(training_distance, 0)) AS best_pace
+        FROM "{table}"
+        WHERE user_id = %s
+        GROUP BY 1
+    ), changes AS (
+        SELECT *,
+               CASE WHEN lag(month) OVER w = month - interval '1 month'
+                    THEN lag(distance) OVER w END AS previous_distance,
+               CASE WHEN lag(month) OVER w = month - interval '1 month'
+                    THEN lag(time) OVER w END AS previous_time
+        FROM months
+        WINDOW w AS (ORDER BY month)
+    )
+    SELECT month, sessions, distance, time, longest_run,
+           round(best_pace, 2) AS best_pace,
+           round(time / nullif(distance, 0), 2) AS pace,
+           distance - previous_distance AS distance_change,
+           round(100 * (distance - previous_distance)
+                 / nullif(previous_distance, 0), 1) AS distance_change_percent,
+           time - previous_time AS time_change,
+           sum(sessions) OVER () AS all_sessions,
+           sum(distance) OVER () AS all_distance,
+           sum(time) OVER () AS all_time,
+           round(sum(distance) OVER () / sum(sessions) OVER (), 2)
+               AS all_average_distance,
+           round(sum(time) OVER () / sum(sessions) OVER (), 1)
+               AS all_average_time,
+           round(sum(time) OVER () / nullif(sum(distance) OVER (), 0), 2)
+               AS all_pace,
+           max(longest_run) OVER () AS all_longest_run,
+           round(min(best_pace) OVER (), 2) AS all_best_pace
+    FROM changes
+    ORDER BY month
+"""
+
+
+class DiaryRollup(models.Model):
+    """Base class of training diary totals per user and period.
+
+    Subclasses set the period, 'week' or 'month', which selects both
+    the first day of a period of an entry and the database truncation
+    of entry dates.
+    """
+
+    period = None
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    period_start = models.DateField(verbose_name='First day of the period')
+    total_distance = models.DecimalField(
+        max_digits=8, decimal_places=1, default=0,
+        verbose_name='Total distance')
+    total_time = models.PositiveIntegerField(default=0,
+                                             verbose_name='Total time')
+    session_count = models.PositiveIntegerField(
+        default=0, verbose_name='Number of sessions')
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def get_period_start(cls, day):
+        """Get the first day of the period containing a given day.
+
+        Weeks start on monday, like weeks truncated by the database.
+
+        :param day: date
+        :type day: date
+        :return: first day of the period
+        :rtype: date
+        """
+        if cls.period == 'week':
+            return day - timedelta(days=day.weekday())
+        return day.replace(day=1)
+
+    @staticmethod
+    def record(user_id, day, distance, time, sessions, sign=1):
+        """Add an entry's values to weekly and monthly rollups.
+
+        :param user_id: user id
+        :type user_id: int
+        :param day: date of the entry
+        :type day: date
+        :param distance: training distance
+        :type distance: Decimal
+        :param time: training time
+        :type time: int
+        :param sessions: number of sessions
+        :type sessions: int
+        :param sign: 1 to add the values, -1 to subtract them,
+            optional (default = 1)
+        :type sign: int
+        :return: None
+        """
+        for rollup in (WeeklyDiaryRollup, MonthlyDiaryRollup):
+            rollup.add(user_id, rollup.get_period_start(day),
+                       sign * distance, sign * time, sign * sessions)
+        return None
+
+    @staticmethod
+    def record_entries(entries):
+        """Add values of many new diary entries to rollups.
+
+        Entries are summed up per period first, so every affected
+        rollup is updated once.
+
+        :param entries: diary entries
+        :type entries: collections.Iterable[TrainingDiary]
+        :return: None
+        """
+        for rollup in (WeeklyDiaryRollup, MonthlyDiaryRollup):
+            periods = {}
+            for entry in entries:
+                user_id, day, distance, time, sessions = entry.get_totals()
+                key = (user_id, rollup.get_period_start(day))
+                totals = periods.get(key, (0, 0, 0))
+                periods[key] = (totals[0] + distance, totals[1] + time,
+                                totals[2] + sessions)
+            for (user_id, period_start), totals in periods.items():
+                rollup.add(user_id, period_start, *totals)
+        return None
+
+    @classmethod
+    def add(cls, user_id, period_start, distance, time, sessions):
+        """Add values to the rollup of a period, creating it if needed.
+
+        :param user_id: user id
+        :type user_id: int
+        :param period_start: first day of the period
+        :type period_start: date
+        :param distance: distance to add
+        :type distance: Decimal
+        :param time: time to add
+        :type time: int
+        :param sessions: number of sessions to add
+        :type sessions: int
+        :return: None
+        """
+        rollup = cls.objects.filter(user_id=user_id, period_start=period_start)
+        changes = {'total_distance': F('total_distance') + distance,
+                   'total_time': F('total_time') + time,
+                   'session_count': F('session_count') + sessions}
+        if rollup.update(**changes):
+            return None
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    user_id=user_id, period_start=period_start,
+                    total_distance=distance, total_time=time,
+                    session_count=sessions)
+        except IntegrityError as error:
+            if not cls.is_period_taken_error(error):
+                raise
+            # Created by a concurrent transaction in the meantime.
+            rollup.update(**changes)
+        return None
+
+    @classmethod
+    def is_period_taken_error(cls, error):
+        """Check if the error was raised by one rollup per period rule.
+
+        :param error: error raised by the database
+        :type error: IntegrityError
+        :return: True if the error was raised by the unique constraint
+            of the rollup
+        :rtype: bool
+        """
+        diag = getattr(error.__cause__, 'diag', None)
+        return getattr(diag, 'constraint_name', None) in {
+            constraint.name for constraint in cls._meta.constraints}
+
+    @classmethod
+    def rebuild(cls, users=None):
+        """Recalculate rollups from training diary entries.
+
+        :param users: users whose rollups are recalculated, optional
+            (default = None - all users)
+        :type users: QuerySet or None
+        :return: number of created rollups
+        :rtype: int
+        """
+        rollups = cls.objects.all()
+        entries = TrainingDiary.objects.all()
+        if users is not None:
+            rollups = rollups.filter(user__in=users)
+            entries = entries.filter(user__in=users)
+        periods = entries.annotate(
+            period=Trunc('date', cls.period)).order_by().values(
+            'user', 'period').annotate(
+            distance=Sum('training_distance'), time=Sum('training_time'),
+            sessions=Count('id'))
+        with transaction.atomic():
+            rollups.delete()
+            created = cls.objects.bulk_create(
+                cls(user_id=period['user'], period_start=period['period'],
+                    total_distance=period['distance'],
+                    total_time=period['time'],
+                    session_count=period['sessions'])
+                for period in periods.iterator())
+        return len(created)
+
+
+class WeeklyDiaryRollup(DiaryRollup):
+    """Stores training diary totals of a user in a week."""
+
+    period = 'week'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period_start'],
+                                    name='unique_weekly_diary_rollup'),
+        ]
+
+
+class MonthlyDiaryRollup(DiaryRollup):
+    """Stores training diary totals of a user in a month."""
+
+    period = 'month'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period_start'],
+                                    name='unique_monthly_diary_rollup'),
+        ]
+
+
+class Tombstone(models.Model):
+    """Stores deletion of a workout plan, training or diary entry.
+
+    Tombstones let clients synchronizing user's data remove deleted
+    objects, they are kept for TOMBSTONE_RETENTION.
+    """
+
+    WORKOUT_PLAN = 'workoutplan'
+    TRAINING = 'training'
+    TRAINING_DIARY = 'trainingdiary'
+    MODELS = (
+        (WORKOUT_PLAN, 'Workout plan'),
+        (TRAINING, 'Training'),
+        (TRAINING_DIARY, 'Training diary'),
+    )
+
+    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    model = models.CharField(max_length=16, choices=MODELS)
+    object_id = models.IntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'deleted_at'],
+                         name='tombstone_owner_deleted_idx'),
+        ]
+
+    @classmethod
+    def record(cls, owner_id, model, object_ids):
+        """Record deletion of objects with one query.
+
+        :param owner_id: id of the owner of deleted objects
+        :type owner_id: int
+        :param model: name of the model of deleted objects
+        :type model: str
+        :param object_ids: ids of deleted objects
+        :type object_ids: collections.Iterable
+        :return: None
+        """
+        now = timezone.now()
+        cls.objects.bulk_create([
+            cls(owner_id=owner_id, model=model, object_id=object_id,
+                deleted_at=now) for object_id in object_ids])
+        return None
+
+    @classmethod
+    def prune(cls):
+        """Delete tombstones older than TOMBSTONE_RETENTION.
+
+        :return: number of deleted tombstones
+        :rtype: int
+        """
+        return cls.objects.filter(
+            deleted_at__lt=timezone.now() - TOMBSTONE_RETENTION).delete()[0]
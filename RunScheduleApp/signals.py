@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from RunScheduleApp import active_plan_cache, calendar_cache
+from RunScheduleApp.models import WorkoutPlan
+
+
+@receiver(post_save, sender=WorkoutPlan)
+@receiver(post_delete, sender=WorkoutPlan)
+def invalidate_plan_calendar(sender, instance, **kwargs):
+    """Invalidate cached calendar after a workout plan is changed."""
+    calendar_cache.bump_version(instance.id)
+
+
+@receiver(post_save, sender=WorkoutPlan)
+@receiver(post_delete, sender=WorkoutPlan)
+def invalidate_active_plan(sender, instance, **kwargs):
+    """Invalidate cached active plan of the owner after a workout plan is
+    added, changed or deleted."""
+    active_plan_cache.plan_changed(instance.owner_id)
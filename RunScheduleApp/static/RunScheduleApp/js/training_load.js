@@ -0,0 +1,84 @@
+/*
+ * Line chart of training load metrics.
+ *
+ * Reads the data embedded by the training_load view and draws rolling
+ * 7 and 28 day volumes and the acute:chronic workload ratio of the
+ * selected measure as an SVG image.
+ */
+(function (document) {
+    'use strict';
+
+    var SVG_NS = 'http://www.w3.org/2000/svg';
+    var WIDTH = 900;
+    var HEIGHT = 300;
+    var MARGIN = 40;
+    var SERIES = [
+        {name: 'volume_7', label: '7 days volume', color: '#007bff', axis: 'volume'},
+        {name: 'volume_28', label: '28 days volume', color: '#6c757d', axis: 'volume'},
+        {name: 'acwr', label: 'Acute:chronic ratio', color: '#dc3545', axis: 'ratio'}
+    ];
+
+    function createElement(name, attributes) {
+        var element = document.createElementNS(SVG_NS, name);
+        Object.keys(attributes).forEach(function (key) {
+            element.setAttribute(key, attributes[key]);
+        });
+        return element;
+    }
+
+    function maximum(values) {
+        return values.reduce(function (result, value) {
+            return value !== null && value > result ? value : result;
+        }, 0) || 1;
+    }
+
+    function polyline(values, scale, color) {
+        var step = (WIDTH - 2 * MARGIN) / Math.max(values.length - 1, 1);
+        var points = [];
+        values.forEach(function (value, index) {
+            if (value !== null) {
+                points.push((MARGIN + index * step).toFixed(1) + ',' +
+                    (HEIGHT - MARGIN - value * scale).toFixed(1));
+            }
+        });
+        return createElement('polyline', {
+            points: points.join(' '), fill: 'none', stroke: color,
+            'stroke-width': 2
+        });
+    }
+
+    function drawChart(container, data, measure) {
+        var metrics = data.metrics[measure];
+        var svg = createElement('svg', {
+            viewBox: '0 0 ' + WIDTH + ' ' + HEIGHT, width: '100%'
+        });
+        var scales = {
+            volume: (HEIGHT - 2 * MARGIN) / maximum(metrics.volume_28.concat(metrics.volume_7)),
+            ratio: (HEIGHT - 2 * MARGIN) / maximum(metrics.acwr)
+        };
+        var first = createElement('text', {x: MARGIN, y: HEIGHT - 10});
+        var last = createElement('text', {x: WIDTH - MARGIN, y: HEIGHT - 10, 'text-anchor': 'end'});
+
+        first.textContent = data.dates[0];
+        last.textContent = data.dates[data.dates.length - 1];
+        svg.appendChild(first);
+        svg.appendChild(last);
+        SERIES.forEach(function (series, index) {
+            var label = createElement('text', {x: MARGIN + index * 200, y: 20, fill: series.color});
+            label.textContent = series.label;
+            svg.appendChild(label);
+            svg.appendChild(polyline(metrics[series.name], scales[series.axis], series.color));
+        });
+        container.innerHTML = '';
+        container.appendChild(svg);
+    }
+
+    var data = JSON.parse(document.getElementById('training_load_data').textContent);
+    var container = document.getElementById('training_load_chart');
+    var select = document.getElementById('training_load_measure');
+
+    select.addEventListener('change', function () {
+        drawChart(container, data, select.value);
+    });
+    drawChart(container, data, select.value);
+})(document);
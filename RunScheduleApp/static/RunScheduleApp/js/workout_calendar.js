@@ -0,0 +1,179 @@
+/*
+ * Client-side renderer of the monthly workout calendar.
+ *
+ * Draws the same table as WorkoutCalendar on the server from the JSON
+ * returned by the current_workout_json view:
+ *
+ *     renderWorkoutCalendar(document.getElementById('calendar'),
+ *                           '/workout/5/2019/json');
+ *
+ * On the current workout plan page, previous and next month links
+ * replace only the calendar instead of loading the whole page. The
+ * browser cache revalidates the response with its ETag, so loading an
+ * unchanged month again costs a 304.
+ */
+(function (window) {
+    'use strict';
+
+    var MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June',
+        'July', 'August', 'September', 'October', 'November', 'December'];
+    var DAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'];
+    var DAY_CLASSES = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun'];
+
+    function isoDate(year, month, day) {
+        return year + '-' + String(month).padStart(2, '0') + '-' +
+            String(day).padStart(2, '0');
+    }
+
+    function cellClass(data, weekday, dayDate, today, training) {
+        var cssClass = DAY_CLASSES[weekday];
+        if (dayDate === today) {
+            return cssClass + ' today';
+        }
+        if (dayDate === data.plan.start) {
+            return cssClass + ' plan_start_day';
+        }
+        if (dayDate === data.plan.end) {
+            return cssClass + ' plan_end_day';
+        }
+        return training ? cssClass + ' training_day' : cssClass;
+    }
+
+    function createCell(data, day, weekday, today) {
+        var cell = document.createElement('td');
+        var dayDate = isoDate(data.year, data.month, day);
+        var training = data.trainings[day];
+        var link = document.createElement('a');
+        cell.className = cellClass(data, weekday, dayDate, today, training);
+        link.textContent = day;
+        if (training) {
+            var info = document.createElement('div');
+            if (training[0] === null) {
+                // Day of a recurrence rule, saving the form stores it.
+                cell.className += ' rule_day';
+                link.href = data.urls.add.replace('{}', dayDate) + '?rule=' + training[3];
+            } else {
+                link.href = data.urls.edit.replace('{}', training[0]);
+            }
+            info.className = 'training_info';
+            info.textContent = training[1];
+            link.appendChild(document.createElement('br'));
+            link.appendChild(info);
+        } else {
+            link.href = data.urls.add.replace('{}', dayDate);
+        }
+        cell.appendChild(link);
+        return cell;
+    }
+
+    function buildTable(data) {
+        var table = document.createElement('table');
+        var header = table.insertRow();
+        var names = table.insertRow();
+        var firstWeekday = (new Date(data.year, data.month - 1, 1).getDay() + 6) % 7;
+        var daysInMonth = new Date(data.year, data.month, 0).getDate();
+        var now = new Date();
+        var today = isoDate(now.getFullYear(), now.getMonth() + 1, now.getDate());
+        var row = null;
+        var title = document.createElement('th');
+
+        table.id = 'fixedheight';
+        table.style.tableLayout = 'fixed';
+        table.className = 'month table calendar';
+        title.colSpan = 7;
+        title.className = 'month';
+        title.textContent = MONTH_NAMES[data.month - 1] + ' ' + data.year;
+        header.appendChild(title);
+        DAY_NAMES.forEach(function (name, weekday) {
+            var cell = document.createElement('th');
+            cell.className = DAY_CLASSES[weekday];
+            cell.textContent = name;
+            names.appendChild(cell);
+        });
+
+        for (var slot = 0; slot < firstWeekday + daysInMonth; slot++) {
+            var weekday = slot % 7;
+            var day = slot - firstWeekday + 1;
+            if (weekday === 0) {
+                row = table.insertRow();
+            }
+            if (day < 1) {
+                var empty = document.createElement('td');
+                empty.className = 'noday';
+                empty.innerHTML = '&nbsp;';
+                row.appendChild(empty);
+            } else {
+                row.appendChild(createCell(data, day, weekday, today));
+            }
+        }
+        while (row && row.cells.length < 7) {
+            var filler = document.createElement('td');
+            filler.className = 'noday';
+            filler.innerHTML = '&nbsp;';
+            row.appendChild(filler);
+        }
+        return table;
+    }
+
+    window.renderWorkoutCalendar = function (container, url) {
+        return fetch(url, {credentials: 'same-origin'})
+            .then(function (response) {
+                return response.json();
+            })
+            .then(function (data) {
+                container.innerHTML = '';
+                if (data.plan) {
+                    container.appendChild(buildTable(data));
+                }
+                return data;
+            });
+    };
+
+    function updateLink(container, urls) {
+        var link = container.querySelector('.calendar_nav');
+        container.hidden = !urls;
+        if (urls) {
+            link.href = urls.page;
+            link.setAttribute('data-json', urls.json);
+        }
+    }
+
+    function showMonth(calendar, url) {
+        return window.renderWorkoutCalendar(calendar, url).then(function (data) {
+            calendar.setAttribute('data-json', url);
+            if (data.plan) {
+                updateLink(document.getElementById('calendar_prev'), data.urls.prev);
+                updateLink(document.getElementById('calendar_next'), data.urls.next);
+            }
+            return data;
+        });
+    }
+
+    function initNavigation() {
+        var calendar = document.getElementById('workout_calendar');
+        if (!calendar || !window.fetch || !window.history.pushState) {
+            return;
+        }
+        window.history.replaceState({json: calendar.getAttribute('data-json')}, '');
+        ['calendar_prev', 'calendar_next'].forEach(function (id) {
+            var link = document.getElementById(id).querySelector('.calendar_nav');
+            link.addEventListener('click', function (event) {
+                var page = link.href;
+                var json = link.getAttribute('data-json');
+                event.preventDefault();
+                showMonth(calendar, json).then(function () {
+                    window.history.pushState({json: json}, '', page);
+                }).catch(function () {
+                    window.location = page;
+                });
+            });
+        });
+        window.addEventListener('popstate', function (event) {
+            if (event.state && event.state.json) {
+                showMonth(calendar, event.state.json);
+            }
+        });
+    }
+
+    initNavigation();
+})(window);
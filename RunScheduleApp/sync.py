@@ -0,0 +1,101 @@
+"""Delta synchronization of user's workout plans, trainings and diary.
+
+Workout plans, trainings and diary entries store their modification
+time in an indexed updated_at column, deletions are stored as
+tombstones. A client sends the token returned by its previous sync and
+gets only objects changed and ids of objects deleted after it, which
+are read with index range scans. Without a token, or with a token
+older than tombstones are kept, the client gets all its objects.
+
+Modification times are set before transactions commit, so a change
+committed right after a sync may carry a time before its token. Tokens
+therefore point SYNC_OVERLAP before the sync, objects changed in that
+window are sent again and clients have to treat changes as upserts.
+
+Recurrence rules are not synchronized. Every change of plan's rules
+updates the plan, so clients reload rules of changed plans from the
+rules endpoint of the API.
+"""
+
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from RunScheduleApp.models import TOMBSTONE_RETENTION, Tombstone, Training
+from RunScheduleApp.models import TrainingDiary, WorkoutPlan
+
+SYNC_OVERLAP = timedelta(seconds=60)
+COLLECTIONS = (
+    ('plans', Tombstone.WORKOUT_PLAN),
+    ('trainings', Tombstone.TRAINING),
+    ('diary', Tombstone.TRAINING_DIARY),
+)
+
+
+class SyncError(Exception):
+    """Raised when a sync token is invalid."""
+
+
+def make_token(sync_time):
+    """Create the token of a sync.
+
+    :param sync_time: time of the sync
+    :type sync_time: datetime
+    :return: token
+    :rtype: str
+    """
+    return str(int((sync_time - SYNC_OVERLAP).timestamp() * 1000000))
+
+
+def read_token(token):
+    """Read the time of changes already synchronized from a token.
+
+    :param token: token of the previous sync
+    :type token: str
+    :raises SyncError: if the token is invalid
+    :return: time of changes already synchronized
+    :rtype: datetime
+    """
+    try:
+        return datetime.fromtimestamp(int(token) / 1000000, timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        raise SyncError('Invalid sync token')
+
+
+def get_changes(user, since, fields):
+    """Get user's objects changed and deleted after a given time.
+
+    :param user: owner of synchronized objects
+    :type user: User
+    :param since: time of changes already synchronized or None for all
+        objects
+    :type since: datetime or None
+    :param fields: names of returned fields of plans, trainings and
+        diary entries, by collection name
+    :type fields: dict
+    :return: token of the sync, whether all objects are returned,
+        values of changed objects and ids of deleted objects
+    :rtype: dict
+    """
+    sync_time = timezone.now()
+    full = since is None or since < sync_time - TOMBSTONE_RETENTION
+    querysets = {
+        'plans': WorkoutPlan.objects.filter(owner=user),
+        'trainings': Training.objects.filter(workout_plan__owner=user),
+        'diary': TrainingDiary.objects.filter(user=user),
+    }
+    changes = {'token': make_token(sync_time), 'full': full, 'deleted': {}}
+    for name, queryset in querysets.items():
+        if not full:
+            queryset = queryset.filter(updated_at__gte=since)
+        changes[name] = list(
+            queryset.order_by('id').values(*fields[name]))
+    if not full:
+        deleted = {name: [] for name, model in COLLECTIONS}
+        names = {model: name for name, model in COLLECTIONS}
+        for model, object_id in Tombstone.objects.filter(
+                owner=user, deleted_at__gte=since).order_by(
+                    'id').values_list('model', 'object_id'):
+            deleted[names[model]].append(object_id)
+        changes['deleted'] = deleted
+    return changes
@@ -1,9 +1,11 @@
 from datetime import timedelta, date
 
+from django.contrib.auth.models import User
+from django.db import IntegrityError
 from django.test import TestCase
 
-from RunScheduleApp.forms import DiaryEntryForm, DatePicker
-from RunScheduleApp.models import TrainingDiary
+from RunScheduleApp.forms import DiaryEntryForm, DatePicker, TrainingForm
+from RunScheduleApp.models import Training, TrainingDiary, WorkoutPlan
 
 
 class DiaryEntryFormTest(TestCase):
@@ -66,3 +68,60 @@ class DiaryEntryFormTest(TestCase):
         self.assertTrue(form.is_valid())
         form.data['date'] = date_in_past
         self.assertTrue(form.is_valid())
+
+
+class TrainingFormTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='form user', password='test')
+        workout_plan = WorkoutPlan.objects.create(
+            name='form plan', date_range=["2019-03-01", "2019-04-30"],
+            owner=user)
+        Training.objects.create(day='2019-03-05', training_main='easy run',
+                                workout_plan=workout_plan)
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='form plan')
+
+    def test_form_validation_does_not_query_database(self):
+        form = TrainingForm(data={'day': '2019-03-06', 'training_main': 'run'},
+                            workout_plan=self.workout_plan)
+        with self.assertNumQueries(0):
+            self.assertTrue(form.is_valid())
+
+    def test_form_validation_date_outside_plan(self):
+        for day in ['2019-02-28', '2019-05-01']:
+            form = TrainingForm(data={'day': day, 'training_main': 'run'},
+                                workout_plan=self.workout_plan)
+            self.assertFalse(form.is_valid())
+            self.assertIn('day', form.errors)
+
+    def test_form_saves_training_in_workout_plan(self):
+        form = TrainingForm(data={'day': '2019-03-06', 'training_main': 'run'},
+                            workout_plan=self.workout_plan)
+        self.assertTrue(form.is_valid())
+        training = form.save()
+        self.assertEqual(training.workout_plan, self.workout_plan)
+
+    def test_form_reports_error_for_day_already_taken(self):
+        form = TrainingForm(data={'day': '2019-03-05', 'training_main': 'run'},
+                            workout_plan=self.workout_plan)
+        self.assertTrue(form.is_valid())
+        self.assertIsNone(form.save())
+        self.assertIn('day', form.errors)
+        self.assertEqual(Training.objects.filter(day='2019-03-05').count(), 1)
+
+    def test_form_allows_editing_training_without_changing_day(self):
+        training = Training.objects.get(day='2019-03-05')
+        form = TrainingForm(data={'day': '2019-03-05',
+                                  'training_main': 'long'},
+                            instance=training, workout_plan=self.workout_plan)
+        self.assertTrue(form.is_valid())
+        self.assertIsNotNone(form.save())
+        self.assertEqual(Training.objects.get(pk=training.pk).training_main,
+                         'long')
+
+    def test_database_rejects_second_training_on_the_same_day(self):
+        with self.assertRaises(IntegrityError):
+            Training.objects.create(day='2019-03-05', training_main='run',
+                                    workout_plan=self.workout_plan)
@@ -1,7 +1,15 @@
+from datetime import date
+from decimal import Decimal
+
+from django.core.cache import cache
 from django.test import TestCase
 from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.http import Http404
 
 from RunScheduleApp.models import Training, WorkoutPlan, TrainingDiary
+from RunScheduleApp.models import MonthlyDiaryRollup, WeeklyDiaryRollup
+from RunScheduleApp.models import RecurrenceRule, Tombstone
 
 
 class TrainingModelTest(TestCase):
@@ -18,14 +26,14 @@ class TrainingModelTest(TestCase):
             time_additional=10)
 
     def test_creating_training_info(self):
-        training = Training.objects.get(id=1)
+        training = Training.objects.get(training_main='test main')
         expected = f'{training.training_main} {training.distance_main}km ' \
             f'{training.time_main}min {training.training_additional} ' \
             f'{training.distance_additional}km {training.time_additional}min'
         self.assertEqual(expected, training.training_info())
 
     def test_object_name_is_training_info(self):
-        training = Training.objects.get(id=1)
+        training = Training.objects.get(training_main='test main')
         self.assertEqual(training.training_info(), str(training))
 
 
@@ -77,3 +85,578 @@ class TrainingDiaryModelTest(TestCase):
         self.assertEqual(max_length, 256)
         self.assertTrue(model_field.null)
         self.assertTrue(model_field.blank)
+
+
+class DiaryRollupTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='rollup user',
+                                            password='test')
+        TrainingDiary.objects.create(
+            training_info='first', training_distance=10, training_time=60,
+            user=cls.user, date='2019-03-04')
+        TrainingDiary.objects.create(
+            training_info='second', training_distance=5.5, training_time=30,
+            user=cls.user, date='2019-03-10')
+        TrainingDiary.objects.create(
+            training_info='third', training_distance=8, training_time=45,
+            user=cls.user, date='2019-03-11')
+
+    def get_totals(self, rollup, period_start):
+        rollup = rollup.objects.get(user=self.user, period_start=period_start)
+        return rollup.total_distance, rollup.total_time, rollup.session_count
+
+    def test_rollups_updated_when_entry_created(self):
+        self.assertEqual(self.get_totals(WeeklyDiaryRollup, date(2019, 3, 4)),
+                         (Decimal('15.5'), 90, 2))
+        self.assertEqual(self.get_totals(WeeklyDiaryRollup, date(2019, 3, 11)),
+                         (Decimal('8.0'), 45, 1))
+        self.assertEqual(self.get_totals(MonthlyDiaryRollup, date(2019, 3, 1)),
+                         (Decimal('23.5'), 135, 3))
+
+    def test_rollups_updated_when_entry_moved_to_other_month(self):
+        entry = TrainingDiary.objects.get(training_info='third')
+        entry.date = date(2019, 4, 2)
+        entry.training_distance = 12
+        entry.save()
+        self.assertEqual(self.get_totals(WeeklyDiaryRollup, date(2019, 3, 11)),
+                         (Decimal('0.0'), 0, 0))
+        self.assertEqual(self.get_totals(MonthlyDiaryRollup, date(2019, 3, 1)),
+                         (Decimal('15.5'), 90, 2))
+        self.assertEqual(self.get_totals(MonthlyDiaryRollup, date(2019, 4, 1)),
+                         (Decimal('12.0'), 45, 1))
+
+    def test_rollups_updated_when_entry_deleted(self):
+        TrainingDiary.objects.get(training_info='first').delete()
+        self.assertEqual(self.get_totals(MonthlyDiaryRollup, date(2019, 3, 1)),
+                         (Decimal('13.5'), 75, 2))
+
+    def test_saving_outdated_entry_does_not_skew_rollups(self):
+        entry = TrainingDiary.objects.get(training_info='third')
+        outdated = TrainingDiary.objects.get(training_info='third')
+        entry.training_time = 50
+        entry.save()
+        outdated.training_time = 55
+        outdated.save()
+        self.assertEqual(self.get_totals(WeeklyDiaryRollup, date(2019, 3, 11)),
+                         (Decimal('8.0'), 55, 1))
+        entry.delete()
+        outdated.delete()
+        self.assertEqual(self.get_totals(WeeklyDiaryRollup, date(2019, 3, 11)),
+                         (Decimal('0.0'), 0, 0))
+
+    def test_negative_totals_of_missing_rollup_are_not_swallowed(self):
+        with self.assertRaises(IntegrityError):
+            WeeklyDiaryRollup.add(self.user.id, date(2019, 5, 6),
+                                  Decimal(-5), -30, -1)
+
+    def test_period_start_follows_period_of_rollup(self):
+        self.assertEqual(WeeklyDiaryRollup.get_period_start(date(2019, 3, 10)),
+                         date(2019, 3, 4))
+        self.assertEqual(
+            MonthlyDiaryRollup.get_period_start(date(2019, 3, 10)),
+            date(2019, 3, 1))
+
+    def test_rebuild_recalculates_rollups(self):
+        MonthlyDiaryRollup.objects.update(total_distance=0, session_count=0)
+        WeeklyDiaryRollup.objects.all().delete()
+        self.assertEqual(WeeklyDiaryRollup.rebuild(), 2)
+        self.assertEqual(MonthlyDiaryRollup.rebuild(), 1)
+        self.assertEqual(self.get_totals(WeeklyDiaryRollup, date(2019, 3, 4)),
+                         (Decimal('15.5'), 90, 2))
+        self.assertEqual(self.get_totals(MonthlyDiaryRollup, date(2019, 3, 1)),
+                         (Decimal('23.5'), 135, 3))
+
+
+class WorkoutPlanModelTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='plan user', password='test')
+        other_user = User.objects.create_user(username='other plan user',
+                                              password='test')
+        WorkoutPlan.objects.create(
+            name='active plan', date_range=["2018-01-01", "2018-01-31"],
+            owner=user, is_active=True)
+        WorkoutPlan.objects.create(
+            name='inactive plan', date_range=["2018-01-01", "2018-01-31"],
+            owner=user)
+        WorkoutPlan.objects.create(
+            name='other user plan', date_range=["2018-01-01", "2018-01-31"],
+            owner=other_user, is_active=True)
+
+    def setUp(self):
+        self.user = User.objects.get(username='plan user')
+        cache.clear()
+
+    def test_get_active_uses_single_query(self):
+        with self.assertNumQueries(1):
+            workout_plan = WorkoutPlan.get_active(self.user)
+        self.assertEqual(workout_plan.name, 'active plan')
+
+    def test_get_active_reads_plan_from_cache(self):
+        workout_plan = WorkoutPlan.get_active(self.user)
+        with self.assertNumQueries(0):
+            cached_plan = WorkoutPlan.get_active(self.user)
+            self.assertEqual(cached_plan, workout_plan)
+            self.assertEqual(cached_plan.name, 'active plan')
+            self.assertEqual(cached_plan.owner_id, self.user.pk)
+            self.assertTrue(cached_plan.is_active)
+            self.assertEqual(cached_plan.get_start_and_end_date(),
+                             workout_plan.get_start_and_end_date())
+
+    def test_cached_active_plan_invalidated_when_plan_changes(self):
+        workout_plan = WorkoutPlan.get_active(self.user)
+        workout_plan.name = 'renamed plan'
+        workout_plan.save()
+        self.assertEqual(WorkoutPlan.get_active(self.user).name,
+                         'renamed plan')
+        workout_plan.delete()
+        self.assertIsNone(WorkoutPlan.get_active(self.user))
+
+    def test_get_active_returns_none_without_active_plan(self):
+        WorkoutPlan.objects.filter(owner=self.user).update(is_active=False)
+        self.assertIsNone(WorkoutPlan.get_active(self.user))
+
+    def test_set_active_switches_active_plan(self):
+        new_plan = WorkoutPlan.objects.get(name='inactive plan')
+        WorkoutPlan.get_active(self.user)
+        WorkoutPlan.set_active(new_plan.id, self.user)
+        self.assertEqual(WorkoutPlan.get_active(self.user), new_plan)
+        self.assertEqual(WorkoutPlan.objects.filter(
+            owner=self.user, is_active=True).count(), 1)
+        self.assertTrue(WorkoutPlan.objects.get(
+            name='other user plan').is_active)
+
+    def test_set_active_checks_owner_of_the_plan(self):
+        other_user_plan = WorkoutPlan.objects.get(name='other user plan')
+        with self.assertRaises(Http404):
+            WorkoutPlan.set_active(other_user_plan.id, self.user)
+        self.assertEqual(WorkoutPlan.get_active(self.user).name,
+                         'active plan')
+
+    def test_database_rejects_second_active_plan(self):
+        with self.assertRaises(IntegrityError):
+            WorkoutPlan.objects.create(
+                name='second active plan',
+                date_range=["2018-01-01", "2018-01-31"], owner=self.user,
+                is_active=True)
+
+
+class WorkoutPlanQuerySetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='range user',
+                                        password='test')
+        WorkoutPlan.objects.create(
+            name='january plan', date_range=["2018-01-01", "2018-01-31"],
+            owner=user)
+        WorkoutPlan.objects.create(
+            name='february plan', date_range=["2018-02-01", "2018-02-28"],
+            owner=user)
+
+    def plan_names(self, queryset):
+        return set(queryset.values_list('name', flat=True))
+
+    def test_covering_includes_first_and_last_day_of_plan(self):
+        self.assertEqual(
+            self.plan_names(WorkoutPlan.objects.covering(date(2018, 1, 1))),
+            {'january plan'})
+        self.assertEqual(
+            self.plan_names(WorkoutPlan.objects.covering(date(2018, 1, 31))),
+            {'january plan'})
+        self.assertEqual(
+            self.plan_names(WorkoutPlan.objects.covering(date(2017, 12, 31))),
+            set())
+
+    def test_overlapping(self):
+        queryset = WorkoutPlan.objects.overlapping(date(2018, 1, 31),
+                                                   date(2018, 2, 1))
+        self.assertEqual(self.plan_names(queryset),
+                         {'january plan', 'february plan'})
+        queryset = WorkoutPlan.objects.overlapping(date(2018, 3, 1),
+                                                   date(2018, 3, 31))
+        self.assertEqual(self.plan_names(queryset), set())
+
+
+class WorkoutPlanAggregatesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='totals user',
+                                        password='test')
+        WorkoutPlan.objects.create(
+            name='totals plan', date_range=["2018-01-01", "2018-01-31"],
+            owner=user)
+        WorkoutPlan.objects.create(
+            name='second totals plan', date_range=["2018-01-01", "2018-01-31"],
+            owner=user)
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='totals plan')
+
+    def assertTotals(self, distance, time, count, accomplished):
+        workout_plan = WorkoutPlan.objects.get(pk=self.workout_plan.pk)
+        self.assertEqual(
+            (workout_plan.total_distance, workout_plan.total_time,
+             workout_plan.training_count, workout_plan.accomplished_count),
+            (Decimal(distance), time, count, accomplished))
+
+    def create_training(self, day, **kwargs):
+        return Training.objects.create(
+            day=day, training_main='run', workout_plan=self.workout_plan,
+            **kwargs)
+
+    def test_creating_trainings_updates_totals(self):
+        self.create_training('2018-01-02', distance_main=Decimal('10.5'),
+                             time_main=60)
+        self.create_training('2018-01-03', distance_main=5,
+                             distance_additional=1, time_additional=20)
+        self.assertTotals('16.5', 80, 2, 0)
+
+    def test_editing_and_accomplishing_training_updates_totals(self):
+        self.create_training('2018-01-02', distance_main=10, time_main=60)
+        training = Training.objects.get(day='2018-01-02')
+        training.distance_main = 12
+        training.time_main = None
+        training.accomplished = True
+        training.save()
+        self.assertTotals('12', 0, 1, 1)
+
+    def test_deleting_training_updates_totals(self):
+        self.create_training('2018-01-02', distance_main=10, time_main=60)
+        self.create_training('2018-01-03', distance_main=5, time_main=30)
+        Training.objects.get(day='2018-01-02').delete()
+        self.assertTotals('5', 30, 1, 0)
+
+    def test_saving_outdated_training_does_not_skew_totals(self):
+        self.create_training('2018-01-02', distance_main=10, time_main=60)
+        training = Training.objects.get(day='2018-01-02')
+        outdated = Training.objects.get(day='2018-01-02')
+        training.time_main = 70
+        training.save()
+        outdated.time_main = 80
+        outdated.save()
+        self.assertTotals('10', 80, 1, 0)
+        training.delete()
+        outdated.delete()
+        self.assertTotals('0', 0, 0, 0)
+
+    def test_moving_training_to_other_plan_updates_both_plans(self):
+        training = self.create_training('2018-01-02', distance_main=10)
+        other_plan = WorkoutPlan.objects.get(name='second totals plan')
+        training.workout_plan = other_plan
+        training.save()
+        self.assertTotals('0', 0, 0, 0)
+        self.assertEqual(WorkoutPlan.objects.get(
+            pk=other_plan.pk).training_count, 1)
+
+    def test_saving_plan_does_not_overwrite_totals(self):
+        workout_plan = WorkoutPlan.objects.get(pk=self.workout_plan.pk)
+        self.create_training('2018-01-02', distance_main=10)
+        workout_plan.name = 'renamed plan'
+        workout_plan.save()
+        self.assertTotals('10', 0, 1, 0)
+
+    def test_rebuild_aggregates(self):
+        self.create_training('2018-01-02', distance_main=10, time_main=60,
+                             accomplished=True)
+        self.create_training('2018-01-03', distance_additional=2)
+        WorkoutPlan.objects.update(total_distance=0, total_time=0,
+                                   training_count=0, accomplished_count=0)
+        WorkoutPlan.rebuild_aggregates()
+        self.assertTotals('12', 60, 2, 1)
+
+
+class WorkoutPlanCloneTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='clone user', password='test')
+        workout_plan = WorkoutPlan.objects.create(
+            name='spring block', date_range=["2019-03-01", "2019-03-31"],
+            owner=user, is_active=True)
+        Training.objects.create(day='2019-03-01', training_main='easy',
+                                distance_main=8, time_main=45,
+                                workout_plan=workout_plan, accomplished=True)
+        Training.objects.create(day='2019-03-15', training_main='long',
+                                distance_main=20, time_main=110,
+                                workout_plan=workout_plan)
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='spring block')
+
+    def test_clone_shifts_plan_and_trainings(self):
+        copy = self.workout_plan.clone(date(2020, 3, 2), 'next spring')
+        copy.refresh_from_db()
+        self.assertEqual(copy.name, 'next spring')
+        self.assertEqual(copy.get_start_and_end_date(),
+                         (date(2020, 3, 2), date(2020, 4, 1)))
+        self.assertFalse(copy.is_active)
+        trainings = copy.training_set.order_by('day')
+        self.assertEqual([t.day for t in trainings],
+                         [date(2020, 3, 2), date(2020, 3, 16)])
+        self.assertFalse(any(t.accomplished for t in trainings))
+        self.assertEqual(self.workout_plan.training_set.count(), 2)
+
+    def test_clone_sets_aggregates(self):
+        copy = self.workout_plan.clone(date(2020, 3, 2))
+        copy.refresh_from_db()
+        self.assertEqual(copy.name, 'spring block')
+        self.assertEqual(copy.total_distance, Decimal('28.0'))
+        self.assertEqual(copy.total_time, 155)
+        self.assertEqual(copy.training_count, 2)
+        self.assertEqual(copy.accomplished_count, 0)
+
+    def test_clone_uses_constant_number_of_queries(self):
+        # trainings, rules, savepoint, plan insert, bulk insert, savepoint
+        with self.assertNumQueries(6):
+            self.workout_plan.clone(date(2020, 3, 2))
+
+    def test_clone_copies_recurrence_rules(self):
+        RecurrenceRule.objects.create(
+            workout_plan=self.workout_plan, weekdays=[1, 3], interval=1,
+            start_date=date(2019, 3, 4), end_date=date(2019, 3, 17),
+            training_main='easy')
+        # Repeated every two weeks, cannot move by 367 days.
+        RecurrenceRule.objects.create(
+            workout_plan=self.workout_plan, weekdays=[6], interval=2,
+            start_date=date(2019, 3, 1), end_date=date(2019, 3, 31),
+            training_main='long run', distance_main=18)
+        copy = self.workout_plan.clone(date(2020, 3, 2))
+        rule = copy.recurrencerule_set.get()
+        self.assertEqual((rule.weekdays, rule.start_date, rule.end_date),
+                         ([4, 6], date(2020, 3, 5), date(2020, 3, 18)))
+        trainings = copy.training_set.filter(training_main='long run')
+        self.assertEqual([t.day for t in trainings.order_by('day')],
+                         [date(2020, 3, 4), date(2020, 3, 18),
+                          date(2020, 4, 1)])
+        copy.refresh_from_db()
+        self.assertEqual(copy.training_count, 5)
+        self.assertEqual(copy.total_distance, Decimal('82.0'))
+        self.assertEqual(copy.rule_count, 1)
+        self.assertEqual(self.workout_plan.recurrencerule_set.count(), 2)
+
+
+class WorkoutPlanShiftTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='shift user', password='test')
+        workout_plan = WorkoutPlan.objects.create(
+            name='summer block', date_range=["2019-06-01", "2019-06-30"],
+            owner=user)
+        for day, distance in (('2019-06-01', 8), ('2019-06-02', 10),
+                              ('2019-06-03', 12), ('2019-06-10', 20)):
+            Training.objects.create(day=day, training_main='run',
+                                    distance_main=distance, time_main=60,
+                                    workout_plan=workout_plan)
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='summer block')
+
+    def get_days(self):
+        return list(self.workout_plan.training_set.order_by('day')
+                    .values_list('day', flat=True))
+
+    def test_shift_moves_whole_plan(self):
+        # Every training moves onto the day of the next one.
+        self.assertEqual(self.workout_plan.shift(1), 4)
+        self.assertEqual(self.get_days(),
+                         [date(2019, 6, 2), date(2019, 6, 3),
+                          date(2019, 6, 4), date(2019, 6, 11)])
+        self.workout_plan.refresh_from_db()
+        self.assertEqual(self.workout_plan.get_start_and_end_date(),
+                         (date(2019, 6, 2), date(2019, 7, 1)))
+
+    def test_shift_moves_trainings_from_date(self):
+        self.assertEqual(self.workout_plan.shift(-6, date(2019, 6, 10)), 1)
+        self.assertEqual(self.get_days(), [date(2019, 6, 1), date(2019, 6, 2),
+                                           date(2019, 6, 3), date(2019, 6, 4)])
+        self.workout_plan.refresh_from_db()
+        self.assertEqual(self.workout_plan.get_start_and_end_date(),
+                         (date(2019, 6, 1), date(2019, 6, 24)))
+
+    def test_shift_from_last_day_extends_plan(self):
+        Training.objects.create(day='2019-06-30', training_main='race',
+                                workout_plan=self.workout_plan)
+        self.assertEqual(self.workout_plan.shift(2, date(2019, 6, 30)), 1)
+        self.assertEqual(self.get_days()[-1], date(2019, 7, 2))
+        self.workout_plan.refresh_from_db()
+        self.assertEqual(self.workout_plan.get_start_and_end_date(),
+                         (date(2019, 6, 1), date(2019, 7, 2)))
+
+    def test_shift_onto_taken_day_raises_error(self):
+        with self.assertRaises(IntegrityError):
+            self.workout_plan.shift(-1, date(2019, 6, 2))
+        self.assertEqual(self.get_days(),
+                         [date(2019, 6, 1), date(2019, 6, 2),
+                          date(2019, 6, 3), date(2019, 6, 10)])
+
+    def test_shift_deletes_range_first(self):
+        moved = self.workout_plan.shift(-2, date(2019, 6, 3),
+                                        (date(2019, 6, 1), date(2019, 6, 2)))
+        self.assertEqual(moved, 2)
+        self.assertEqual(self.get_days(), [date(2019, 6, 1), date(2019, 6, 8)])
+        self.workout_plan.refresh_from_db()
+        self.assertEqual(self.workout_plan.total_distance, Decimal('32.0'))
+        self.assertEqual(self.workout_plan.training_count, 2)
+
+    def test_shift_moves_recurrence_rules(self):
+        rule = RecurrenceRule.objects.create(
+            workout_plan=self.workout_plan, weekdays=[5], interval=1,
+            start_date=date(2019, 6, 15), end_date=date(2019, 6, 29),
+            training_main='tempo', distance_main=10, time_main=50)
+        self.workout_plan.shift(7, date(2019, 6, 5))
+        rule.refresh_from_db()
+        self.assertEqual((rule.start_date, rule.end_date),
+                         (date(2019, 6, 22), date(2019, 7, 6)))
+
+    def test_shift_moves_weekdays_of_recurrence_rules(self):
+        rule = RecurrenceRule.objects.create(
+            workout_plan=self.workout_plan, weekdays=[1, 6], interval=1,
+            start_date=date(2019, 6, 11), end_date=date(2019, 6, 23),
+            training_main='tempo')
+        self.workout_plan.shift(2)
+        rule.refresh_from_db()
+        self.assertEqual((rule.weekdays, rule.start_date, rule.end_date),
+                         ([1, 3], date(2019, 6, 13), date(2019, 6, 25)))
+        self.assertEqual(
+            list(rule.get_days(rule.start_date, rule.end_date)),
+            [date(2019, 6, 13), date(2019, 6, 18), date(2019, 6, 20),
+             date(2019, 6, 25)])
+
+    def test_shift_splits_rule_lasting_on_from_date(self):
+        rule = RecurrenceRule.objects.create(
+            workout_plan=self.workout_plan, weekdays=[2], interval=1,
+            start_date=date(2019, 6, 5), end_date=date(2019, 6, 26),
+            training_main='tempo')
+        self.workout_plan.shift(1, date(2019, 6, 15))
+        rules = self.workout_plan.recurrencerule_set.order_by('start_date')
+        self.assertEqual(
+            [(r.weekdays, r.start_date, r.end_date) for r in rules],
+            [([2], date(2019, 6, 5), date(2019, 6, 14)),
+             ([3], date(2019, 6, 16), date(2019, 6, 27))])
+        days = RecurrenceRule.expand(rules, date(2019, 6, 1),
+                                     date(2019, 6, 30))
+        self.assertEqual(sorted(days), [date(2019, 6, 5), date(2019, 6, 12),
+                                        date(2019, 6, 20), date(2019, 6, 27)])
+        self.assertEqual(rules[1].id, rule.id)
+        self.workout_plan.refresh_from_db()
+        self.assertEqual(self.workout_plan.rule_count, 2)
+
+    def test_shift_stores_days_of_rules_which_cannot_move(self):
+        RecurrenceRule.objects.create(
+            workout_plan=self.workout_plan, weekdays=[4], interval=2,
+            start_date=date(2019, 6, 7), end_date=date(2019, 6, 28),
+            training_main='intervals', distance_main=6, time_main=40)
+        # 14 June is in a skipped week, 21 June is moved.
+        self.assertEqual(self.workout_plan.shift(3, date(2019, 6, 14)), 1)
+        rule = self.workout_plan.recurrencerule_set.get()
+        self.assertEqual((rule.start_date, rule.end_date),
+                         (date(2019, 6, 7), date(2019, 6, 13)))
+        self.assertEqual(list(self.workout_plan.training_set.filter(
+            training_main='intervals').values_list('day', flat=True)),
+            [date(2019, 6, 24)])
+        self.workout_plan.refresh_from_db()
+        self.assertEqual(self.workout_plan.training_count, 5)
+
+
+class TombstoneTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='sync user', password='test')
+        workout_plan = WorkoutPlan.objects.create(
+            name='autumn block', date_range=["2019-09-01", "2019-09-30"],
+            owner=user)
+        for day in ('2019-09-01', '2019-09-02'):
+            training = Training.objects.create(
+                day=day, training_main='run', distance_main=10, time_main=60,
+                workout_plan=workout_plan)
+        TrainingDiary.objects.create(
+            date='2019-09-02', training_info='run', training_distance=10,
+            training_time=60, user=user, training=training)
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='autumn block')
+        self.entry = TrainingDiary.objects.get()
+
+    def get_tombstones(self):
+        return list(Tombstone.objects.order_by('id').values_list(
+            'owner_id', 'model', 'object_id'))
+
+    def test_training_delete_records_tombstone(self):
+        training_id = self.entry.training_id
+        self.entry.training.delete()
+        self.assertEqual(self.get_tombstones(), [
+            (self.workout_plan.owner_id, Tombstone.TRAINING, training_id)])
+
+    def test_training_delete_changes_linked_diary_entry(self):
+        updated_at = self.entry.updated_at
+        self.entry.training.delete()
+        self.entry.refresh_from_db()
+        self.assertIsNone(self.entry.training)
+        self.assertGreater(self.entry.updated_at, updated_at)
+
+    def test_diary_entry_delete_records_tombstone(self):
+        entry_id = self.entry.id
+        self.entry.delete()
+        self.assertEqual(self.get_tombstones(), [
+            (self.entry.user_id, Tombstone.TRAINING_DIARY, entry_id)])
+
+    def test_plan_delete_records_only_plan(self):
+        plan_id = self.workout_plan.id
+        self.workout_plan.delete()
+        self.assertEqual(self.get_tombstones(), [
+            (self.entry.user_id, Tombstone.WORKOUT_PLAN, plan_id)])
+
+    def test_shift_records_deleted_trainings(self):
+        ids = set(self.workout_plan.training_set.values_list('id', flat=True))
+        self.workout_plan.shift(1, delete_range=(date(2019, 9, 1),
+                                                 date(2019, 9, 2)))
+        self.assertEqual({object_id for owner_id, model, object_id
+                          in self.get_tombstones()}, ids)
+
+    def test_bulk_update_changes_modification_time(self):
+        training = self.workout_plan.training_set.get(day='2019-09-01')
+        self.workout_plan.shift(1, date(2019, 9, 1))
+        moved = Training.objects.get(pk=training.pk)
+        self.assertGreater(moved.updated_at, training.updated_at)
+
+
+class RecurrenceRuleTest(TestCase):
+    def test_rules_counted_in_workout_plan(self):
+        user = User.objects.create_user(username='rule user', password='test')
+        workout_plan = WorkoutPlan.objects.create(
+            name='rules', date_range=["2019-03-01", "2019-03-31"],
+            owner=user)
+        self.assertEqual(workout_plan.get_rules(), [])
+        rules = [RecurrenceRule.objects.create(
+            workout_plan=workout_plan, weekdays=[weekday], interval=1,
+            start_date=date(2019, 3, 1), end_date=date(2019, 3, 31),
+            training_main='easy') for weekday in (1, 3)]
+        self.assertEqual(workout_plan.rule_count, 2)
+        rules[0].delete()
+        rules[1].materialize()
+        workout_plan.refresh_from_db()
+        self.assertEqual(workout_plan.rule_count, 0)
+        self.assertEqual(workout_plan.training_count, 4)
+
+    def test_rule_days_repeat_every_interval_weeks(self):
+        rule = RecurrenceRule(weekdays=[1, 6], interval=2,
+                              start_date=date(2019, 3, 6),
+                              end_date=date(2019, 4, 30))
+        days = list(rule.get_days(date(2019, 3, 1), date(2019, 3, 31)))
+        # Weeks are counted from 4 March, Tuesday 5 March is before the
+        # rule starts.
+        self.assertEqual(days, [date(2019, 3, 10), date(2019, 3, 19),
+                                date(2019, 3, 24)])
+
+    def test_expand_uses_first_rule_on_shared_days(self):
+        first = RecurrenceRule(id=1, weekdays=[0, 2], interval=1,
+                               start_date=date(2019, 3, 4),
+                               end_date=date(2019, 3, 10))
+        second = RecurrenceRule(id=2, weekdays=[2, 4], interval=1,
+                                start_date=date(2019, 3, 4),
+                                end_date=date(2019, 3, 10))
+        days = RecurrenceRule.expand([second, first], date(2019, 3, 1),
+                                     date(2019, 3, 31))
+        self.assertEqual(days, {date(2019, 3, 4): first,
+                                date(2019, 3, 6): first,
+                                date(2019, 3, 8): second})
@@ -1,14 +1,60 @@
-from datetime import date
+import csv
+import io
+import json
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import patch
 
 from django.contrib.auth.models import User, Permission
-from django.test import TestCase, Client
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from RunScheduleApp.models import WorkoutPlan, Training, TrainingDiary
+from RunScheduleApp import analytics, caching, calendar_cache, imports
+from RunScheduleApp.models import RecurrenceRule, WorkoutPlan, Training
+from RunScheduleApp.models import MonthlyDiaryRollup, TrainingDiary
 from RunScheduleApp.forms import DiaryEntryForm
+from RunScheduleApp.views import CurrentWorkoutPlanJsonView
+from RunScheduleApp.views import SeasonWorkoutPlanView, TrainingDiaryView
+from RunScheduleApp.views import WorkoutCalendar
 
 
 class MainPageViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='dashboard user',
+                                        password='test')
+        other_user = User.objects.create_user(username='other user',
+                                              password='test')
+        plan_1 = WorkoutPlan.objects.create(
+            name='plan 1', date_range=["2019-03-01", "2019-03-13"],
+            owner=user)
+        plan_2 = WorkoutPlan.objects.create(
+            name='plan 2', date_range=["2019-03-13", "2019-04-30"],
+            owner=user)
+        old_plan = WorkoutPlan.objects.create(
+            name='old plan', date_range=["2018-03-01", "2018-04-30"],
+            owner=user)
+        other_plan = WorkoutPlan.objects.create(
+            name='other plan', date_range=["2019-03-01", "2019-04-30"],
+            owner=other_user)
+        Training.objects.create(day='2019-03-13', training_main='easy run',
+                                workout_plan=plan_1)
+        Training.objects.create(day='2019-03-13', training_main='gym',
+                                workout_plan=plan_2)
+        Training.objects.create(day='2019-03-17', training_main='long run',
+                                workout_plan=plan_2)
+        Training.objects.create(day='2019-03-18', training_main='next week',
+                                workout_plan=plan_2)
+        Training.objects.create(day='2018-03-13', training_main='old run',
+                                workout_plan=old_plan)
+        Training.objects.create(day='2019-03-13', training_main='other run',
+                                workout_plan=other_plan)
+
     def setUp(self):
         self.client = Client()
 
@@ -20,6 +66,40 @@ class MainPageViewTest(TestCase):
         response = self.client.get('/')
         self.assertTemplateUsed(response, 'RunScheduleApp/main_page.html')
 
+    @patch('RunScheduleApp.views.get_today_date',
+           return_value=date(2019, 3, 13))
+    def test_view_shows_trainings_from_all_user_plans(self, mock_today):
+        self.client.login(username='dashboard user', password='test')
+        response = self.client.get('/')
+        today_trainings = [t.training_main
+                           for t in response.context['today_trainings']]
+        week_trainings = [t.training_main
+                          for t in response.context['week_trainings']]
+        current_plans = [p.name for p in response.context['current_plans']]
+        self.assertEqual(sorted(today_trainings), ['easy run', 'gym'])
+        self.assertEqual(sorted(week_trainings),
+                         ['easy run', 'gym', 'long run'])
+        self.assertEqual(current_plans, ['plan 1', 'plan 2'])
+
+    @patch('RunScheduleApp.views.get_today_date',
+           return_value=date(2019, 3, 13))
+    def test_view_shows_days_of_recurrence_rules(self, mock_today):
+        plan_2 = WorkoutPlan.objects.get(name='plan 2')
+        # Wednesday 13 March has a saved training.
+        rule = RecurrenceRule.objects.create(
+            workout_plan=plan_2, weekdays=[2, 4], interval=1,
+            start_date=date(2019, 3, 1), end_date=date(2019, 3, 31),
+            training_main='rule run')
+        self.client.login(username='dashboard user', password='test')
+        response = self.client.get('/')
+        week_trainings = [(t.day, t.training_main)
+                          for t in response.context['week_trainings']]
+        self.assertEqual(week_trainings, [
+            (date(2019, 3, 13), 'easy run'), (date(2019, 3, 13), 'gym'),
+            (date(2019, 3, 15), 'rule run'), (date(2019, 3, 17), 'long run')])
+        self.assertContains(response, reverse('add_training_date', args=[
+            plan_2.id, 3, 2019, '2019-03-15']) + f'?rule={rule.id}')
+
 
 class PermissionRequiredViewTest(TestCase):
     @classmethod
@@ -360,6 +440,71 @@ class TrainingDiaryViewTest(PermissionRequiredViewTest):
         self.assertTrue(all([entries[i - 1].date < entries[i].date
                              for i in range(1, len(entries))]))
 
+    @patch.object(TrainingDiaryView, 'page_size', 3)
+    def test_view_paginates_entries_with_cursor(self):
+        self.log_user_with_permission()
+        response = self.client.get(reverse('training_diary'))
+        first_page = [e.date for e in response.context['diary_entries']]
+        self.assertEqual(len(first_page), 3)
+        next_page = response.context['next_page']
+        self.assertIsNotNone(next_page)
+        response = self.client.get(reverse('training_diary') + '?' + next_page)
+        second_page = [e.date for e in response.context['diary_entries']]
+        self.assertEqual(second_page, [date(2019, 3, 10)])
+        self.assertIsNone(response.context['next_page'])
+        self.assertIsNotNone(response.context['first_page'])
+
+    @patch.object(TrainingDiaryView, 'page_size', 1)
+    def test_view_seeks_next_page_with_row_comparison(self):
+        self.log_user_with_permission()
+        user = User.objects.get(username='user_with_permission')
+        entry = TrainingDiary.objects.filter(user=user).earliest('date')
+        same_day = TrainingDiary.objects.create(
+            date=entry.date, training_info='same day', training_distance=5,
+            training_time=30, user=user)
+        url = reverse('training_diary')
+        response = self.client.get(url)
+        self.assertEqual(response.context['diary_entries'], [entry])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                url + '?' + response.context['next_page'])
+        self.assertEqual(response.context['diary_entries'], [same_day])
+        self.assertTrue(any('."date", ' in query['sql'] and ') > (' in
+                            query['sql'] for query in queries))
+
+    @patch.object(TrainingDiaryView, 'page_size', 1)
+    def test_view_query_count_does_not_depend_on_page(self):
+        self.log_user_with_permission()
+        url = reverse('training_diary')
+        response = self.client.get(url)
+        # session, user, two permission queries, one page of entries and
+        # weekly and monthly totals
+        with self.assertNumQueries(7):
+            response = self.client.get(
+                url + '?' + response.context['next_page'])
+        with self.assertNumQueries(7):
+            self.client.get(url + '?' + response.context['next_page'])
+
+    def test_view_shows_totals_of_weeks_and_months_on_page(self):
+        self.log_user_with_permission()
+        response = self.client.get(reverse('training_diary'))
+        weeks = [(w.period_start, w.session_count)
+                 for w in response.context['weekly_totals']]
+        self.assertEqual(weeks,
+                         [(date(2019, 2, 25), 2), (date(2019, 3, 4), 2)])
+        months = list(response.context['monthly_totals'])
+        self.assertEqual(len(months), 1)
+        self.assertEqual(months[0].session_count, 4)
+        self.assertEqual(months[0].total_distance, Decimal('50.0'))
+        self.assertEqual(months[0].total_time, 280)
+
+    def test_view_filters_entries_by_date(self):
+        self.log_user_with_permission()
+        response = self.client.get(reverse('training_diary'), {
+            'date_from': '2019-03-02', 'date_to': '2019-03-07'})
+        dates = [e.date for e in response.context['diary_entries']]
+        self.assertEqual(dates, [date(2019, 3, 3), date(2019, 3, 7)])
+
 
 class TrainingDiaryEntryAddTest(PermissionRequiredViewTest):
     @classmethod
@@ -375,14 +520,14 @@ class TrainingDiaryEntryAddTest(PermissionRequiredViewTest):
             distance_main=10, time_main=60, training_additional='8x100m',
             workout_plan=workout_plan)
         Training.objects.create(
-            day='2018-01-01', training_main='test training 2',
+            day='2018-01-02', training_main='test training 2',
             distance_additional=20, time_additional=50,
             training_additional='8x100m', workout_plan=workout_plan)
         Training.objects.create(
-            day='2018-01-01', training_main='test training 3',
+            day='2018-01-03', training_main='test training 3',
             training_additional='8x100m', workout_plan=workout_plan)
         Training.objects.create(
-            day='2018-01-01', training_main='test training 4',
+            day='2018-01-04', training_main='test training 4',
             distance_main=10, time_main=60, training_additional='8x100m',
             distance_additional=5, time_additional=20,
             workout_plan=workout_plan)
@@ -484,6 +629,64 @@ class TrainingDiaryEntryAddTest(PermissionRequiredViewTest):
         training = Training.objects.get(id=self.training.id)
         self.assertTrue(training.accomplished)
 
+    def test_view_links_diary_entry_with_training(self):
+        self.log_user_with_permission()
+        data = {'date': '2018-01-01', 'training_info': 'test training info',
+                'training_distance': 8.5, 'training_time': 70}
+        self.client.post(reverse('diary_entry_add', kwargs={
+            'training_id': self.training.id}), data)
+        diary_entry = TrainingDiary.objects.get(training=self.training)
+        self.assertEqual(diary_entry.training_distance, Decimal('8.5'))
+
+    def test_view_does_not_add_training_to_diary_twice(self):
+        self.log_user_with_permission()
+        data = {'date': '2018-01-01', 'training_info': 'test training info',
+                'training_distance': 8.5, 'training_time': 70}
+        url = reverse('diary_entry_add', kwargs={
+            'training_id': self.training.id})
+        self.client.post(url, data)
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].non_field_errors())
+        self.assertEqual(
+            TrainingDiary.objects.filter(training=self.training).count(), 1)
+
+    def test_view_checks_if_user_owns_the_training(self):
+        user = User.objects.create_user(username='other diary user',
+                                        password='test')
+        user.user_permissions.add(
+            Permission.objects.get(codename='add_trainingdiary'))
+        self.client.login(username='other diary user', password='test')
+        url = reverse('diary_entry_add', kwargs={
+            'training_id': self.training.id})
+        data = {'date': '2018-01-01', 'training_info': 'test training info',
+                'training_distance': 8.5, 'training_time': 70}
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.post(url, data).status_code, 403)
+        self.assertFalse(
+            TrainingDiary.objects.filter(training=self.training).exists())
+        self.training.refresh_from_db()
+        self.assertFalse(self.training.accomplished)
+
+    def test_view_returns_form_error_if_entry_added_concurrently(self):
+        self.log_user_with_permission()
+        TrainingDiary.objects.create(
+            date='2018-01-01', training_info='concurrent entry',
+            training_distance=8, training_time=60, training=self.training,
+            user=self.training.workout_plan.owner)
+        data = {'date': '2018-01-01', 'training_info': 'test training info',
+                'training_distance': 8.5, 'training_time': 70}
+        # The entry is not found before the save, as if it was added by
+        # a request running at the same time.
+        with patch('django.db.models.QuerySet.exists',
+                   side_effect=[False, True]):
+            response = self.client.post(reverse('diary_entry_add', kwargs={
+                'training_id': self.training.id}), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].non_field_errors())
+        self.assertEqual(
+            TrainingDiary.objects.filter(training=self.training).count(), 1)
+
     def test_calculate_distance_and_calculate_time_methods(self):
         training_1 = Training.objects.get(training_main='test training 1')
         training_2 = Training.objects.get(training_main='test training 2')
@@ -505,3 +708,1279 @@ class TrainingDiaryEntryAddTest(PermissionRequiredViewTest):
         self.assertEqual(time_2, 50, 'Wrong time')
         self.assertEqual(time_3, None, 'Wrong time')
         self.assertEqual(time_4, 80, 'Wrong time')
+
+
+class WorkoutCalendarTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='calendar user',
+                                        password='test')
+        workout_plan = WorkoutPlan.objects.create(
+            name='calendar plan', date_range=["2019-03-01", "2019-04-30"],
+            owner=user)
+        for day in ['2019-03-05', '2019-03-12', '2019-03-30', '2019-04-02']:
+            Training.objects.create(
+                day=day, training_main='easy run', distance_main=8,
+                workout_plan=workout_plan)
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='calendar plan')
+
+    def test_calendar_month_rendered_with_single_query(self):
+        with self.assertNumQueries(1):
+            WorkoutCalendar(self.workout_plan, 3, 2019).formatmonth(2019, 3)
+        with self.assertNumQueries(1):
+            WorkoutCalendar(self.workout_plan, 4, 2019).formatmonth(2019, 4)
+
+    def test_calendar_of_plan_with_rules_rendered_with_two_queries(self):
+        RecurrenceRule.objects.create(
+            workout_plan=self.workout_plan, weekdays=[1], interval=1,
+            start_date=date(2019, 3, 1), end_date=date(2019, 3, 31),
+            training_main='tuesday run')
+        # trainings and recurrence rules
+        with self.assertNumQueries(2):
+            WorkoutCalendar(self.workout_plan, 3, 2019).formatmonth(2019, 3)
+
+    def test_calendar_uses_preloaded_trainings_without_queries(self):
+        with self.assertNumQueries(0):
+            WorkoutCalendar(self.workout_plan, 3, 2019,
+                            trainings={}, rules=[]).formatmonth(2019, 3)
+
+    def test_calendar_expands_recurrence_rules_on_free_days(self):
+        rule = RecurrenceRule.objects.create(
+            workout_plan=self.workout_plan, weekdays=[1], interval=1,
+            start_date=date(2019, 3, 1), end_date=date(2019, 3, 31),
+            training_main='tuesday run', distance_main=6)
+        calendar = WorkoutCalendar(self.workout_plan, 3, 2019)
+        # Tuesdays 5 and 12 have trainings saved in the database.
+        self.assertEqual(sorted(calendar.rule_dict), [19, 26])
+        html = calendar.formatmonth(2019, 3)
+        self.assertIn('tuesday run 6.0km', html)
+        self.assertIn(reverse('add_training_date', args=[
+            self.workout_plan.id, 3, 2019, '2019-03-19']) + f'?rule={rule.id}',
+                      html)
+
+    def test_calendar_contains_edit_links_for_training_days(self):
+        calendar = WorkoutCalendar(self.workout_plan, 3, 2019).formatmonth(
+            2019, 3)
+        for training in Training.objects.filter(day__month=3):
+            link = reverse('edit_training_month', args=[
+                self.workout_plan.id, training.id, 3, 2019])
+            self.assertIn(f'href="{link}"', calendar)
+        april_training = Training.objects.get(day='2019-04-02')
+        self.assertNotIn(f'/{april_training.id}/3/2019', calendar)
+
+    def test_calendar_contains_add_links_for_free_days(self):
+        calendar = WorkoutCalendar(self.workout_plan, 3, 2019).formatmonth(
+            2019, 3)
+        link = reverse('add_training_date', args=[
+            self.workout_plan.id, 3, 2019, '2019-03-31'])
+        self.assertIn(f'href="{link}"', calendar)
+        link = reverse('add_training_date', args=[
+            self.workout_plan.id, 3, 2019, '2019-03-05'])
+        self.assertNotIn(f'href="{link}"', calendar)
+
+
+class CalendarCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='cache user', password='test')
+        workout_plan = WorkoutPlan.objects.create(
+            name='cached plan', date_range=["2019-03-01", "2019-04-30"],
+            owner=user, is_active=True)
+        Training.objects.create(day='2019-03-05', training_main='easy run',
+                                workout_plan=workout_plan)
+
+    def setUp(self):
+        cache.clear()
+        self.workout_plan = WorkoutPlan.objects.get(name='cached plan')
+        self.client.login(username='cache user', password='test')
+        self.url = reverse('current_workout', args=[3, 2019])
+
+    def test_second_request_is_served_from_cache(self):
+        self.client.get(self.url)
+        self.assertEqual(calendar_cache.get_stats()['misses'], 1)
+        self.client.get(self.url)
+        stats = calendar_cache.get_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+    def test_cached_month_of_cached_plan_does_not_query_plans(self):
+        json_url = reverse('current_workout_json', args=[3, 2019])
+        self.client.get(self.url)
+        etag = self.client.get(json_url)['ETag']
+        plans_table = WorkoutPlan._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+            self.client.get(json_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertFalse([query for query in queries
+                          if plans_table in query['sql']])
+
+    def test_saving_training_invalidates_cached_month(self):
+        self.client.get(self.url)
+        Training.objects.create(day='2019-03-07', training_main='tempo run',
+                                workout_plan=self.workout_plan)
+        response = self.client.get(self.url)
+        self.assertIn('tempo run', str(response.context['calendar']))
+        self.assertEqual(calendar_cache.get_stats()['misses'], 2)
+
+    def test_deleting_training_invalidates_cached_month(self):
+        self.client.get(self.url)
+        Training.objects.get(day='2019-03-05').delete()
+        response = self.client.get(self.url)
+        self.assertNotIn('easy run', str(response.context['calendar']))
+
+    def test_saving_workout_plan_invalidates_cached_month(self):
+        version = calendar_cache.get_version(self.workout_plan.id)
+        self.workout_plan.save()
+        self.assertNotEqual(calendar_cache.get_version(self.workout_plan.id),
+                            version)
+
+    def test_today_is_part_of_the_key_only_in_current_month(self):
+        key_1 = calendar_cache.make_key(1, 3, 2019, date(2019, 3, 5))
+        key_2 = calendar_cache.make_key(1, 3, 2019, date(2019, 3, 6))
+        key_3 = calendar_cache.make_key(1, 3, 2019, date(2019, 4, 5))
+        key_4 = calendar_cache.make_key(1, 3, 2019, date(2019, 4, 6))
+        self.assertNotEqual(key_1, key_2)
+        self.assertEqual(key_3, key_4)
+
+
+class CachingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.computed = []
+
+    def compute(self):
+        self.computed.append(True)
+        return 'computed'
+
+    def test_bumped_version_changes_keys_of_owner(self):
+        key = caching.make_key('test', 1, 'value')
+        other_key = caching.make_key('test', 2, 'value')
+        caching.bump_version('test', 1)
+        self.assertNotEqual(caching.make_key('test', 1, 'value'), key)
+        self.assertEqual(caching.make_key('test', 2, 'value'), other_key)
+
+    def test_value_computed_once(self):
+        for _ in range(2):
+            self.assertEqual(caching.get_or_set('key', self.compute, 60),
+                             'computed')
+        self.assertEqual(len(self.computed), 1)
+
+    def test_waits_for_value_computed_by_another_worker(self):
+        cache.add('key:lock', 1)
+        with patch('RunScheduleApp.caching.time.sleep',
+                   side_effect=lambda seconds: cache.set('key', 'other')):
+            value = caching.get_or_set('key', self.compute, 60)
+        self.assertEqual(value, 'other')
+        self.assertEqual(self.computed, [])
+
+    def test_computes_value_if_another_worker_is_too_slow(self):
+        cache.add('key:lock', 1)
+        with patch('RunScheduleApp.caching.LOCK_WAIT', 0):
+            value = caching.get_or_set('key', self.compute, 60)
+        self.assertEqual(value, 'computed')
+
+
+class SeasonWorkoutPlanViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='season user',
+                                        password='test')
+        User.objects.create_user(username='no plan user', password='test')
+        workout_plan = WorkoutPlan.objects.create(
+            name='season plan', date_range=["2018-11-15", "2019-02-10"],
+            owner=user, is_active=True)
+        for day in ['2018-11-20', '2018-12-24', '2019-01-02', '2019-02-10']:
+            Training.objects.create(day=day, training_main=f'run {day}',
+                                    workout_plan=workout_plan)
+
+    def test_view_redirects_if_not_logged_in(self):
+        response = self.client.get(reverse('season_workout'))
+        self.assertTrue(response.url.startswith('/login'))
+
+    def test_view_without_active_plan(self):
+        self.client.login(username='no plan user', password='test')
+        response = self.client.get(reverse('season_workout'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(
+            response, 'RunScheduleApp/current_workout_plan.html')
+
+    def test_view_streams_every_month_of_the_plan(self):
+        self.client.login(username='season user', password='test')
+        response = self.client.get(reverse('season_workout'))
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode()
+        for month_name in ['November 2018', 'December 2018', 'January 2019',
+                           'February 2019']:
+            self.assertIn(month_name, content)
+        self.assertNotIn('October 2018', content)
+        self.assertNotIn('March 2019', content)
+        for training in Training.objects.filter(
+                workout_plan__name='season plan'):
+            self.assertIn(training.training_main, content)
+        self.assertTrue(content.rstrip().endswith('</html>'))
+
+    def test_months_in_range_crosses_year_boundary(self):
+        months = list(SeasonWorkoutPlanView.months_in_range(
+            date(2018, 11, 15), date(2019, 2, 10)))
+        self.assertEqual(months, [(2018, 11), (2018, 12), (2019, 1),
+                                  (2019, 2)])
+
+
+class WorkoutPlanFeedViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='feed user', password='test')
+        workout_plan = WorkoutPlan.objects.create(
+            name='feed plan', date_range=["2019-03-01", "2019-04-30"],
+            owner=user)
+        Training.objects.create(
+            day='2019-03-05', training_main='easy run; relaxed',
+            distance_main=8, workout_plan=workout_plan)
+        Training.objects.create(day='2019-03-07', training_main='intervals',
+                                workout_plan=workout_plan)
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='feed plan')
+        self.url = reverse('plan_feed', args=[
+            self.workout_plan.id, self.workout_plan.get_feed_token()])
+
+    def test_view_returns_404_for_wrong_token(self):
+        response = self.client.get(reverse('plan_feed', args=[
+            self.workout_plan.id, 'wrong-token']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_view_streams_calendar_with_all_trainings(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response['Content-Type'].startswith('text/calendar'))
+        content = b''.join(response.streaming_content).decode()
+        self.assertTrue(content.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertTrue(content.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(content.count('BEGIN:VEVENT'), 2)
+        self.assertIn('DTSTART;VALUE=DATE:20190305\r\n', content)
+        self.assertIn(r'SUMMARY:easy run\; relaxed 8.0km' + '\r\n', content)
+
+    def test_calendar_contains_days_of_recurrence_rules(self):
+        rule = RecurrenceRule.objects.create(
+            workout_plan=self.workout_plan, weekdays=[1], interval=1,
+            start_date=date(2019, 3, 1), end_date=date(2019, 3, 15),
+            training_main='tuesday run')
+        content = b''.join(
+            self.client.get(self.url).streaming_content).decode()
+        # Tuesday 5 March has a saved training.
+        self.assertEqual(content.count('BEGIN:VEVENT'), 3)
+        self.assertIn('SUMMARY:tuesday run\r\n', content)
+        self.assertIn(f'UID:rule-{rule.id}-20190312@', content)
+        self.assertLess(content.index('20190307'), content.index('20190312'))
+
+    def test_view_returns_304_for_unchanged_plan(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_training_change_modifies_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        Training.objects.get(day='2019-03-07').delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class CurrentWorkoutPlanJsonViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='json user', password='test')
+        User.objects.create_user(username='json no plan', password='test')
+        workout_plan = WorkoutPlan.objects.create(
+            name='json plan', date_range=["2019-03-01", "2019-04-30"],
+            owner=user, is_active=True)
+        Training.objects.create(day='2019-03-05', training_main='easy run',
+                                workout_plan=workout_plan, accomplished=True)
+        Training.objects.create(day='2019-04-02', training_main='long run',
+                                workout_plan=workout_plan)
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='json plan')
+        self.url = reverse('current_workout_json', args=[3, 2019])
+
+    def test_view_redirects_if_not_logged_in(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.url.startswith('/login'))
+
+    def test_view_without_active_plan(self):
+        self.client.login(username='json no plan', password='test')
+        self.assertEqual(self.client.get(self.url).json(), {'plan': None})
+
+    def test_view_returns_month_data(self):
+        self.client.login(username='json user', password='test')
+        data = self.client.get(self.url).json()
+        training = Training.objects.get(day='2019-03-05')
+        self.assertEqual(data['plan']['start'], '2019-03-01')
+        self.assertEqual(data['trainings'],
+                         {'5': [training.id, 'easy run', True]})
+        self.assertIsNone(data['prev'])
+        self.assertEqual(data['next'], {'month': 4, 'year': 2019})
+        self.assertIsNone(data['urls']['prev'])
+        self.assertEqual(data['urls']['next'], {
+            'page': reverse('current_workout', args=[4, 2019]),
+            'json': reverse('current_workout_json', args=[4, 2019])})
+        self.assertEqual(data['urls']['edit'].format(training.id), reverse(
+            'edit_training_month',
+            args=[self.workout_plan.id, training.id, 3, 2019]))
+        self.assertEqual(data['urls']['add'].format('2019-03-06'), reverse(
+            'add_training_date',
+            args=[self.workout_plan.id, 3, 2019, '2019-03-06']))
+
+    def test_calendar_page_loads_month_navigation_script(self):
+        self.client.login(username='json user', password='test')
+        response = self.client.get(
+            reverse('current_workout', args=[4, 2019]))
+        self.assertContains(response, 'RunScheduleApp/js/workout_calendar.')
+        self.assertContains(response, 'data-json="{}"'.format(
+            reverse('current_workout_json', args=[4, 2019])))
+        self.assertContains(response, 'data-json="{}"'.format(
+            reverse('current_workout_json', args=[3, 2019])))
+
+    def test_month_data_uses_single_query(self):
+        with self.assertNumQueries(1):
+            CurrentWorkoutPlanJsonView.month_data(self.workout_plan, 4, 2019)
+
+    def test_calendar_shows_rule_added_to_cached_active_plan(self):
+        self.client.login(username='json user', password='test')
+        self.client.get(self.url)
+        RecurrenceRule.objects.create(
+            workout_plan_id=self.workout_plan.id, weekdays=[1], interval=1,
+            start_date=date(2019, 3, 1), end_date=date(2019, 3, 31),
+            training_main='tuesday run')
+        trainings = self.client.get(self.url).json()['trainings']
+        self.assertEqual(trainings['19'][1], 'tuesday run')
+
+    def test_view_returns_304_for_unchanged_month(self):
+        self.client.login(username='json user', password='test')
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Training.objects.create(day='2019-03-07', training_main='tempo run',
+                                workout_plan=self.workout_plan)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_unchanged_month_of_cached_plan_costs_no_query(self):
+        self.client.login(username='json user', password='test')
+        etag = self.client.get(self.url)['ETag']
+        # session and user only, the active plan is cached
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class TrainingAddViewTest(PermissionRequiredViewTest):
+    @classmethod
+    def setUpTestData(cls):
+        super(TrainingAddViewTest, cls).setUpTestData()
+        user = User.objects.get(username='user_with_permission')
+        user.user_permissions.add(Permission.objects.get(
+            codename='add_training'))
+        Training.objects.create(
+            day='2017-01-01', training_main='easy run',
+            workout_plan=WorkoutPlan.objects.get(name='setUp plan 1'))
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        self.url = reverse('add_training', args=[self.workout_plan.id])
+
+    def test_view_creates_training_in_post(self):
+        self.log_user_with_permission()
+        response = self.client.post(self.url, {
+            'day': '2017-01-02', 'training_main': 'tempo run'})
+        self.assertRedirects(response, f'/plan_details/{self.workout_plan.id}',
+                             fetch_redirect_response=False)
+        self.assertTrue(self.workout_plan.training_set.filter(
+            day='2017-01-02').exists())
+
+    def test_view_returns_form_error_for_day_already_taken(self):
+        self.log_user_with_permission()
+        response = self.client.post(self.url, {
+            'day': '2017-01-01', 'training_main': 'tempo run'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('day', response.context['form'].errors)
+        self.assertEqual(self.workout_plan.training_set.filter(
+            day='2017-01-01').count(), 1)
+
+    def test_view_checks_if_user_is_owner_of_the_workout_plan(self):
+        self.log_user_with_permission()
+        other_user_plan = WorkoutPlan.objects.get(name='setUp plan 2')
+        response = self.client.post(
+            reverse('add_training', args=[other_user_plan.id]),
+            {'day': '2017-01-02', 'training_main': 'tempo run'})
+        self.assertEqual(response.status_code, 403)
+
+
+class TrainingLoadViewTest(PermissionRequiredViewTest):
+    @classmethod
+    def setUpTestData(cls):
+        super(TrainingLoadViewTest, cls).setUpTestData()
+        user = User.objects.get(username='user_with_permission')
+        user.user_permissions.add(Permission.objects.get(
+            codename='view_trainingdiary'))
+        for day, distance, time in ((1, 10, 60), (3, 5, 30), (3, 5, 30),
+                                    (8, 12, 70)):
+            TrainingDiary.objects.create(
+                date=date(2019, 3, day), training_info='run',
+                training_distance=distance, training_time=time, user=user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_view_checks_if_user_has_proper_permission(self):
+        self.log_non_permission_user()
+        response = self.client.get(reverse('training_load'))
+        self.assertEqual(response.status_code, 403)
+
+    @patch('RunScheduleApp.views.get_today_date',
+           return_value=date(2019, 3, 8))
+    def test_view_shows_latest_metrics(self, mock_date):
+        self.log_user_with_permission()
+        response = self.client.get(reverse('training_load'))
+        self.assertTemplateUsed(response, 'RunScheduleApp/training_load.html')
+        chart_data = response.context['chart_data']
+        self.assertEqual(chart_data['dates'][0], '2019-03-01')
+        self.assertEqual(len(chart_data['dates']), 8)
+        distance = response.context['latest']['distance']
+        self.assertEqual(distance['volume_7'], 22.0)
+        self.assertEqual(distance['volume_28'], 32.0)
+        self.assertEqual(distance['acwr'], 2.75)
+
+    def test_calculate_load_sums_entries_of_one_day(self):
+        result = analytics.calculate_load(
+            [date(2019, 3, 1), date(2019, 3, 1)], [Decimal('4.5'), 3],
+            [20, 25], today=date(2019, 3, 2))
+        self.assertEqual(result['metrics']['distance']['load'], [7.5, 0.0])
+        self.assertEqual(result['metrics']['time']['volume_7'], [45.0, 45.0])
+
+    def test_monotony_and_strain_of_last_week(self):
+        dates = [date(2019, 3, day) for day in range(1, 8)]
+        times = [60, 0, 60, 0, 60, 0, 60]
+        result = analytics.calculate_load(dates, [0] * 7, times,
+                                          today=date(2019, 3, 7))
+        metrics = result['metrics']['time']
+        # mean 34.29, standard deviation 29.69
+        self.assertEqual(metrics['monotony'][-1], 1.15)
+        self.assertEqual(metrics['strain'][-1], 277.13)
+        self.assertIsNone(result['metrics']['distance']['monotony'][-1])
+
+    def test_result_cached_until_diary_changes(self):
+        user = User.objects.get(username='user_with_permission')
+        today = date(2019, 3, 8)
+        analytics.get_training_load(user, today)
+        with self.assertNumQueries(0):
+            analytics.get_training_load(user, today)
+        TrainingDiary.objects.create(
+            date=today, training_info='run', training_distance=3,
+            training_time=15, user=user)
+        result = analytics.get_training_load(user, today)
+        self.assertEqual(result['metrics']['distance']['load'][-1], 15.0)
+
+
+class DiaryStatisticsViewTest(PermissionRequiredViewTest):
+    @classmethod
+    def setUpTestData(cls):
+        super(DiaryStatisticsViewTest, cls).setUpTestData()
+        user = User.objects.get(username='user_with_permission')
+        user.user_permissions.add(Permission.objects.get(
+            codename='view_trainingdiary'))
+        for day, distance, time in (('2019-01-05', 10, 50),
+                                    ('2019-02-02', 12, 72),
+                                    ('2019-02-20', 8, 40),
+                                    ('2019-04-10', 21, 105)):
+            TrainingDiary.objects.create(
+                date=day, training_info='run', training_distance=distance,
+                training_time=time, user=user)
+
+    def setUp(self):
+        self.log_user_with_permission()
+
+    def test_view_checks_if_user_has_proper_permission(self):
+        self.log_non_permission_user()
+        response = self.client.get(reverse('diary_statistics'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_statistics_calculated_with_single_query(self):
+        user = User.objects.get(username='user_with_permission')
+        with self.assertNumQueries(1):
+            TrainingDiary.get_statistics(user)
+
+    def test_view_shows_summary_of_whole_diary(self):
+        response = self.client.get(reverse('diary_statistics'))
+        summary = response.context['summary']
+        self.assertEqual(summary['sessions'], 4)
+        self.assertEqual(summary['distance'], Decimal('51.0'))
+        self.assertEqual(summary['time'], 267)
+        self.assertEqual(summary['average_distance'], Decimal('12.75'))
+        self.assertEqual(summary['longest_run'], Decimal('21.0'))
+        self.assertEqual(summary['best_pace'], Decimal('5.00'))
+
+    def test_view_shows_month_over_month_change(self):
+        response = self.client.get(reverse('diary_statistics'))
+        months = response.context['months']
+        self.assertEqual([m['month'] for m in months],
+                         [date(2019, 1, 1), date(2019, 2, 1),
+                          date(2019, 4, 1)])
+        self.assertIsNone(months[0]['distance_change'])
+        self.assertEqual(months[1]['distance_change'], Decimal('10.0'))
+        self.assertEqual(months[1]['distance_change_percent'],
+                         Decimal('100.0'))
+        self.assertEqual(months[1]['pace'], Decimal('5.60'))
+        # March has no entries, so April has no previous month.
+        self.assertIsNone(months[2]['distance_change'])
+
+    def test_view_for_empty_diary(self):
+        TrainingDiary.objects.all().delete()
+        response = self.client.get(reverse('diary_statistics'))
+        self.assertIsNone(response.context['summary'])
+        self.assertEqual(response.context['months'], [])
+
+
+class WorkoutPlanAdherenceViewTest(PermissionRequiredViewTest):
+    @classmethod
+    def setUpTestData(cls):
+        super(WorkoutPlanAdherenceViewTest, cls).setUpTestData()
+        user = User.objects.get(username='user_with_permission')
+        user.user_permissions.add(Permission.objects.get(
+            codename='view_workoutplan'))
+        workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        for day, distance, time in (('2018-01-08', 10, 60),
+                                    ('2018-01-10', 5, 30),
+                                    ('2018-01-15', 12, 70)):
+            Training.objects.create(day=day, training_main='run',
+                                    distance_main=distance, time_main=time,
+                                    workout_plan=workout_plan)
+        TrainingDiary.objects.create(
+            date='2018-01-08', training_info='run', training_distance=11,
+            training_time=58, user=user,
+            training=Training.objects.get(day='2018-01-08'))
+        TrainingDiary.objects.create(
+            date='2018-01-09', training_info='extra run',
+            training_distance=3, training_time=15, user=user)
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        self.url = reverse('plan_adherence', args=[self.workout_plan.id])
+
+    def test_view_checks_if_user_has_proper_permission(self):
+        self.log_non_permission_user()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+
+    def test_view_compares_planned_and_actual_per_week(self):
+        self.log_user_with_permission()
+        response = self.client.get(self.url)
+        self.assertTemplateUsed(response, 'RunScheduleApp/plan_adherence.html')
+        weeks = list(response.context['weeks'])
+        self.assertEqual([week['week'] for week in weeks],
+                         [date(2018, 1, 8), date(2018, 1, 15)])
+        self.assertEqual(weeks[0]['planned_count'], 2)
+        self.assertEqual(weeks[0]['completed_count'], 1)
+        self.assertEqual(weeks[0]['planned_distance'], Decimal('15.0'))
+        self.assertEqual(weeks[0]['actual_distance'], Decimal('11.0'))
+        self.assertEqual(weeks[0]['planned_time'], 90)
+        self.assertEqual(weeks[0]['actual_time'], 58)
+        self.assertEqual(weeks[1]['actual_distance'], 0)
+
+    def test_report_built_with_single_query(self):
+        with self.assertNumQueries(1):
+            list(self.workout_plan.get_weekly_adherence())
+
+
+class TrainingImportViewTest(PermissionRequiredViewTest):
+    @classmethod
+    def setUpTestData(cls):
+        super(TrainingImportViewTest, cls).setUpTestData()
+        user = User.objects.get(username='user_with_permission')
+        user.user_permissions.add(Permission.objects.get(
+            codename='add_training'))
+        workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        Training.objects.create(day='2018-01-10', training_main='existing',
+                                workout_plan=workout_plan)
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        self.url = reverse('import_trainings', args=[self.workout_plan.id])
+        self.log_user_with_permission()
+
+    def upload(self, name, content):
+        return self.client.post(self.url, {
+            'file': SimpleUploadedFile(name, content.encode())})
+
+    def test_view_checks_if_user_is_plan_owner(self):
+        other_plan = WorkoutPlan.objects.get(name='setUp plan 2')
+        response = self.client.get(reverse('import_trainings',
+                                           args=[other_plan.id]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_csv_valid_rows_added_and_invalid_rows_reported(self):
+        response = self.upload('plan.csv', (
+            'day,training_main,distance_main,time_main\n'
+            '2018-01-08,easy run,8,45\n'
+            '2018-01-10,tempo run,10,50\n'
+            '2018-01-12,long run,-5,90\n'
+            '2018-01-12,long run,18,95\n'
+            '2018-01-12,second long run,18,95\n'
+            '2019-05-01,too late,5,30\n'))
+        self.assertEqual(response.context['created'], 2)
+        self.assertEqual([number for number, messages
+                          in response.context['row_errors']], [2, 3, 5, 6])
+        self.assertIn('day: You have already scheduled training for this day',
+                      response.context['row_errors'][0][1])
+        self.workout_plan.refresh_from_db()
+        self.assertEqual(self.workout_plan.training_count, 3)
+        self.assertEqual(self.workout_plan.total_distance, Decimal('26.0'))
+
+    def test_json_rows_added(self):
+        response = self.upload('plan.json', json.dumps([
+            {'day': '2018-01-08', 'training_main': 'easy run',
+             'distance_main': 8.5, 'time_main': 45},
+            {'day': '2018-01-09', 'training_main': 'intervals',
+             'training_additional': '8x400m'}]))
+        self.assertEqual(response.context['created'], 2)
+        self.assertEqual(response.context['row_errors'], [])
+        self.assertTrue(self.workout_plan.training_set.filter(
+            day='2018-01-09', training_additional='8x400m').exists())
+
+    def test_invalid_json_reported_as_form_error(self):
+        response = self.upload('plan.json', '{"day": "2018-01-08"}')
+        self.assertTrue(response.context['form'].errors['file'])
+        self.assertNotIn('created', response.context)
+
+    def test_import_uses_constant_number_of_queries(self):
+        rows = ''.join(f'2018-01-{day:02d},run,5,30\n'
+                       for day in range(11, 31))
+        content = 'day,training_main,distance_main,time_main\n' + rows
+        rows = imports.read_csv(io.BytesIO(content.encode()))
+        # existing days, savepoint, bulk insert, plan update, savepoint
+        with self.assertNumQueries(5):
+            created, errors = imports.import_trainings(self.workout_plan,
+                                                       rows)
+        self.assertEqual(created, 20)
+
+
+class WorkoutPlanCloneViewTest(PermissionRequiredViewTest):
+    @classmethod
+    def setUpTestData(cls):
+        super(WorkoutPlanCloneViewTest, cls).setUpTestData()
+        user = User.objects.get(username='user_with_permission')
+        user.user_permissions.add(Permission.objects.get(
+            codename='add_workoutplan'))
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        self.url = reverse('plan_clone', args=[self.workout_plan.id])
+
+    def test_view_checks_if_user_has_proper_permission(self):
+        self.log_non_permission_user()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+
+    def test_view_creates_copy_and_redirects_to_it(self):
+        self.log_user_with_permission()
+        response = self.client.post(self.url, {'name': 'copy',
+                                               'start_date': '2020-01-01'})
+        copy = WorkoutPlan.objects.get(name='copy')
+        self.assertRedirects(response, reverse('plan_details', args=[copy.id]),
+                             fetch_redirect_response=False)
+        self.assertEqual(copy.owner.username, 'user_with_permission')
+
+
+class WorkoutPlanShiftViewTest(PermissionRequiredViewTest):
+    @classmethod
+    def setUpTestData(cls):
+        super(WorkoutPlanShiftViewTest, cls).setUpTestData()
+        user = User.objects.get(username='user_with_permission')
+        user.user_permissions.add(Permission.objects.get(
+            codename='change_workoutplan'))
+        workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        for day in ('2017-05-01', '2017-05-02'):
+            Training.objects.create(day=day, training_main='run',
+                                    distance_main=10, time_main=60,
+                                    workout_plan=workout_plan)
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        self.url = reverse('plan_shift', args=[self.workout_plan.id])
+
+    def test_view_checks_if_user_has_proper_permission(self):
+        self.log_non_permission_user()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+
+    def test_view_moves_trainings_and_redirects_to_plan(self):
+        self.log_user_with_permission()
+        response = self.client.post(self.url, {'days': 3,
+                                               'from_date': '2017-05-02'})
+        self.assertRedirects(
+            response, reverse('plan_details', args=[self.workout_plan.id]),
+            fetch_redirect_response=False)
+        days = self.workout_plan.training_set.order_by('day').values_list(
+            'day', flat=True)
+        self.assertEqual(list(days), [date(2017, 5, 1), date(2017, 5, 5)])
+
+    def test_view_shows_error_if_day_is_taken(self):
+        self.log_user_with_permission()
+        response = self.client.post(self.url, {'days': -1,
+                                               'from_date': '2017-05-02'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Trainings cannot be moved to days with'
+                                      ' other trainings')
+
+
+class RecurrenceRuleViewsTest(PermissionRequiredViewTest):
+    @classmethod
+    def setUpTestData(cls):
+        super(RecurrenceRuleViewsTest, cls).setUpTestData()
+        user = User.objects.get(username='user_with_permission')
+        user.user_permissions.add(
+            Permission.objects.get(codename='add_training'),
+            Permission.objects.get(codename='delete_training'))
+        workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        RecurrenceRule.objects.create(
+            workout_plan=workout_plan, weekdays=[1, 3], interval=1,
+            start_date=date(2018, 1, 1), end_date=date(2018, 1, 14),
+            training_main='easy run', distance_main=8, time_main=45)
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        self.rule = RecurrenceRule.objects.get(training_main='easy run')
+        self.log_user_with_permission()
+
+    def test_add_view_creates_rule(self):
+        response = self.client.post(
+            reverse('add_recurrence_rule', args=[self.workout_plan.id]),
+            {'weekdays': ['6'], 'interval': 2, 'start_date': '2018-01-01',
+             'end_date': '2018-01-31', 'training_main': 'long run',
+             'distance_main': 18})
+        self.assertRedirects(response, reverse(
+            'plan_details', args=[self.workout_plan.id]),
+            fetch_redirect_response=False)
+        rule = RecurrenceRule.objects.get(training_main='long run')
+        self.assertEqual(rule.weekdays, [6])
+
+    def test_add_view_rejects_rule_outside_plan(self):
+        response = self.client.post(
+            reverse('add_recurrence_rule', args=[self.workout_plan.id]),
+            {'weekdays': ['6'], 'interval': 1, 'start_date': '2018-01-01',
+             'end_date': '2018-03-31', 'training_main': 'long run'})
+        self.assertIn('end_date', response.context['form'].errors)
+
+    def test_add_training_form_filled_in_from_rule(self):
+        response = self.client.get(reverse('add_training_date', args=[
+            self.workout_plan.id, 1, 2018, '2018-01-02']),
+            {'rule': self.rule.id})
+        initial = response.context['form'].initial
+        self.assertEqual(initial['training_main'], 'easy run')
+        self.assertEqual(initial['time_main'], 45)
+
+    def test_materialize_view_replaces_rule_with_trainings(self):
+        Training.objects.create(day='2018-01-04', training_main='tempo',
+                                workout_plan=self.workout_plan)
+        response = self.client.post(reverse('materialize_recurrence_rule',
+                                            args=[self.rule.id]))
+        self.assertEqual(response.status_code, 302)
+        days = self.workout_plan.training_set.order_by('day').values_list(
+            'day', 'training_main')
+        self.assertEqual(list(days), [
+            (date(2018, 1, 2), 'easy run'), (date(2018, 1, 4), 'tempo'),
+            (date(2018, 1, 9), 'easy run'), (date(2018, 1, 11), 'easy run')])
+        self.assertFalse(RecurrenceRule.objects.exists())
+        self.workout_plan.refresh_from_db()
+        self.assertEqual(self.workout_plan.training_count, 4)
+        self.assertEqual(self.workout_plan.total_distance, Decimal('24.0'))
+
+    def test_delete_view_checks_owner(self):
+        self.log_non_permission_user()
+        response = self.client.get(reverse('delete_recurrence_rule',
+                                           args=[self.rule.id]))
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(RecurrenceRule.objects.exists())
+
+
+class DiaryExportViewTest(PermissionRequiredViewTest):
+    @classmethod
+    def setUpTestData(cls):
+        super(DiaryExportViewTest, cls).setUpTestData()
+        user = User.objects.get(username='user_with_permission')
+        other_user = User.objects.get(username='non_permission_user')
+        user.user_permissions.add(Permission.objects.get(
+            codename='view_trainingdiary'))
+        for day, comments in (('2019-03-01', 'felt <good>'),
+                              ('2019-03-05', None), ('2019-04-02', 'rain')):
+            TrainingDiary.objects.create(
+                date=day, training_info='easy, 8km', training_distance=8.5,
+                training_time=45, comments=comments, user=user)
+        TrainingDiary.objects.create(
+            date='2019-03-02', training_info='other', training_distance=5,
+            training_time=30, user=other_user)
+
+    def setUp(self):
+        self.log_user_with_permission()
+        self.url = reverse('diary_export')
+
+    def test_view_checks_if_user_has_proper_permission(self):
+        self.log_non_permission_user()
+        response = self.client.get(self.url, {'file_format': 'csv'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_view_without_format_shows_form(self):
+        response = self.client.get(self.url)
+        self.assertTemplateUsed(response, 'RunScheduleApp/diary_export.html')
+
+    def test_csv_export_streams_filtered_entries(self):
+        response = self.client.get(self.url, {
+            'file_format': 'csv', 'date_to': '2019-03-31'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        content = b''.join(response.streaming_content).decode()
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0][0], 'Date')
+        self.assertEqual(rows[1:], [
+            ['2019-03-01', 'easy, 8km', '8.5', '45', 'felt <good>'],
+            ['2019-03-05', 'easy, 8km', '8.5', '45', '']])
+
+    def test_xlsx_export_is_valid_workbook(self):
+        response = self.client.get(self.url, {'file_format': 'xlsx'})
+        content = b''.join(response.streaming_content)
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertIn('xl/workbook.xml', archive.namelist())
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 4)
+        self.assertIn('<t>felt &lt;good&gt;</t>', sheet)
+        # 1 March 2019 as Excel date number
+        self.assertIn('<c s="1"><v>43525</v></c>', sheet)
+
+
+class TrainingsLogViewTest(PermissionRequiredViewTest):
+    @classmethod
+    def setUpTestData(cls):
+        super(TrainingsLogViewTest, cls).setUpTestData()
+        user = User.objects.get(username='user_with_permission')
+        user.user_permissions.add(Permission.objects.get(
+            codename='add_trainingdiary'))
+        workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        Training.objects.create(day='2018-01-01', training_main='easy',
+                                distance_main=8, time_main=45,
+                                workout_plan=workout_plan)
+        Training.objects.create(day='2018-01-03', training_main='tempo',
+                                distance_main=10, time_main=50,
+                                training_additional='strides',
+                                distance_additional=1, time_additional=5,
+                                workout_plan=workout_plan)
+        Training.objects.create(day='2018-01-20', training_main='future',
+                                workout_plan=workout_plan)
+        other_plan = WorkoutPlan.objects.get(name='setUp plan 2')
+        Training.objects.create(day='2018-01-01', training_main='other',
+                                workout_plan=other_plan)
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        self.url = reverse('log_trainings', args=[self.workout_plan.id])
+        self.log_user_with_permission()
+
+    def post_trainings(self, *names):
+        ids = Training.objects.filter(training_main__in=names).values_list(
+            'id', flat=True)
+        with patch('RunScheduleApp.views.get_today_date',
+                   return_value=date(2018, 1, 10)):
+            return self.client.post(self.url, {'training': list(ids)})
+
+    def test_selected_past_trainings_added_to_diary(self):
+        response = self.post_trainings('easy', 'tempo', 'future', 'other')
+        self.assertRedirects(response, reverse(
+            'plan_details', args=[self.workout_plan.id]),
+            fetch_redirect_response=False)
+        entries = TrainingDiary.objects.order_by('date')
+        self.assertEqual([(e.training.training_main, e.training_distance,
+                           e.training_time) for e in entries],
+                         [('easy', Decimal('8.0'), 45),
+                          ('tempo', Decimal('11.0'), 55)])
+        self.assertEqual(entries[1].training_info,
+                         'tempo 10.0km 50min strides 1.0km 5min')
+        self.assertEqual(list(Training.objects.filter(
+            accomplished=True).values_list('training_main', flat=True)
+                              .order_by('day')), ['easy', 'tempo'])
+        self.workout_plan.refresh_from_db()
+        self.assertEqual(self.workout_plan.accomplished_count, 2)
+        monthly = MonthlyDiaryRollup.objects.get()
+        self.assertEqual(monthly.session_count, 2)
+
+    def test_training_logged_only_once(self):
+        self.post_trainings('easy')
+        self.post_trainings('easy', 'tempo')
+        self.assertEqual(TrainingDiary.objects.count(), 2)
+        self.workout_plan.refresh_from_db()
+        self.assertEqual(self.workout_plan.accomplished_count, 2)
+        self.assertEqual(MonthlyDiaryRollup.objects.get().session_count, 2)
+
+    def test_training_too_long_for_diary_skipped(self):
+        Training.objects.create(day='2018-01-05', training_main='long',
+                                distance_main=60, time_main=300,
+                                training_additional='long',
+                                distance_additional=50, time_additional=250,
+                                workout_plan=self.workout_plan)
+        response = self.post_trainings('easy', 'long')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(TrainingDiary.objects.values_list(
+            'training__training_main', flat=True)), ['easy'])
+        self.assertFalse(Training.objects.get(
+            training_main='long').accomplished)
+        self.workout_plan.refresh_from_db()
+        self.assertEqual(self.workout_plan.accomplished_count, 1)
+
+    def test_log_trainings_uses_constant_number_of_queries(self):
+        user = User.objects.get(username='user_with_permission')
+        trainings = self.workout_plan.training_set.filter(
+            day__lte='2018-01-10')
+        # trainings, entries insert, accomplished update, plan update and
+        # an update and an insert of weekly and monthly rollups, each
+        # insert within its own savepoint
+        with self.assertNumQueries(14):
+            TrainingDiary.log_trainings(user, trainings)
+
+
+class ApiViewsTest(PermissionRequiredViewTest):
+    @classmethod
+    def setUpTestData(cls):
+        super(ApiViewsTest, cls).setUpTestData()
+        user = User.objects.get(username='user_with_permission')
+        user.user_permissions.add(
+            Permission.objects.get(codename='view_workoutplan'),
+            Permission.objects.get(codename='view_training'),
+            Permission.objects.get(codename='view_trainingdiary'))
+        workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        for day in range(1, 6):
+            Training.objects.create(day=f'2017-05-0{day}', training_main='run',
+                                    distance_main=day, time_main=30,
+                                    workout_plan=workout_plan)
+        for day in (1, 1, 2):
+            TrainingDiary.objects.create(
+                date=f'2017-05-0{day}', training_info='run',
+                training_distance=5, training_time=30, user=user)
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        self.log_user_with_permission()
+
+    def get_all_pages(self, url, limit):
+        results = []
+        query = {'limit': limit}
+        while True:
+            data = self.client.get(url, query).json()
+            results.extend(data['results'])
+            if data['next'] is None:
+                return results
+            query['cursor'] = data['next']
+
+    def test_view_checks_if_user_has_proper_permission(self):
+        self.client.logout()
+        self.log_non_permission_user()
+        response = self.client.get(reverse('api_plans'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_plans_list_contains_only_own_plans(self):
+        response = self.client.get(reverse('api_plans'), {'fields': 'name'})
+        self.assertEqual(response.json(), {
+            'results': [{'name': 'setUp plan 1'}, {'name': 'setUp plan 3'},
+                        {'name': 'setUp plan 4'}],
+            'next': None})
+
+    def test_plan_returns_fields(self):
+        response = self.client.get(
+            reverse('api_plan', args=[self.workout_plan.id]))
+        data = response.json()
+        self.assertEqual(data['date_range'], {
+            'lower': '2011-01-01', 'upper': '2018-01-31', 'bounds': '[)'})
+        self.assertEqual(data['total_distance'], 15.0)
+        self.assertEqual(data['training_count'], 5)
+
+    def test_trainings_of_other_users_are_not_found(self):
+        workout_plan = WorkoutPlan.objects.get(name='setUp plan 2')
+        response = self.client.get(
+            reverse('api_trainings', args=[workout_plan.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_rules_of_plan_are_listed(self):
+        RecurrenceRule.objects.create(
+            workout_plan=self.workout_plan, weekdays=[0, 3], interval=2,
+            start_date=date(2017, 6, 1), end_date=date(2017, 6, 30),
+            training_main='intervals')
+        plan = self.client.get(
+            reverse('api_plan', args=[self.workout_plan.id])).json()
+        self.assertEqual(plan['rule_count'], 1)
+        response = self.client.get(
+            reverse('api_rules', args=[self.workout_plan.id]),
+            {'fields': 'weekdays,interval,start_date,training_main'})
+        self.assertEqual(response.json()['results'], [
+            {'weekdays': [0, 3], 'interval': 2, 'start_date': '2017-06-01',
+             'training_main': 'intervals'}])
+
+    def test_trainings_are_paginated_with_cursor(self):
+        url = reverse('api_trainings', args=[self.workout_plan.id])
+        results = self.get_all_pages(url, 2)
+        self.assertEqual([training['day'] for training in results],
+                         [f'2017-05-0{day}' for day in range(1, 6)])
+
+    def test_diary_pages_keep_entries_of_one_day(self):
+        results = self.get_all_pages(reverse('api_diary'), 1)
+        self.assertEqual([entry['date'] for entry in results],
+                         ['2017-05-01', '2017-05-01', '2017-05-02'])
+
+    def test_next_pages_are_selected_with_row_comparison(self):
+        url = reverse('api_diary')
+        cursor = self.client.get(url, {'limit': 1}).json()['next']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'limit': 1, 'cursor': cursor})
+        self.assertTrue(any('."date", ' in query['sql'] and ') > (' in
+                            query['sql'] for query in queries))
+
+    def test_list_returns_selected_fields(self):
+        response = self.client.get(
+            reverse('api_trainings', args=[self.workout_plan.id]),
+            {'fields': 'distance_main', 'limit': 1})
+        self.assertEqual(response.json()['results'], [{'distance_main': 1.0}])
+
+    def test_invalid_parameters_return_error(self):
+        url = reverse('api_diary')
+        for query in ({'fields': 'user_id'}, {'limit': 0},
+                      {'cursor': 'invalid'}):
+            response = self.client.get(url, query)
+            self.assertEqual(response.status_code, 400)
+
+    def test_lists_use_constant_number_of_queries(self):
+        url = reverse('api_trainings', args=[self.workout_plan.id])
+        # session, user, two permission queries, workout plan and page
+        for limit in (1, 5):
+            with self.assertNumQueries(6):
+                self.client.get(url, {'limit': limit})
+        # session, user, two permission queries, version and page
+        with self.assertNumQueries(6):
+            self.client.get(reverse('api_plans'))
+
+    def test_unchanged_list_returns_304(self):
+        url = reverse('api_trainings', args=[self.workout_plan.id])
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Training.objects.filter(day='2017-05-01').get().delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 4)
+
+    def test_diary_etag_changes_with_diary(self):
+        url = reverse('api_diary')
+        etag = self.client.get(url)['ETag']
+        TrainingDiary.objects.filter(date='2017-05-02').get().delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_diary_etag_does_not_depend_on_cache(self):
+        url = reverse('api_diary')
+        etag = self.client.get(url)['ETag']
+        entry = TrainingDiary.objects.filter(date='2017-05-02').get()
+        entry.training_time = 40
+        entry.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][2]['training_time'], 40)
+
+
+class TrainingBatchApiViewTest(PermissionRequiredViewTest):
+    @classmethod
+    def setUpTestData(cls):
+        super(TrainingBatchApiViewTest, cls).setUpTestData()
+        user = User.objects.get(username='user_with_permission')
+        user.user_permissions.add(
+            Permission.objects.get(codename='add_training'),
+            Permission.objects.get(codename='change_training'),
+            Permission.objects.get(codename='delete_training'))
+        workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        for day, name in ((1, 'easy'), (2, 'tempo'), (3, 'long')):
+            Training.objects.create(day=f'2017-05-0{day}', training_main=name,
+                                    distance_main=10, time_main=60,
+                                    workout_plan=workout_plan)
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        self.url = reverse('api_training_batch', args=[self.workout_plan.id])
+        self.trainings = {training.training_main: training.id for training
+                          in self.workout_plan.training_set.all()}
+        self.log_user_with_permission()
+
+    def post_operations(self, operations):
+        return self.client.post(
+            self.url, json.dumps({'operations': operations}),
+            content_type='application/json')
+
+    def get_days(self):
+        return dict(self.workout_plan.training_set.values_list(
+            'training_main', 'day'))
+
+    def test_view_checks_if_user_has_proper_permission(self):
+        self.client.logout()
+        self.log_non_permission_user()
+        response = self.post_operations([])
+        self.assertEqual(response.status_code, 403)
+
+    def test_view_applies_all_operations(self):
+        response = self.post_operations([
+            {'op': 'create', 'data': {'day': '2017-05-04',
+                                      'training_main': 'intervals',
+                                      'distance_main': 8, 'time_main': 40}},
+            {'op': 'update', 'id': self.trainings['tempo'],
+             'data': {'time_main': 50}},
+            {'op': 'delete', 'id': self.trainings['long']},
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results],
+                         ['created', 'updated', 'deleted'])
+        self.assertEqual(Training.objects.get(id=results[0]['id']).day,
+                         date(2017, 5, 4))
+        self.assertEqual(Training.objects.get(
+            id=self.trainings['tempo']).time_main, 50)
+        self.assertFalse(Training.objects.filter(
+            id=self.trainings['long']).exists())
+        self.workout_plan.refresh_from_db()
+        self.assertEqual(self.workout_plan.total_distance, Decimal('28.0'))
+        self.assertEqual(self.workout_plan.total_time, 150)
+        self.assertEqual(self.workout_plan.training_count, 3)
+
+    def test_trainings_can_swap_days(self):
+        response = self.post_operations([
+            {'op': 'update', 'id': self.trainings['easy'],
+             'data': {'day': '2017-05-02'}},
+            {'op': 'update', 'id': self.trainings['tempo'],
+             'data': {'day': '2017-05-01'}},
+        ])
+        self.assertEqual(response.status_code, 200)
+        days = self.get_days()
+        self.assertEqual((days['easy'], days['tempo']),
+                         (date(2017, 5, 2), date(2017, 5, 1)))
+
+    def test_invalid_operation_rejects_whole_batch(self):
+        response = self.post_operations([
+            {'op': 'delete', 'id': self.trainings['easy']},
+            {'op': 'create', 'data': {'day': '2017-05-03',
+                                      'training_main': 'easy'}},
+            {'op': 'update', 'id': 0, 'data': {}},
+        ])
+        self.assertEqual(response.status_code, 400)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results],
+                         ['valid', 'error', 'error'])
+        self.assertEqual(results[1]['errors'],
+                         {'day': [imports.DAY_TAKEN_ERROR]})
+        self.assertEqual(len(self.get_days()), 3)
+
+    def test_invalid_ids_are_reported_per_operation(self):
+        response = self.post_operations([
+            {'op': 'update', 'id': [self.trainings['easy']], 'data': {}},
+            {'op': 'delete', 'id': {'id': self.trainings['tempo']}},
+            {'op': 'delete', 'id': True},
+        ])
+        self.assertEqual(response.status_code, 400)
+        results = response.json()['results']
+        self.assertEqual([result['errors'] for result in results],
+                         [{'id': ['Id must be a number']}] * 3)
+        self.assertEqual(len(self.get_days()), 3)
+
+    def test_changed_trainings_are_locked_until_applied(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.post_operations([{'op': 'update',
+                                   'id': self.trainings['easy'],
+                                   'data': {'time_main': 70}}])
+        self.assertTrue(any(
+            query['sql'].endswith('FOR UPDATE') and
+            Training._meta.db_table in query['sql'] for query in queries))
+
+    def test_batch_uses_constant_number_of_queries(self):
+        operations = [{'op': 'update', 'id': training_id,
+                       'data': {'time_main': 70}}
+                      for training_id in self.trainings.values()]
+        # session, user, two permission queries, workout plan, two
+        # savepoints and their releases, locked trainings, days, two
+        # constraint mode changes, bulk update and plan update
+        with self.assertNumQueries(15):
+            self.post_operations(operations)
+
+
+class SyncApiViewTest(PermissionRequiredViewTest):
+    @classmethod
+    def setUpTestData(cls):
+        super(SyncApiViewTest, cls).setUpTestData()
+        user = User.objects.get(username='user_with_permission')
+        user.user_permissions.add(
+            Permission.objects.get(codename='view_workoutplan'),
+            Permission.objects.get(codename='view_training'),
+            Permission.objects.get(codename='view_trainingdiary'))
+        workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        for day in ('2017-05-01', '2017-05-02'):
+            Training.objects.create(day=day, training_main='run',
+                                    distance_main=10, time_main=60,
+                                    workout_plan=workout_plan)
+
+    def setUp(self):
+        self.workout_plan = WorkoutPlan.objects.get(name='setUp plan 1')
+        self.log_user_with_permission()
+
+    def sync(self, token=None):
+        query = {'since': token} if token else {}
+        return self.client.get(reverse('api_sync'), query).json()
+
+    def test_view_checks_if_user_has_proper_permission(self):
+        self.client.logout()
+        self.log_non_permission_user()
+        response = self.client.get(reverse('api_sync'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_first_sync_returns_all_objects(self):
+        data = self.sync()
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['plans']), 3)
+        self.assertEqual([training['day'] for training in data['trainings']],
+                         ['2017-05-01', '2017-05-02'])
+        self.assertEqual(data['diary'], [])
+
+    def test_sync_returns_only_changes_after_token(self):
+        with patch('RunScheduleApp.sync.SYNC_OVERLAP', timedelta(0)):
+            token = self.sync()['token']
+            training = self.workout_plan.training_set.get(day='2017-05-01')
+            training.time_main = 70
+            training.save()
+            deleted = self.workout_plan.training_set.get(day='2017-05-02')
+            deleted_id = deleted.id
+            deleted.delete()
+            data = self.sync(token)
+        self.assertFalse(data['full'])
+        self.assertEqual([t['time_main'] for t in data['trainings']], [70])
+        # Aggregates of the plan changed with its trainings.
+        self.assertEqual([p['name'] for p in data['plans']], ['setUp plan 1'])
+        self.assertEqual(data['deleted'], {'plans': [], 'diary': [],
+                                           'trainings': [deleted_id]})
+
+    def test_sync_without_changes_returns_empty_lists(self):
+        with patch('RunScheduleApp.sync.SYNC_OVERLAP', timedelta(0)):
+            token = self.sync()['token']
+            data = self.sync(token)
+        self.assertEqual((data['plans'], data['trainings'], data['diary']),
+                         ([], [], []))
+
+    def test_invalid_token_returns_error(self):
+        response = self.client.get(reverse('api_sync'), {'since': 'abc'})
+        self.assertEqual(response.status_code, 400)
@@ -1,18 +1,29 @@
-from datetime import datetime, timedelta
-from calendar import HTMLCalendar
+from datetime import date, datetime, timedelta
+from calendar import HTMLCalendar, monthrange
 
 from django.contrib.auth import login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.mixins import PermissionRequiredMixin
 from django.contrib.auth.models import Permission
-from django.http import HttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.db.models.functions import NullIf
+from django.http import Http404, HttpResponse, JsonResponse
+from django.http import StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.html import escape
+from django.utils.http import http_date, quote_etag
 from django.utils.safestring import mark_safe
 from django.views import View
 
+from RunScheduleApp import analytics, calendar_cache, exports, ical, imports
 from RunScheduleApp.forms import *
-from RunScheduleApp.models import WorkoutPlan, Training
+from RunScheduleApp.models import MonthlyDiaryRollup, WeeklyDiaryRollup
+from RunScheduleApp.models import RecurrenceRule, WorkoutPlan, Training
+from RunScheduleApp.models import keyset_filter
 
 
 class MainPageView(View):
@@ -21,11 +32,74 @@ class MainPageView(View):
     def get(self, request):
         """Display application's home page.
 
+        Logged users see a dashboard with today's and this week's
+        trainings from all their workout plans, including days of
+        recurrence rules, which link to the form saving the training.
+
         :param request: request object
         :return: home page view
         :rtype: HttpResponse
         """
-        return render(request, 'RunScheduleApp/main_page.html')
+        if not request.user.is_authenticated:
+            return render(request, 'RunScheduleApp/main_page.html')
+        today = get_today_date()
+        week_start = today - timedelta(days=today.weekday())
+        week_end = week_start + timedelta(days=6)
+        user_plans = WorkoutPlan.objects.filter(owner=request.user)
+        current_plans = list(user_plans.covering(today).order_by('name'))
+        week_plans = user_plans.overlapping(week_start, week_end)
+        week_trainings = list(Training.objects.filter(
+            workout_plan__in=week_plans,
+            day__range=(week_start, week_end)).select_related(
+            'workout_plan'))
+        week_trainings += self.get_rule_trainings(
+            RecurrenceRule.objects.filter(
+                workout_plan__in=week_plans, start_date__lte=week_end,
+                end_date__gte=week_start).select_related('workout_plan'),
+            week_start, week_end,
+            {(t.workout_plan_id, t.day) for t in week_trainings})
+        week_trainings.sort(key=lambda t: (t.day, t.workout_plan.name))
+        ctx = {
+            'current_plans': current_plans,
+            'today_trainings': [t for t in week_trainings if t.day == today],
+            'week_trainings': week_trainings,
+            'date_today': today,
+            'week_start': week_start,
+            'week_end': week_end,
+        }
+        return render(request, 'RunScheduleApp/main_page.html', ctx)
+
+    @staticmethod
+    def get_rule_trainings(rules, start, end, taken_days):
+        """Create unsaved trainings on days of recurrence rules.
+
+        :param rules: recurrence rules with their workout plans
+        :type rules: collections.Iterable[RecurrenceRule]
+        :param start: first day of the period
+        :type start: date
+        :param end: last day of the period
+        :type end: date
+        :param taken_days: (workout plan id, date) pairs of saved
+            trainings, which replace rules on their days
+        :type taken_days: set
+        :return: trainings with rule_id set to the id of their rule
+        :rtype: list[Training]
+        """
+        rules_by_plan = {}
+        for rule in rules:
+            rules_by_plan.setdefault(rule.workout_plan, []).append(rule)
+        trainings = []
+        for workout_plan, plan_rules in rules_by_plan.items():
+            plan_start, plan_end = workout_plan.get_start_and_end_date()
+            days = RecurrenceRule.expand(plan_rules, max(start, plan_start),
+                                         min(end, plan_end))
+            for day, rule in days.items():
+                if (workout_plan.id, day) not in taken_days:
+                    training = rule.create_training(day)
+                    training.workout_plan = workout_plan
+                    training.rule_id = rule.id
+                    trainings.append(training)
+        return trainings
 
 
 class WorkoutPlanAddView(PermissionRequiredMixin, View):
@@ -57,9 +131,13 @@ class WorkoutPlanAddView(PermissionRequiredMixin, View):
         user = request.user
         if form.is_valid():
             form.instance.owner = user
-            new_plan = form.save()
-            if new_plan.is_active:
-                WorkoutPlan.set_active(new_plan.id, user)
+            # Only one plan may be active, the flag is switched by
+            # set_active after the plan is created.
+            form.instance.is_active = False
+            with transaction.atomic():
+                new_plan = form.save()
+                if form.cleaned_data.get('is_active'):
+                    WorkoutPlan.set_active(new_plan.id, user)
             return redirect('workout_plans')
         return render(request, self.template_name, {'form': form})
 
@@ -105,6 +183,90 @@ class WorkoutPlanEditView(PermissionRequiredMixin, View):
                       {'form': form, 'plan_id': plan_id})
 
 
+class WorkoutPlanCloneView(PermissionRequiredMixin, View):
+    """The class that copies a workout plan to a new start date."""
+
+    permission_required = 'RunScheduleApp.add_workoutplan'
+    form_class = WorkoutPlanCloneForm
+    template_name = 'RunScheduleApp/workout_plan_clone.html'
+
+    def get(self, request, plan_id):
+        """Display the form for copying a workout plan.
+
+        :param request: request object
+        :param plan_id: id of a workout plan to be copied
+        :type plan_id: int
+        :return: form view
+        :rtype: HttpResponse
+        """
+        workout_plan = get_object_or_404(WorkoutPlan, pk=plan_id)
+        workout_plan.check_owner(request.user)
+        form = self.form_class(initial={'name': workout_plan.name})
+        ctx = {'form': form, 'workout_plan': workout_plan}
+        return render(request, self.template_name, ctx)
+
+    def post(self, request, plan_id):
+        """Copy a workout plan with all its trainings.
+
+        :param request: request object
+        :param plan_id: id of a workout plan to be copied
+        :type plan_id: int
+        :return: details of the new workout plan or form view with
+            error massages
+        :rtype: HttpResponse
+        """
+        workout_plan = get_object_or_404(WorkoutPlan, pk=plan_id)
+        workout_plan.check_owner(request.user)
+        form = self.form_class(request.POST)
+        if form.is_valid():
+            new_plan = workout_plan.clone(form.cleaned_data['start_date'],
+                                          form.cleaned_data['name'])
+            return redirect('plan_details', new_plan.id)
+        ctx = {'form': form, 'workout_plan': workout_plan}
+        return render(request, self.template_name, ctx)
+
+
+class WorkoutPlanShiftView(PermissionRequiredMixin, View):
+    """The class that moves trainings of a workout plan by some days."""
+
+    permission_required = 'RunScheduleApp.change_workoutplan'
+    form_class = WorkoutPlanShiftForm
+    template_name = 'RunScheduleApp/workout_plan_shift.html'
+
+    def get(self, request, plan_id):
+        """Display the form for moving trainings of a workout plan.
+
+        :param request: request object
+        :param plan_id: id of a workout plan
+        :type plan_id: int
+        :return: form view
+        :rtype: HttpResponse
+        """
+        workout_plan = get_object_or_404(WorkoutPlan, pk=plan_id)
+        workout_plan.check_owner(request.user)
+        form = self.form_class(workout_plan=workout_plan)
+        ctx = {'form': form, 'workout_plan': workout_plan}
+        return render(request, self.template_name, ctx)
+
+    def post(self, request, plan_id):
+        """Move trainings of a workout plan.
+
+        :param request: request object
+        :param plan_id: id of a workout plan
+        :type plan_id: int
+        :return: details of the workout plan or form view with error
+            massages
+        :rtype: HttpResponse
+        """
+        workout_plan = get_object_or_404(WorkoutPlan, pk=plan_id)
+        workout_plan.check_owner(request.user)
+        form = self.form_class(request.POST, workout_plan=workout_plan)
+        if form.is_valid() and form.save() is not None:
+            return redirect('plan_details', plan_id)
+        ctx = {'form': form, 'workout_plan': workout_plan}
+        return render(request, self.template_name, ctx)
+
+
 class WorkoutPlanDetailsView(PermissionRequiredMixin, View):
     """The class view that shows information about a workout plan."""
 
@@ -122,10 +284,40 @@ class WorkoutPlanDetailsView(PermissionRequiredMixin, View):
         workout_plan = get_object_or_404(WorkoutPlan, pk=plan_id)
         workout_plan.check_owner(request.user)
         date_today = get_today_date()
-        ctx = {'workout_plan': workout_plan, 'date_today': date_today}
+        trainings_to_log = list(workout_plan.training_set.filter(
+            day__lte=date_today, accomplished=False,
+            diary_entry__isnull=True).order_by('day'))
+        # Trainings too long for the diary are listed, but cannot be
+        # logged as planned.
+        for training in trainings_to_log:
+            training.can_log = TrainingDiary.plan_entry(
+                request.user, training) is not None
+        ctx = {'workout_plan': workout_plan, 'date_today': date_today,
+               'trainings_to_log': trainings_to_log}
         return render(request, 'RunScheduleApp/plan_details.html', ctx)
 
 
+class WorkoutPlanAdherenceView(PermissionRequiredMixin, View):
+    """The class view that compares a workout plan with the diary."""
+
+    permission_required = 'RunScheduleApp.view_workoutplan'
+
+    def get(self, request, plan_id):
+        """Display planned and actual distance and time per week.
+
+        :param request: request object
+        :param plan_id: workout plan id
+        :type plan_id: int
+        :return: weekly adherence report of the workout plan
+        :rtype: HttpResponse
+        """
+        workout_plan = get_object_or_404(WorkoutPlan, pk=plan_id)
+        workout_plan.check_owner(request.user)
+        ctx = {'workout_plan': workout_plan,
+               'weeks': workout_plan.get_weekly_adherence()}
+        return render(request, 'RunScheduleApp/plan_adherence.html', ctx)
+
+
 class WorkoutPlanListView(LoginRequiredMixin, View):
     """The class view that shows list of all created workout plans."""
 
@@ -141,6 +333,50 @@ class WorkoutPlanListView(LoginRequiredMixin, View):
                       {'workout_plans': workout_plans})
 
 
+class WorkoutPlanFeedView(View):
+    """The class view that exports a workout plan as iCalendar feed."""
+
+    def get(self, request, plan_id, token):
+        """Stream a workout plan with its trainings in iCalendar format.
+
+        Days of recurrence rules are included as events of the rules.
+        Access is granted by the token from the feed url, so calendar
+        applications can subscribe without logging in. The response
+        carries ETag and Last-Modified headers based on the plan's
+        modification time, polling clients get 304 when nothing changed.
+
+        :param request: request object
+        :param plan_id: workout plan id
+        :type plan_id: int
+        :param token: feed access token
+        :type token: str
+        :return: iCalendar feed or 304 response
+        :rtype: StreamingHttpResponse or HttpResponseNotModified
+        """
+        if not WorkoutPlan.check_feed_token(plan_id, token):
+            raise Http404
+        workout_plan = get_object_or_404(WorkoutPlan, pk=plan_id)
+        etag = quote_etag(
+            f'{workout_plan.id}-{workout_plan.updated_at.timestamp()}')
+        last_modified = int(workout_plan.updated_at.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            trainings = workout_plan.training_set.order_by('day').iterator()
+            start_date, end_date = workout_plan.get_start_and_end_date()
+            rule_days = sorted(RecurrenceRule.expand(
+                workout_plan.get_rules(), start_date, end_date).items())
+            response = StreamingHttpResponse(
+                ical.plan_feed(workout_plan, trainings, request.get_host(),
+                               rule_days),
+                content_type='text/calendar; charset=utf-8')
+            response['Content-Disposition'] = \
+                f'inline; filename="workout_plan_{workout_plan.id}.ics"'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
 class TrainingAddView(PermissionRequiredMixin, View):
     """The class that creates a new training."""
 
@@ -166,8 +402,15 @@ class TrainingAddView(PermissionRequiredMixin, View):
         """
         workout_plan = get_object_or_404(WorkoutPlan, pk=plan_id)
         workout_plan.check_owner(request.user)
-        form = self.form_class(initial={'day': training_date,
-                                        'plan_id': plan_id})
+        initial = {'day': training_date}
+        rule_id = request.GET.get('rule')
+        if rule_id and rule_id.isdigit():
+            # Saving a training of a recurrence rule replaces the rule
+            # on that day.
+            rule = get_object_or_404(RecurrenceRule, pk=rule_id,
+                                     workout_plan=workout_plan)
+            initial.update(rule.get_template())
+        form = self.form_class(initial=initial, workout_plan=workout_plan)
         ctx = {'form': form, 'plan_id': workout_plan.id,
                'training_date': training_date, 'month_number': month,
                'year_number': year}
@@ -189,10 +432,9 @@ class TrainingAddView(PermissionRequiredMixin, View):
         :rtype: HttpResponse
         """
         workout_plan = get_object_or_404(WorkoutPlan, pk=plan_id)
-        form = self.form_class(request.POST)
-        if form.is_valid():
-            form.instance.workout_plan = workout_plan
-            form.save()
+        workout_plan.check_owner(request.user)
+        form = self.form_class(request.POST, workout_plan=workout_plan)
+        if form.is_valid() and form.save():
             if month is None or year is None:
                 return redirect('plan_details', plan_id)
             return redirect('current_workout', month, year)
@@ -201,6 +443,53 @@ class TrainingAddView(PermissionRequiredMixin, View):
         return render(request, self.template_name, ctx)
 
 
+class TrainingImportView(PermissionRequiredMixin, View):
+    """The class that adds trainings from a CSV or JSON file."""
+
+    permission_required = 'RunScheduleApp.add_training'
+    form_class = TrainingImportForm
+    template_name = 'RunScheduleApp/training_import.html'
+
+    def get(self, request, plan_id):
+        """Display the form for uploading a file with trainings.
+
+        :param request: request object
+        :param plan_id: id of a workout plan to which trainings are to
+            be added
+        :type plan_id: int
+        :return: form view
+        :rtype: HttpResponse
+        """
+        workout_plan = get_object_or_404(WorkoutPlan, pk=plan_id)
+        workout_plan.check_owner(request.user)
+        ctx = {'form': self.form_class(), 'workout_plan': workout_plan}
+        return render(request, self.template_name, ctx)
+
+    def post(self, request, plan_id):
+        """Import trainings and report errors of invalid rows.
+
+        :param request: request object
+        :param plan_id: id of a workout plan to which trainings are to
+            be added
+        :type plan_id: int
+        :return: form view with number of added trainings and errors
+        :rtype: HttpResponse
+        """
+        workout_plan = get_object_or_404(WorkoutPlan, pk=plan_id)
+        workout_plan.check_owner(request.user)
+        form = self.form_class(request.POST, request.FILES)
+        ctx = {'form': form, 'workout_plan': workout_plan}
+        if form.is_valid():
+            file = form.cleaned_data['file']
+            rows = imports.read_rows(file, imports.get_format(file.name))
+            try:
+                ctx['created'], ctx['row_errors'] = imports.import_trainings(
+                    workout_plan, rows)
+            except imports.TrainingImportError as error:
+                form.add_error('file', str(error))
+        return render(request, self.template_name, ctx)
+
+
 class TrainingEditView(PermissionRequiredMixin, View):
     """The class that edits an existing training."""
 
@@ -224,11 +513,9 @@ class TrainingEditView(PermissionRequiredMixin, View):
         :return: view of the edit form
         :rtype: HttpResponse
         """
-        workout_plan = get_object_or_404(WorkoutPlan, pk=plan_id)
-        workout_plan.check_owner(request.user)
-        training = get_object_or_404(Training, pk=training_id)
-        form = self.form_class(instance=training, initial={
-            'plan_id': plan_id, 'initial_training_date': training.day})
+        training = self.get_training(request, plan_id, training_id)
+        form = self.form_class(instance=training,
+                               workout_plan=training.workout_plan)
         ctx = {'form': form, 'plan_id': plan_id, 'month_number': month,
                'year_number': year}
         return render(request, self.template_name, ctx)
@@ -251,10 +538,10 @@ class TrainingEditView(PermissionRequiredMixin, View):
             massages
         :rtype: HttpResponse
         """
-        training_to_edit = get_object_or_404(Training, pk=training_id)
-        form = self.form_class(request.POST, instance=training_to_edit)
-        if form.is_valid():
-            form.save()
+        training_to_edit = self.get_training(request, plan_id, training_id)
+        form = self.form_class(request.POST, instance=training_to_edit,
+                               workout_plan=training_to_edit.workout_plan)
+        if form.is_valid() and form.save():
             if month is None or year is None:
                 return redirect('plan_details', plan_id)
             return redirect('current_workout', month, year)
@@ -262,6 +549,25 @@ class TrainingEditView(PermissionRequiredMixin, View):
                'year_number': year}
         return render(request, self.template_name, ctx)
 
+    @staticmethod
+    def get_training(request, plan_id, training_id):
+        """Get a training together with its workout plan.
+
+        :param request: request object
+        :param plan_id: id of a workout plan to which a training
+            belongs
+        :type plan_id: int
+        :param training_id: id of a training
+        :type training_id: int
+        :return: training owned by the logged user
+        :rtype: Training
+        """
+        training = get_object_or_404(
+            Training.objects.select_related('workout_plan'),
+            pk=training_id, workout_plan_id=plan_id)
+        training.workout_plan.check_owner(request.user)
+        return training
+
 
 class TrainingDeleteView(PermissionRequiredMixin, View):
     """The class that deletes an existing training."""
@@ -284,6 +590,95 @@ class TrainingDeleteView(PermissionRequiredMixin, View):
         return redirect('plan_details', training.workout_plan.id)
 
 
+class RecurrenceRuleAddView(PermissionRequiredMixin, View):
+    """The class that creates a new recurrence rule of a workout plan."""
+
+    permission_required = 'RunScheduleApp.add_training'
+    form_class = RecurrenceRuleForm
+    template_name = 'RunScheduleApp/recurrence_rule_add.html'
+
+    def get(self, request, plan_id):
+        """Display the form for creating a new recurrence rule.
+
+        :param request: request object
+        :param plan_id: id of a workout plan to which a new rule is to
+            be added
+        :type plan_id: int
+        :return: form view
+        :rtype: HttpResponse
+        """
+        workout_plan = get_object_or_404(WorkoutPlan, pk=plan_id)
+        workout_plan.check_owner(request.user)
+        start_date, end_date = workout_plan.get_start_and_end_date()
+        form = self.form_class(
+            initial={'start_date': start_date, 'end_date': end_date},
+            workout_plan=workout_plan)
+        ctx = {'form': form, 'workout_plan': workout_plan}
+        return render(request, self.template_name, ctx)
+
+    def post(self, request, plan_id):
+        """Create a new recurrence rule.
+
+        :param request: request object
+        :param plan_id: id of a workout plan to which a new rule is to
+            be added
+        :type plan_id: int
+        :return: details of the workout plan or form view with error
+            massages
+        :rtype: HttpResponse
+        """
+        workout_plan = get_object_or_404(WorkoutPlan, pk=plan_id)
+        workout_plan.check_owner(request.user)
+        form = self.form_class(request.POST, workout_plan=workout_plan)
+        if form.is_valid():
+            form.save()
+            return redirect('plan_details', workout_plan.id)
+        ctx = {'form': form, 'workout_plan': workout_plan}
+        return render(request, self.template_name, ctx)
+
+
+class RecurrenceRuleDeleteView(PermissionRequiredMixin, View):
+    """The class that deletes a recurrence rule."""
+
+    permission_required = 'RunScheduleApp.delete_training'
+
+    def get(self, request, rule_id):
+        """Delete a selected recurrence rule.
+
+        Trainings already saved from the rule are kept.
+
+        :param request: request object
+        :param rule_id: id of a recurrence rule to delete
+        :type rule_id: int
+        :return: details of the workout plan of the deleted rule
+        :rtype: HttpResponse
+        """
+        rule = get_object_or_404(RecurrenceRule, pk=rule_id)
+        rule.workout_plan.check_owner(request.user)
+        rule.delete()
+        return redirect('plan_details', rule.workout_plan_id)
+
+
+class RecurrenceRuleMaterializeView(PermissionRequiredMixin, View):
+    """The class that saves all trainings of a recurrence rule."""
+
+    permission_required = 'RunScheduleApp.add_training'
+
+    def post(self, request, rule_id):
+        """Replace a recurrence rule with trainings.
+
+        :param request: request object
+        :param rule_id: id of a recurrence rule
+        :type rule_id: int
+        :return: details of the workout plan of the rule
+        :rtype: HttpResponse
+        """
+        rule = get_object_or_404(RecurrenceRule, pk=rule_id)
+        rule.workout_plan.check_owner(request.user)
+        rule.materialize()
+        return redirect('plan_details', rule.workout_plan_id)
+
+
 class SelectCurrentPlanView(PermissionRequiredMixin, View):
     """The class view for selecting an active workout plan"""
 
@@ -338,15 +733,22 @@ class CurrentWorkoutPlanView(LoginRequiredMixin, View):
         start_date, end_date = workout_plan.get_start_and_end_date()
         prev_month, next_month = CurrentWorkoutPlanView.previous_and_next_month(
             workout_plan, month, year)
-        calendar = WorkoutCalendar(workout_plan, month, year).formatmonth(
-            year, month)
+        today = get_today_date()
+        calendar = calendar_cache.get_month(
+            workout_plan.id, month, year, today,
+            lambda: WorkoutCalendar(workout_plan, month, year).formatmonth(
+                year, month))
         ctx = {
             'workout_plan': workout_plan,
             'calendar': mark_safe(calendar),
             'prev_month': prev_month,
             'next_month': next_month,
             'start_date': start_date,
-            'end_date': end_date
+            'end_date': end_date,
+            'month_urls': CurrentWorkoutPlanJsonView.month_urls(
+                {'month': month, 'year': year}),
+            'prev_urls': CurrentWorkoutPlanJsonView.month_urls(prev_month),
+            'next_urls': CurrentWorkoutPlanJsonView.month_urls(next_month),
         }
         return render(request, 'RunScheduleApp/current_workout_plan.html',
                       ctx)
@@ -388,12 +790,191 @@ class CurrentWorkoutPlanView(LoginRequiredMixin, View):
         return prev_month, next_month
 
 
+class CurrentWorkoutPlanJsonView(LoginRequiredMixin, View):
+    """Return one month of the active workout plan as JSON."""
+
+    def get(self, request, month, year):
+        """Return trainings of the active plan in a given month.
+
+        Trainings are indexed by day number and stored as lists of
+        training id, training info and accomplished flag. Urls to add
+        and edit trainings contain "{}" in place of date or training
+        id, urls of previous and next month are given when they are in
+        the plan. The response carries ETag based on the plan's calendar
+        version, so unchanged months cost 304 without a query.
+
+        :param request: request object
+        :param month: month number
+        :type month: int
+        :param year: year number
+        :type year: int
+        :return: month data of the active plan
+        :rtype: JsonResponse or HttpResponseNotModified
+        """
+        workout_plan = WorkoutPlan.get_active(request.user)
+        if not workout_plan:
+            return JsonResponse({'plan': None})
+        etag = quote_etag(f'{workout_plan.id}-'
+                          f'{calendar_cache.get_version(workout_plan.id)}-'
+                          f'{year}-{month}')
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = JsonResponse(
+                self.month_data(workout_plan, month, year))
+        response['ETag'] = etag
+        return response
+
+    @staticmethod
+    def month_data(workout_plan, month, year):
+        """Prepare month data of a workout plan using one query, two
+        for plans with recurrence rules.
+
+        Days of recurrence rules are stored as lists with None in place
+        of training id, training info, False and rule id.
+
+        :param workout_plan: workout plan
+        :type workout_plan: WorkoutPlan
+        :param month: month number
+        :type month: int
+        :param year: year number
+        :type year: int
+        :return: month data ready to be serialized
+        :rtype: dict
+        """
+        start_date, end_date = workout_plan.get_start_and_end_date()
+        prev_month, next_month = \
+            CurrentWorkoutPlanView.previous_and_next_month(
+                workout_plan, month, year)
+        first_day = date(year, month, 1)
+        last_day = first_day.replace(day=monthrange(year, month)[1])
+        trainings = list(workout_plan.training_set.filter(
+            day__range=(first_day, last_day)))
+        calendar = WorkoutCalendar(
+            workout_plan, month, year,
+            trainings={t.day.day: (t.id, t.training_info())
+                       for t in trainings})
+        month_trainings = {
+            day: [None, rule.training_info(), False, rule.id]
+            for day, rule in calendar.rule_dict.items()}
+        month_trainings.update({
+            t.day.day: [t.id, t.training_info(), t.accomplished]
+            for t in trainings})
+        return {
+            'plan': {'id': workout_plan.id, 'name': workout_plan.name,
+                     'start': start_date, 'end': end_date},
+            'month': month,
+            'year': year,
+            'prev': prev_month,
+            'next': next_month,
+            'trainings': month_trainings,
+            'urls': {'add': calendar.add_link_pattern,
+                     'edit': calendar.edit_link_pattern,
+                     'prev': CurrentWorkoutPlanJsonView.month_urls(prev_month),
+                     'next': CurrentWorkoutPlanJsonView.month_urls(
+                         next_month)},
+        }
+
+    @staticmethod
+    def month_urls(month):
+        """Get urls of the calendar page and month data of a month.
+
+        :param month: month and year number or None
+        :type month: dict or None
+        :return: urls of the page and data or None without a month
+        :rtype: dict or None
+        """
+        if not month:
+            return None
+        args = [month['month'], month['year']]
+        return {'page': reverse('current_workout', args=args),
+                'json': reverse('current_workout_json', args=args)}
+
+
+class SeasonWorkoutPlanView(LoginRequiredMixin, View):
+    """Display calendars of all months of the active workout plan."""
+
+    template_name = 'RunScheduleApp/season_workout_plan.html'
+    # Marks the place in the rendered template where months are streamed.
+    months_marker = '<!-- season months -->'
+
+    def get(self, request):
+        """Stream calendars of every month in the active workout plan.
+
+        The page is sent in parts: the template above the calendars,
+        then one month at a time and finally the rest of the template,
+        so the first bytes arrive before the whole season is rendered.
+
+        :param request: request object
+        :return: season view of the active workout plan
+        :rtype: StreamingHttpResponse or HttpResponse
+        """
+        workout_plan = WorkoutPlan.get_active(request.user)
+        if not workout_plan:
+            return render(request, 'RunScheduleApp/current_workout_plan.html',
+                          {'workout_plan': ''})
+        page = render_to_string(self.template_name, {
+            'workout_plan': workout_plan,
+            'months_marker': mark_safe(self.months_marker)}, request)
+        head, tail = page.split(self.months_marker, 1)
+        return StreamingHttpResponse(
+            self.stream_page(workout_plan, head, tail))
+
+    def stream_page(self, workout_plan, head, tail):
+        """Generate parts of the season page.
+
+        :param workout_plan: workout plan
+        :type workout_plan: WorkoutPlan
+        :param head: page content before the calendars
+        :type head: str
+        :param tail: page content after the calendars
+        :type tail: str
+        :return: generator of HTML parts
+        :rtype: collections.Iterator[str]
+        """
+        yield head
+        start_date, end_date = workout_plan.get_start_and_end_date()
+        trainings = workout_plan.training_set.filter(
+            day__range=(start_date, end_date)).order_by('day').iterator()
+        training = next(trainings, None)
+        rules = workout_plan.get_rules()
+        for year, month in self.months_in_range(start_date, end_date):
+            month_trainings = {}
+            while training is not None and \
+                    (training.day.year, training.day.month) == (year, month):
+                month_trainings[training.day.day] = (
+                    training.id, training.training_info())
+                training = next(trainings, None)
+            yield WorkoutCalendar(workout_plan, month, year, month_trainings,
+                                  rules).formatmonth(year, month)
+        yield tail
+
+    @staticmethod
+    def months_in_range(start_date, end_date):
+        """Generate all months between two dates.
+
+        :param start_date: first date
+        :type start_date: date
+        :param end_date: last date
+        :type end_date: date
+        :return: generator of year and month numbers
+        :rtype: collections.Iterator[tuple[int, int]]
+        """
+        year, month = start_date.year, start_date.month
+        while (year, month) <= (end_date.year, end_date.month):
+            yield year, month
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
 class WorkoutCalendar(HTMLCalendar):
     """A class used to create monthly workout calendar in HTML"""
 
     table_css_class = 'month table calendar'
+    # Stand-in value used to reverse url patterns once per calendar, it is
+    # swapped for the real training id or date when the cells are rendered.
+    link_placeholder = 987654321
 
-    def __init__(self, workout_plan, month, year):
+    def __init__(self, workout_plan, month, year, trainings=None,
+                 rules=None):
         """
         :param workout_plan: workout plan
         :type workout_plan: WorkoutPlan
@@ -401,6 +982,15 @@ class WorkoutCalendar(HTMLCalendar):
         :type month: int
         :param year: year number
         :type year: int
+        :param trainings: trainings in the month already fetched by
+            the caller, day number as key and tuple of training id and
+            training info as value, optional (default = None - trainings
+            are fetched from the database)
+        :type trainings: dict[int, tuple[int, str]] or None
+        :param rules: recurrence rules of the workout plan already
+            fetched by the caller, optional (default = None - rules are
+            fetched from the database if the plan has any)
+        :type rules: list[RecurrenceRule] or None
         """
         super(WorkoutCalendar, self).__init__()
         self.month = month
@@ -408,7 +998,21 @@ class WorkoutCalendar(HTMLCalendar):
         self.workout_plan = workout_plan
         self.workout_plan_start_date, self.workout_plan_end_date = \
             workout_plan.get_start_and_end_date()
-        self.training_dict = self.get_trainings_dict()
+        self.first_day = date(year, month, 1)
+        self.last_day = self.first_day.replace(day=monthrange(year, month)[1])
+        self.today = get_today_date()
+        if trainings is None:
+            trainings = self.get_trainings_dict()
+        self.training_dict = trainings
+        if rules is None:
+            rules = workout_plan.get_rules()
+        self.rule_dict = self.get_rule_dict(rules)
+        self.add_link_pattern = self.create_link_pattern(
+            'add_training_date',
+            [workout_plan.id, month, year, self.link_placeholder])
+        self.edit_link_pattern = self.create_link_pattern(
+            'edit_training_month',
+            [workout_plan.id, self.link_placeholder, month, year])
 
     def formatday(self, day, weekday):
         """Return a day as a table cell.
@@ -425,11 +1029,21 @@ class WorkoutCalendar(HTMLCalendar):
             return '<td class="noday">&nbsp;</td>'
 
         if day in self.training_dict:  # Training days.
+            training_id, training_info = self.training_dict[day]
             css_class = self.set_css_class(day, weekday, is_training_day=True)
-            link = self.create_training_edit_link(day)
+            link = self.create_training_edit_link(training_id)
             result = f'<td class="{css_class}"><a href="{link}">{day}' \
                      f'<br><div class="training_info">' \
-                     f'{self.training_dict.get(day)}</div></a></td>'
+                     f'{escape(training_info)}</div></a></td>'
+            return result
+
+        elif day in self.rule_dict:  # Training days of recurrence rules.
+            rule = self.rule_dict[day]
+            css_class = self.set_css_class(day, weekday, is_training_day=True)
+            link = self.create_training_add_link(day, rule.id)
+            result = f'<td class="{css_class} rule_day"><a href="{link}">' \
+                     f'{day}<br><div class="training_info">' \
+                     f'{escape(rule.training_info())}</div></a></td>'
             return result
 
         else:  # Non-training days.
@@ -469,43 +1083,55 @@ class WorkoutCalendar(HTMLCalendar):
         a('\n')
         return ''.join(v)
 
-    def create_training_add_link(self, day):
+    def create_link_pattern(self, url_name, args):
+        """Reverse a url once and turn it into a format string.
+
+        :param url_name: name of the url pattern
+        :type url_name: str
+        :param args: url arguments, the one to be filled in later
+            equals to link_placeholder
+        :type args: list
+        :return: url with a replacement field in place of the
+            placeholder
+        :rtype: str
+        """
+        link = reverse(url_name, args=args)
+        return link.replace(str(self.link_placeholder), '{}', 1)
+
+    def create_training_add_link(self, day, rule_id=None):
         """Create a link to add a training.
 
         :param day: day number
         :type day: int
+        :param rule_id: id of a recurrence rule filling in the form,
+            optional (default = None)
+        :type rule_id: int or None
         :return: url to add training on a given day
         :rtype: str
         """
-        link_date = self.create_date(day)
-        link = reverse('add_training_date', args=[
-            self.workout_plan.id, self.month, self.year, link_date])
+        link = self.add_link_pattern.format(self.create_date(day))
+        if rule_id is not None:
+            link += f'?rule={rule_id}'
         return link
 
-    def create_training_edit_link(self, day):
+    def create_training_edit_link(self, training_id):
         """Create a link to edit a training.
 
-        :param day: day number
-        :type day: int
-        :return: url to edit training on a given day
+        :param training_id: id of a training to edit
+        :type training_id: int
+        :return: url to edit the training
         :rtype: str
         """
-        link_date = self.create_date(day)
-        training_id = Training.objects.filter(
-            workout_plan=self.workout_plan).get(day=link_date).id
-        link = reverse('edit_training_month', args=[
-            self.workout_plan.id, training_id, self.month, self.year])
-        return link
+        return self.edit_link_pattern.format(training_id)
 
     def create_date(self, day):
-        """Create full date in datetime format.
+        """Create full date from a day number.
 
         :param day: day number
         :return: date
-        :rtype: datetime
+        :rtype: date
         """
-        full_date = f"{self.year}-{self.month}-{day}"
-        return datetime.strptime(full_date, "%Y-%m-%d").date()
+        return self.first_day + timedelta(days=day - 1)
 
     def set_css_class(self, day, weekday, is_training_day):
         """Set css classes for table cell.
@@ -523,7 +1149,7 @@ class WorkoutCalendar(HTMLCalendar):
         """
         full_date = self.create_date(day)
         css_class = self.cssclasses[weekday]
-        if full_date == get_today_date():
+        if full_date == self.today:
             return css_class + ' today'
         if full_date == self.workout_plan_start_date:
             return css_class + ' plan_start_day'
@@ -535,16 +1161,30 @@ class WorkoutCalendar(HTMLCalendar):
             return css_class
 
     def get_trainings_dict(self):
-        """Create dictionary with trainings.
+        """Create dictionary with trainings using a single query.
 
         :return: information about trainings in formatted month,
-            day number as key and information about training in that
-            day as value
-        :rtype: dict[int, str]
+            day number as key and tuple of training id and information
+            about training in that day as value
+        :rtype: dict[int, tuple[int, str]]
         """
         trainings = self.workout_plan.training_set.filter(
-            day__year=self.year).filter(day__month=self.month).order_by('day')
-        return {t.day.day: t.training_info() for t in trainings}
+            day__range=(self.first_day, self.last_day))
+        return {t.day.day: (t.id, t.training_info()) for t in trainings}
+
+    def get_rule_dict(self, rules):
+        """Expand recurrence rules in days of the month without trainings.
+
+        :param rules: recurrence rules of the workout plan
+        :type rules: collections.Iterable
+        :return: day number as key and recurrence rule as value
+        :rtype: dict[int, RecurrenceRule]
+        """
+        days = RecurrenceRule.expand(
+            rules, max(self.first_day, self.workout_plan_start_date),
+            min(self.last_day, self.workout_plan_end_date))
+        return {day.day: rule for day, rule in days.items()
+                if day.day not in self.training_dict}
 
 
 class LoginView(View):
@@ -732,18 +1372,82 @@ class TrainingDiaryView(PermissionRequiredMixin, View):
     """The class view that shows entries in training diary."""
 
     permission_required = 'RunScheduleApp.view_trainingdiary'
+    form_class = DiaryFilterForm
+    page_size = 50
 
     def get(self, request):
-        """Display user's training diary.
+        """Display one page of user's training diary.
+
+        Pages are selected with a cursor (date and id of the last entry
+        on the previous page) instead of an offset, so every page is a
+        single index range scan, no matter how far it is.
 
         :param request: request object
         :return: view of training diary belonging to logged user
         :rtype: HttpResponse
         """
-        user = User.objects.get(id=request.user.id)
-        diary_entries = user.trainingdiary_set.all().order_by('date')
-        return render(request, 'RunScheduleApp/training_diary_view.html',
-                      {'diary_entries': diary_entries})
+        form = self.form_class(request.GET)
+        diary_entries = request.user.trainingdiary_set.annotate(
+            pace=ExpressionWrapper(
+                F('training_time') / NullIf('training_distance', 0),
+                output_field=DecimalField())).order_by('date', 'id')
+        cursor = None
+        if form.is_valid():
+            date_from = form.cleaned_data.get('date_from')
+            date_to = form.cleaned_data.get('date_to')
+            cursor = form.cleaned_data.get('after')
+            if date_from:
+                diary_entries = diary_entries.filter(date__gte=date_from)
+            if date_to:
+                diary_entries = diary_entries.filter(date__lte=date_to)
+        if cursor:
+            diary_entries = keyset_filter(diary_entries, ('date', 'id'),
+                                          cursor)
+        diary_entries = list(diary_entries[:self.page_size + 1])
+        next_page = None
+        if len(diary_entries) > self.page_size:
+            diary_entries = diary_entries[:self.page_size]
+            last_entry = diary_entries[-1]
+            query = request.GET.copy()
+            query['after'] = f'{last_entry.date.isoformat()}_{last_entry.id}'
+            next_page = query.urlencode()
+        first_page = None
+        if cursor:
+            query = request.GET.copy()
+            query.pop('after')
+            first_page = query.urlencode()
+        ctx = {'diary_entries': diary_entries, 'form': form,
+               'next_page': next_page, 'first_page': first_page}
+        ctx.update(self.get_rollups(request.user, diary_entries))
+        return render(request, 'RunScheduleApp/training_diary_view.html', ctx)
+
+    @staticmethod
+    def get_rollups(user, diary_entries):
+        """Get weekly and monthly totals of weeks and months shown on
+        the page.
+
+        Totals are read from rollup tables, so their cost does not
+        depend on the length of user's diary.
+
+        :param user: owner of the diary
+        :type user: User
+        :param diary_entries: entries shown on the page, ordered by date
+        :type diary_entries: list
+        :return: weekly and monthly totals
+        :rtype: dict
+        """
+        if not diary_entries:
+            return {'weekly_totals': [], 'monthly_totals': []}
+        first_day = diary_entries[0].date
+        last_day = diary_entries[-1].date
+        totals = {}
+        for name, rollup in (('weekly_totals', WeeklyDiaryRollup),
+                             ('monthly_totals', MonthlyDiaryRollup)):
+            totals[name] = rollup.objects.filter(
+                user=user,
+                period_start__range=(rollup.get_period_start(first_day),
+                                     last_day)).order_by('period_start')
+        return totals
 
 
 class DiaryEntryAddView(PermissionRequiredMixin, View):
@@ -752,6 +1456,7 @@ class DiaryEntryAddView(PermissionRequiredMixin, View):
     permission_required = 'RunScheduleApp.add_trainingdiary'
     form_class = DiaryEntryForm
     template_name = 'RunScheduleApp/diary_entry_add.html'
+    entry_exists_error = 'This training is already in your diary'
 
     def get(self, request, training_id):
         """Display the form for creating a new diary entry.
@@ -764,6 +1469,7 @@ class DiaryEntryAddView(PermissionRequiredMixin, View):
         :rtype: HttpResponse
         """
         training = get_object_or_404(Training, pk=training_id)
+        training.workout_plan.check_owner(request.user)
         distance = training.calculate_distance()
         time = training.calculate_time()
         form = self.form_class(initial={
@@ -785,16 +1491,134 @@ class DiaryEntryAddView(PermissionRequiredMixin, View):
         new_diary_entry = TrainingDiary()
         form = self.form_class(data=request.POST, instance=new_diary_entry)
         training = get_object_or_404(Training, pk=training_id)
+        training.workout_plan.check_owner(request.user)
+        if TrainingDiary.objects.filter(training=training).exists():
+            form.add_error(None, self.entry_exists_error)
         if form.is_valid():
             form.instance.user = request.user
-            form.save()
-            training.accomplished = True
-            training.save()
-            return redirect('plan_details', training.workout_plan.id)
+            form.instance.training = training
+            try:
+                with transaction.atomic():
+                    form.save()
+                    training.accomplished = True
+                    training.save()
+            except IntegrityError:
+                # Entry of the training added by a concurrent request.
+                if not TrainingDiary.objects.filter(
+                        training=training).exists():
+                    raise
+                form.add_error(None, self.entry_exists_error)
+            else:
+                return redirect('plan_details', training.workout_plan.id)
         ctx = {'form': form, 'training': training}
         return render(request, self.template_name, ctx)
 
 
+class TrainingsLogView(PermissionRequiredMixin, View):
+    """The class that adds many past trainings to training diary."""
+
+    permission_required = 'RunScheduleApp.add_trainingdiary'
+
+    def post(self, request, plan_id):
+        """Create diary entries of selected trainings as they were planned.
+
+        :param request: request object
+        :param plan_id: id of a workout plan of the trainings
+        :type plan_id: int
+        :return: details of the workout plan
+        :rtype: HttpResponse
+        """
+        workout_plan = get_object_or_404(WorkoutPlan, pk=plan_id)
+        workout_plan.check_owner(request.user)
+        training_ids = [training_id
+                        for training_id in request.POST.getlist('training')
+                        if training_id.isdigit()]
+        trainings = workout_plan.training_set.filter(
+            pk__in=training_ids, day__lte=get_today_date())
+        TrainingDiary.log_trainings(request.user, trainings)
+        return redirect('plan_details', workout_plan.id)
+
+
+class DiaryExportView(PermissionRequiredMixin, View):
+    """The class view that exports the training diary to a file."""
+
+    permission_required = 'RunScheduleApp.view_trainingdiary'
+    form_class = DiaryExportForm
+    template_name = 'RunScheduleApp/diary_export.html'
+
+    def get(self, request):
+        """Stream the logged user's diary entries as CSV or XLSX file.
+
+        Without a file format in the query string the export form is
+        displayed.
+
+        :param request: request object
+        :return: file with diary entries or form view
+        :rtype: StreamingHttpResponse or HttpResponse
+        """
+        if 'file_format' not in request.GET:
+            return render(request, self.template_name,
+                          {'form': self.form_class()})
+        form = self.form_class(request.GET)
+        if not form.is_valid():
+            return render(request, self.template_name, {'form': form})
+        diary_entries = request.user.trainingdiary_set.order_by('date', 'id')
+        date_from = form.cleaned_data.get('date_from')
+        date_to = form.cleaned_data.get('date_to')
+        if date_from:
+            diary_entries = diary_entries.filter(date__gte=date_from)
+        if date_to:
+            diary_entries = diary_entries.filter(date__lte=date_to)
+        file_format = form.cleaned_data['file_format']
+        response = StreamingHttpResponse(
+            exports.EXPORTERS[file_format](diary_entries),
+            content_type=exports.CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = \
+            f'attachment; filename="training_diary.{file_format}"'
+        return response
+
+
+class DiaryStatisticsView(PermissionRequiredMixin, View):
+    """The class view that shows statistics of the training diary."""
+
+    permission_required = 'RunScheduleApp.view_trainingdiary'
+    template_name = 'RunScheduleApp/diary_statistics.html'
+
+    def get(self, request):
+        """Display statistics of the logged user's training diary.
+
+        :param request: request object
+        :return: statistics of the whole diary and of each month
+        :rtype: HttpResponse
+        """
+        ctx = TrainingDiary.get_statistics(request.user)
+        return render(request, self.template_name, ctx)
+
+
+class TrainingLoadView(PermissionRequiredMixin, View):
+    """The class view that charts training load of the logged user."""
+
+    permission_required = 'RunScheduleApp.view_trainingdiary'
+    template_name = 'RunScheduleApp/training_load.html'
+
+    def get(self, request):
+        """Display training load metrics calculated from the diary.
+
+        :param request: request object
+        :return: chart and latest values of training load metrics
+        :rtype: HttpResponse
+        """
+        result = analytics.get_training_load(request.user, get_today_date())
+        latest = {measure: {name: values[-1]
+                            for name, values in metrics.items()}
+                  for measure, metrics in result['metrics'].items()
+                  if result['days']}
+        chart_data = {'dates': analytics.get_dates(result),
+                      'metrics': result['metrics']}
+        ctx = {'chart_data': chart_data, 'latest': latest}
+        return render(request, self.template_name, ctx)
+
+
 def get_today_date():
     """Get today's date
 
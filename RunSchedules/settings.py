@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
 import os
+import tempfile
 import dj_database_url
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -94,6 +95,40 @@ db_heroku = dj_database_url.config(default=DATABASE_URL, conn_max_age=500,
 DATABASES['default'].update(db_heroku)
 
 
+# Cache
+# Chosen with CACHE_URL environment variable:
+#   locmem://            memory of each process (default with DEBUG)
+#   file:///var/tmp/rs   files in a directory shared by processes
+#                        (default without DEBUG)
+#   redis://host:6379/0  Redis or a compatible server, needs django-redis
+#   dummy://             no caching
+# Cached values are invalidated by the process which changed the data,
+# so all processes serving the application must share the cache. Use
+# locmem only with a single process, like the development server, and
+# redis when the application runs on more than one host.
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django_redis.cache.RedisCache',
+    'dummy': 'django.core.cache.backends.dummy.DummyCache',
+}
+if DEBUG:
+    DEFAULT_CACHE_URL = 'locmem://'
+else:
+    DEFAULT_CACHE_URL = 'file://' + os.path.join(tempfile.gettempdir(),
+                                                 'run_schedules_cache')
+CACHE_URL = os.environ.get('CACHE_URL', DEFAULT_CACHE_URL)
+cache_scheme, cache_location = CACHE_URL.split('://', 1)
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[cache_scheme],
+        'LOCATION': CACHE_URL if cache_scheme == 'redis' else cache_location,
+        'KEY_PREFIX': 'run_schedules',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
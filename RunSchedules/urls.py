@@ -18,6 +18,7 @@ from django.conf.urls import url
 from django.contrib import admin
 from django.urls import path, include
 
+from RunScheduleApp import api
 from RunScheduleApp.views import *
 
 urlpatterns = [
@@ -26,6 +27,10 @@ urlpatterns = [
     url(r'^$', MainPageView.as_view(), name='home_page'),
     path('workout/<int:month>/<int:year>',
          CurrentWorkoutPlanView.as_view(), name='current_workout'),
+    path('workout/<int:month>/<int:year>/json',
+         CurrentWorkoutPlanJsonView.as_view(), name='current_workout_json'),
+    path('workout/season', SeasonWorkoutPlanView.as_view(),
+         name='season_workout'),
     url(r'^workout_list$', WorkoutPlanListView.as_view(), name='workout_plans'),
     url(r'^workout_plan_add', WorkoutPlanAddView.as_view(),
         name='workout_plan_add'),
@@ -33,6 +38,16 @@ urlpatterns = [
         name='workout_plan_edit'),
     url(r'^plan_details/(?P<plan_id>\d+)$', WorkoutPlanDetailsView.as_view(),
         name='plan_details'),
+    path('plan_adherence/<int:plan_id>', WorkoutPlanAdherenceView.as_view(),
+         name='plan_adherence'),
+    path('plan_clone/<int:plan_id>', WorkoutPlanCloneView.as_view(),
+         name='plan_clone'),
+    path('plan_shift/<int:plan_id>', WorkoutPlanShiftView.as_view(),
+         name='plan_shift'),
+    path('plan_log_trainings/<int:plan_id>', TrainingsLogView.as_view(),
+         name='log_trainings'),
+    path('plan_feed/<int:plan_id>/<token>.ics', WorkoutPlanFeedView.as_view(),
+         name='plan_feed'),
     path('training_add/<int:plan_id>', TrainingAddView.as_view(),
          name='add_training'),
     path('training_add/<int:plan_id>/<int:month>/<int:year>',
@@ -41,10 +56,32 @@ urlpatterns = [
          TrainingAddView.as_view(), name='add_training_date'),
     url(r'^training_delete/(?P<training_id>\d+)$', TrainingDeleteView.as_view(),
         name='delete_training'),
+    path('training_import/<int:plan_id>', TrainingImportView.as_view(),
+         name='import_trainings'),
+    path('recurrence_rule_add/<int:plan_id>', RecurrenceRuleAddView.as_view(),
+         name='add_recurrence_rule'),
+    path('recurrence_rule_delete/<int:rule_id>',
+         RecurrenceRuleDeleteView.as_view(), name='delete_recurrence_rule'),
+    path('recurrence_rule_materialize/<int:rule_id>',
+         RecurrenceRuleMaterializeView.as_view(),
+         name='materialize_recurrence_rule'),
     path('training_edit/<int:plan_id>/<int:training_id>',
          TrainingEditView.as_view(), name='edit_training'),
     path('training_edit/<int:plan_id>/<int:training_id>/<int:month>/<int:year>',
          TrainingEditView.as_view(), name='edit_training_month'),
+    path('api/plans', api.WorkoutPlanListApiView.as_view(),
+         name='api_plans'),
+    path('api/plans/<int:plan_id>', api.WorkoutPlanApiView.as_view(),
+         name='api_plan'),
+    path('api/plans/<int:plan_id>/trainings',
+         api.TrainingListApiView.as_view(), name='api_trainings'),
+    path('api/plans/<int:plan_id>/rules',
+         api.RecurrenceRuleListApiView.as_view(), name='api_rules'),
+    path('api/plans/<int:plan_id>/trainings/batch',
+         api.TrainingBatchApiView.as_view(), name='api_training_batch'),
+    path('api/diary', api.TrainingDiaryListApiView.as_view(),
+         name='api_diary'),
+    path('api/sync', api.SyncApiView.as_view(), name='api_sync'),
     url(r'^login$', LoginView.as_view(), name='login'),
     url(r'^logout$', LogoutView.as_view(), name='logout'),
     url(r'^registration$', RegistrationView.as_view(), name='registration'),
@@ -58,4 +95,10 @@ urlpatterns = [
         DiaryEntryAddView.as_view(), name='diary_entry_add'),
     url(r'^training_diary$', TrainingDiaryView.as_view(),
         name='training_diary'),
+    url(r'^training_diary/statistics$', DiaryStatisticsView.as_view(),
+        name='diary_statistics'),
+    url(r'^training_diary/export$', DiaryExportView.as_view(),
+        name='diary_export'),
+    url(r'^training_load$', TrainingLoadView.as_view(),
+        name='training_load'),
 ]